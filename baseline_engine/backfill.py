@@ -0,0 +1,342 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, datetime, timedelta
+from multiprocessing import get_context
+from pathlib import Path
+
+import boto3
+
+import baseline_engine as engine
+from utils.alert_writer import write_alert, flush_alerts
+from utils.baseline import alert_promotion
+from utils.cloudtrail_reader import iter_records, open_records
+from utils.delta import new_delta, add_observation, merge_delta, merge_into_items
+from utils.log import get_logger, log_summary, flush_logs
+
+# Builds baselines from the CloudTrail archive instead of live SQS traffic.
+# Objects are turned into per-file deltas in worker processes, merged in
+# memory, and written once per user with batch_writer. Counts and promotions
+# come out the same as replaying the objects through the baseline engine.
+#
+#   python backfill.py --start 2025-01-01 --end 2025-12-31
+#   python backfill.py --local-dir /data/cloudtrail --checkpoint backfill.ckpt
+#
+# The whole item is rewritten per user, so pause the live baseline engine
+# for the accounts being seeded while the write phase runs.
+
+cfg = engine.cfg
+LOG_PREFIX = cfg["s3"].get("log_prefix", "AWSLogs/")
+BACKFILL_CFG = cfg.get("backfill", {}) or {}
+WORKERS = BACKFILL_CFG.get("workers") or os.cpu_count() or 1
+CHECKPOINT_EVERY = BACKFILL_CFG.get("checkpoint_every_files", 500)
+WRITE_CHUNK = BACKFILL_CFG.get("write_chunk_users", 100)
+PROGRESS_SECONDS = BACKFILL_CFG.get("progress_interval_seconds", 10)
+
+log = get_logger("backfill")
+
+def _common_prefixes(s3, bucket, prefix):
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/"):
+        for cp in page.get("CommonPrefixes", []):
+            yield cp["Prefix"]
+
+def trail_region_prefixes(s3, bucket, prefix, accounts=None, regions=None):
+    # <prefix><account>/CloudTrail/<region>/; organization trails add an
+    # <org-id>/ level in front of the account.
+    found = []
+    frontier = [prefix]
+    for _ in range(3):
+        next_frontier = []
+        for parent in frontier:
+            for child in _common_prefixes(s3, bucket, parent):
+                name = child[len(parent):].rstrip("/")
+                if name != "CloudTrail":
+                    if not name.startswith("CloudTrail"):
+                        next_frontier.append(child)
+                    continue
+                account = parent.rstrip("/").rsplit("/", 1)[-1]
+                if accounts and account not in accounts:
+                    continue
+                for region_prefix in _common_prefixes(s3, bucket, child):
+                    region = region_prefix[len(child):].rstrip("/")
+                    if not regions or region in regions:
+                        found.append(region_prefix)
+        frontier = next_frontier
+    return found
+
+def list_s3_sources(s3, bucket, prefix, start, end, accounts=None, regions=None):
+    region_prefixes = trail_region_prefixes(s3, bucket, prefix, accounts, regions)
+    log.info("Found %d account/region trail prefixes under s3://%s/%s", len(region_prefixes), bucket, prefix)
+    paginator = s3.get_paginator("list_objects_v2")
+    day = start
+    while day <= end:
+        for region_prefix in region_prefixes:
+            for page in paginator.paginate(Bucket=bucket, Prefix=f"{region_prefix}{day:%Y/%m/%d}/"):
+                for obj in page.get("Contents", []):
+                    if obj["Key"].endswith(".json.gz"):
+                        yield ("s3", bucket, obj["Key"])
+        day += timedelta(days=1)
+
+def list_local_sources(directory):
+    for path in sorted(Path(directory).rglob("*.json.gz")):
+        yield ("local", None, str(path))
+
+def source_id(source):
+    kind, bucket, key = source
+    return f"s3://{bucket}/{key}" if kind == "s3" else key
+
+def _init_worker():
+    # boto3 clients are not fork-safe; give each worker its own.
+    engine.s3 = boto3.client("s3", region_name=engine.REGION)
+
+def process_source(source):
+    kind, bucket, key = source
+    stats = {}
+    delta = new_delta()
+    try:
+        if kind == "s3":
+            records = open_records(engine.s3, bucket, key, stats)
+            for record in records:
+                _observe(delta, record)
+        else:
+            with open(key, "rb") as f:
+                for record in iter_records(f, stats):
+                    _observe(delta, record)
+    except Exception as e:
+        return source_id(source), None, stats, str(e)
+    return source_id(source), delta, stats, None
+
+def _event_ts(record):
+    try:
+        return int(datetime.fromisoformat(record["eventTime"].replace("Z", "+00:00")).timestamp())
+    except (KeyError, AttributeError, ValueError):
+        return None
+
+def _observe(delta, record):
+    # Observations carry the event's own time, so candidate first/last_seen
+    # and trusted_seen stamps reflect when the activity happened rather than
+    # when the archive was replayed.
+    username = engine.resolve_actor(record)
+    if username:
+        ts = _event_ts(record)
+        for field_key, value in engine.extract_observations(record, username):
+            add_observation(delta, username, field_key, value, ts)
+
+def _write_json(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+class Checkpoint:
+    # Everything needed to resume: which sources are merged, the merged
+    # delta, and which users are already written. The delta is checkpointed
+    # incrementally: each save() spills only what was merged since the last
+    # one into a new segment file under <path>.d/, then rewrites the small
+    # JSON manifest at <path> that lists the segments. A segment the
+    # manifest does not list yet (crash in between) is ignored on load and
+    # overwritten by the next save.
+    def __init__(self, path):
+        self.path = path
+        self.phase = "processing"
+        self.done = set()
+        self.failed = {}
+        self.delta = new_delta()
+        self.pending = new_delta()
+        self.segments = []
+        self.written = set()
+        self.totals = {"files": 0, "records": 0, "compressed_bytes": 0, "decompressed_bytes": 0}
+
+    def _segment_path(self, name):
+        return os.path.join(f"{self.path}.d", name)
+
+    def add(self, sid, delta):
+        merge_delta(self.delta, delta)
+        merge_delta(self.pending, delta)
+        self.done.add(sid)
+        self.failed.pop(sid, None)
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            state = json.load(f)
+        self.phase = state["phase"]
+        self.done = set(state["done"])
+        self.failed = state.get("failed", {})
+        self.segments = state.get("segments", [])
+        for name in self.segments:
+            with open(self._segment_path(name)) as f:
+                merge_delta(self.delta, json.load(f))
+        self.written = set(state.get("written", []))
+        self.totals.update(state.get("totals", {}))
+        return True
+
+    def save(self):
+        if not self.path:
+            return
+        if self.pending:
+            os.makedirs(f"{self.path}.d", exist_ok=True)
+            name = f"{len(self.segments):06d}.json"
+            _write_json(self._segment_path(name), self.pending)
+            self.segments.append(name)
+            self.pending = new_delta()
+        _write_json(self.path, {
+            "phase": self.phase,
+            "done": sorted(self.done),
+            "failed": self.failed,
+            "segments": self.segments,
+            "written": sorted(self.written),
+            "totals": self.totals
+        })
+
+def _rate(n, elapsed):
+    return round(n / elapsed, 1) if elapsed > 0 else 0.0
+
+def build_delta(sources, checkpoint, workers=WORKERS):
+    started = time.monotonic()
+    last_report = started
+    since_save = 0
+    processed = {"files": 0, "records": 0, "compressed_bytes": 0, "skipped": 0}
+
+    def absorb(future):
+        nonlocal since_save
+        sid, delta, stats, error = future.result()
+        if error:
+            log.error("Failed to read %s: %s", sid, error)
+            checkpoint.failed[sid] = error
+            return
+        checkpoint.add(sid, delta)
+        processed["files"] += 1
+        processed["records"] += stats.get("records", 0)
+        processed["compressed_bytes"] += stats.get("compressed_bytes", 0)
+        for k in ("records", "compressed_bytes", "decompressed_bytes"):
+            checkpoint.totals[k] += stats.get(k, 0)
+        checkpoint.totals["files"] += 1
+        since_save += 1
+        if since_save >= CHECKPOINT_EVERY:
+            checkpoint.save()
+            since_save = 0
+
+    with ProcessPoolExecutor(workers, mp_context=get_context("fork"), initializer=_init_worker) as pool:
+        in_flight = set()
+        for source in sources:
+            if source_id(source) in checkpoint.done:
+                processed["skipped"] += 1
+                continue
+            in_flight.add(pool.submit(process_source, source))
+            # Keep listing only a few files ahead of the workers.
+            if len(in_flight) >= workers * 4:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    absorb(future)
+
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_SECONDS:
+                last_report = now
+                elapsed = now - started
+                log.info(
+                    "Backfill progress: files=%d (%.1f/s), records=%d (%.1f/s), users=%d",
+                    processed["files"], _rate(processed["files"], elapsed),
+                    processed["records"], _rate(processed["records"], elapsed), len(checkpoint.delta)
+                )
+        for future in in_flight:
+            absorb(future)
+
+    checkpoint.save()
+    return processed, time.monotonic() - started
+
+def write_baselines(checkpoint, thresholds, alerts=False):
+    checkpoint.phase = "writing"
+    checkpoint.save()
+
+    delta = checkpoint.delta
+    usernames = sorted(u for u in delta if u not in checkpoint.written)
+    promoted_total = 0
+    for i in range(0, len(usernames), WRITE_CHUNK):
+        chunk = usernames[i:i + WRITE_CHUNK]
+        promotions = merge_into_items(engine.baseline_store, {u: delta[u] for u in chunk}, thresholds, replay=True)
+        for username, promoted in promotions.items():
+            for field_key, values in promoted.items():
+                promoted_total += len(values)
+                if alerts:
+                    for value in values:
+                        alert_promotion(username, field_key, value, write_alert)
+
+        # Only after the store has written the chunk.
+        checkpoint.written.update(chunk)
+        checkpoint.save()
+
+    if alerts and not flush_alerts():
+        log.error("Some promotion alerts could not be written")
+    checkpoint.phase = "complete"
+    checkpoint.save()
+    return promoted_total
+
+def _parse_day(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build baselines from historical CloudTrail logs.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--start", type=_parse_day, help="first day to load (YYYY-MM-DD, UTC)")
+    source.add_argument("--local-dir", help="directory of CloudTrail .json.gz files instead of S3")
+    parser.add_argument("--end", type=_parse_day, help="last day to load, inclusive (default: today)")
+    parser.add_argument("--bucket", default=engine.BUCKET)
+    parser.add_argument("--prefix", default=LOG_PREFIX)
+    parser.add_argument("--account", action="append", help="only these account IDs (repeatable)")
+    parser.add_argument("--region", action="append", help="only these regions (repeatable)")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--checkpoint", help="checkpoint file; resumes from it if present")
+    parser.add_argument("--alerts", action="store_true", help="write Baseline Promotion alerts")
+    parser.add_argument("--dry-run", action="store_true", help="build the delta but do not write baselines")
+    args = parser.parse_args(argv)
+
+    checkpoint = Checkpoint(args.checkpoint)
+    if checkpoint.load():
+        log.info(
+            "Resuming from %s: phase=%s, files=%d, users=%d, written=%d",
+            args.checkpoint, checkpoint.phase, len(checkpoint.done), len(checkpoint.delta), len(checkpoint.written)
+        )
+    if checkpoint.phase == "complete":
+        log.info("Checkpoint %s is already complete; nothing to do", args.checkpoint)
+        return 0
+
+    started = time.monotonic()
+    processed, read_elapsed = {"files": 0, "records": 0, "compressed_bytes": 0, "skipped": 0}, 0.0
+    if checkpoint.phase == "processing":
+        if args.local_dir:
+            sources = list_local_sources(args.local_dir)
+        else:
+            sources = list_s3_sources(
+                engine.s3, args.bucket, args.prefix, args.start, args.end or date.today(),
+                accounts=args.account, regions=args.region
+            )
+        processed, read_elapsed = build_delta(sources, checkpoint, workers=max(1, args.workers))
+
+    promoted = 0
+    write_started = time.monotonic()
+    if not args.dry_run:
+        promoted = write_baselines(checkpoint, engine.PROM_THRESH, alerts=args.alerts)
+    write_elapsed = time.monotonic() - write_started
+
+    log_summary(
+        "backfill",
+        files=processed["files"], skipped_files=processed["skipped"], failed_files=len(checkpoint.failed),
+        records=processed["records"], users=len(checkpoint.delta), promoted=promoted,
+        read_s=round(read_elapsed, 3), write_s=round(write_elapsed, 3),
+        elapsed_s=round(time.monotonic() - started, 3),
+        files_per_s=_rate(processed["files"], read_elapsed),
+        records_per_s=_rate(processed["records"], read_elapsed),
+        mb_per_s=round(processed["compressed_bytes"] / 1e6 / read_elapsed, 2) if read_elapsed else 0.0,
+        dry_run=args.dry_run
+    )
+    return 1 if checkpoint.failed else 0
+
+if __name__ == "__main__":
+    code = main()
+    flush_logs()
+    raise SystemExit(code)
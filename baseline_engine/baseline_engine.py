@@ -1,24 +1,39 @@
 import boto3
-import gzip
 import json
+import logging
 import time
 from datetime import datetime
-import ipaddress  
+from botocore.exceptions import ClientError
 
 from utils.config_loader import load_config
-from utils.suppression import is_suppressed
+from utils.suppression import SUPPRESSED_ACTOR_TYPES
+from utils.observations import extract_observations
 from utils.baseline import (
-    normalize_user,          
     record_candidate,
+    record_candidate_atomic,
+    record_candidate_sharded,
     should_promote_candidate,
     promote_candidate,
+    promote_candidate_atomic,
     alert_promotion,
     is_trusted,
     clear_candidate,
-    _trusted_hours_set
+    UPDATED_ATTR,
+    SEEN_RESOLUTION
 )
-from utils.alert_writer import write_alert
+from utils.delta import new_delta, add_observation, apply_delta
+from utils.trusted_networks import IP_FIELD, CIDR_FIELD, ip_trusted, network_index
+from utils.baseline_store import open_store
+from utils.compaction import BACKGROUND as COMPACTION_BACKGROUND, start_background as start_compaction
+from utils.cloudtrail_reader import open_records, format_stats
+from utils.alert_writer import write_alert, flush_alerts, alert_buffer
 from utils.identity import classify_identity, should_suppress_actor  
+from utils.log import get_logger, log_summary
+from utils.ledger import ledger, DONE, BUSY
+from utils import metrics
+from utils.sqs_consumer import SqsConsumer
+from utils.pipeline import FilePipeline, TaskGroup, DEFERRED, ENABLED as PIPELINE_ENABLED
+from utils.write_behind import WriteBehind, ENABLED as WRITE_BEHIND_ENABLED
 
 cfg = load_config()
 REGION      = cfg["aws"]["region"]
@@ -27,172 +42,475 @@ QUEUE_URL   = cfg["sqs"]["baseline_queue_url"]
 TABLE_NAME  = cfg["dynamodb"]["baseline_table"]
 PROM_THRESH = cfg["dynamodb"]["promotion"]
 
-SUPPRESSED_ACTOR_TYPES = set(
-    cfg.get("baseline", {}).get("suppressed_actor_types", ["service", "anonymous"]))
+AGGREGATE_PER_FILE = cfg.get("baseline", {}).get("aggregate_per_file", True)
+ATOMIC_CANDIDATES  = cfg.get("baseline", {}).get("atomic_candidates", True)
 
 s3    = boto3.client("s3", region_name=REGION)
 sqs   = boto3.client("sqs", region_name=REGION)
 ddb   = boto3.resource("dynamodb", region_name=REGION)
-table = ddb.Table(TABLE_NAME)
+table = metrics.TimedTable(ddb.Table(TABLE_NAME), "baseline_read", "candidate_write")
+# The per-record and delta paths use update expressions on `table` when the
+# store is DynamoDB; other backends take whole-item writes (utils/delta.py).
+baseline_store = open_store(ddb, table)
 
-FIELD_MAP = {
-    "sourceIPAddress": "known_ips",
-    "awsRegion":       "regions",
-    "userAgent":       "user_agents",
-    "eventSource":     "services"
-}
+log = get_logger("baseline")
 
-def _is_valid_ip(value: str) -> bool:
-    try:
-        ipaddress.ip_address(value)
-        return True
-    except Exception:
-        return False
+_identity_timer = metrics.stage_timer("identity")
+# Stages timed on the pipeline's sink thread while it applies a delta.
+SINK_STAGES = ("baseline_read", "candidate_write")
 
-def process_log_file(bucket, key):
-    print(f"[INFO] Processing: {bucket}/{key}", flush=True)
-    try:
-        obj = s3.get_object(Bucket=bucket, Key=key)
-        body = gzip.decompress(obj["Body"].read()).decode("utf-8")
-        log_data = json.loads(body)
-    except Exception as e:
-        print(f"[ERROR] Failed to load log: {e}", flush=True)
-        return
+def resolve_actor(record):
+    identity = record.get("userIdentity", {})
+
+    started = time.perf_counter()
+    username, actor_type = classify_identity(identity)
+    _identity_timer.seconds += time.perf_counter() - started
+    _identity_timer.calls += 1
+    log.debug("Baseline actor resolved: id=%s, type=%s", username, actor_type)
+
+    if should_suppress_actor(actor_type, SUPPRESSED_ACTOR_TYPES):
+        log.debug("Skipping suppressed actor at baseline: %s (%s)", actor_type, username)
+        return None
+
+    if actor_type == "unknown" or not username or username == "unknown":
+        if log.isEnabledFor(logging.DEBUG):
+            try:
+                log.debug("Raw userIdentity for unknown (baseline): %s", json.dumps(identity))
+            except Exception:
+                log.debug("Raw userIdentity for unknown (baseline): <unserializable>")
+        log.info("Unknown actor, skipping baseline")
+        return None
+
+    return username
 
-    for i, record in enumerate(log_data.get("Records", [])):
+# username -> when this process last made sure the actor's item exists and
+# its updated_at is current (see _actor_fresh).
+_known_actors = {}
+
+def _actor_fresh(username):
+    # Per-record writes only happen for candidates, so a principal whose
+    # records are all trusted would never move updated_at and compaction
+    # would take it for inactive. Existing actors are re-touched once per
+    # SEEN_RESOLUTION instead.
+    touched = _known_actors.get(username)
+    return touched is not None and time.monotonic() - touched < SEEN_RESOLUTION
+
+def _new_actor_item(username):
+    return {
+        "username": username,
+        "first_seen": datetime.utcnow().isoformat() + "Z",
+        "updated_at": int(time.time()),
+        "known_ips": [],
+        "user_agents": [],
+        "regions": [],
+        "services": [],
+        "actions": [],
+        "assumed_roles": [],
+        "known_cidrs": [],
+        "candidates": {}
+    }
+
+# username -> network_index() of the actor's known_cidrs, reloaded whenever
+# the actor is re-touched. The conditional candidate writes only check the
+# exact value, so IPs covered by a trusted network are filtered here.
+_actor_networks = {}
+
+def _load_networks(username):
+    if baseline_store.sharded:
+        cidrs = (baseline_store.get(username) or {}).get(CIDR_FIELD)
+    else:
+        cidrs = table.get_item(
+            Key={"username": username},
+            ProjectionExpression="#c",
+            ExpressionAttributeNames={"#c": CIDR_FIELD}
+        ).get("Item", {}).get(CIDR_FIELD)
+    _actor_networks[username] = network_index(cidrs)
+
+def _ip_covered(username, field_key, value):
+    return field_key == IP_FIELD and ip_trusted(value, _actor_networks.get(username))
+
+def _touch_actor(username):
+    table.update_item(
+        Key={"username": username},
+        UpdateExpression="SET #upd = :now",
+        ExpressionAttributeNames={"#upd": UPDATED_ATTR},
+        ExpressionAttributeValues={":now": int(time.time())}
+    )
+
+def _ensure_actor(username):
+    # Both per-record paths stamp updated_at on existing actors, so
+    # compaction never takes a principal that is still active for dead.
+    if _actor_fresh(username):
+        return
+    if ATOMIC_CANDIDATES:
         try:
-            identity = record.get("userIdentity", {})
+            table.put_item(
+                Item=_new_actor_item(username),
+                ConditionExpression="attribute_not_exists(username)"
+            )
+            log.info("New actor detected for baseline: %s", username)
+            _actor_networks[username] = network_index(())
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+            _touch_actor(username)
+            _load_networks(username)
+    else:
+        item = table.get_item(Key={"username": username}).get("Item", {})
+        if not item:
+            log.info("New actor detected for baseline: %s", username)
+            table.put_item(Item=_new_actor_item(username))
+        else:
+            _touch_actor(username)
+    _known_actors[username] = time.monotonic()
+
+def _observe_atomic(username, field_key, value):
+    if _ip_covered(username, field_key, value):
+        return
+    if record_candidate_atomic(username, field_key, value, table, PROM_THRESH):
+        if promote_candidate_atomic(username, field_key, value, table):
+            alert_promotion(username, field_key, value, write_alert)
+
+def _ensure_actor_sharded(username):
+    if _actor_fresh(username):
+        return
+    if baseline_store.ensure_user(username):
+        log.info("New actor detected for baseline: %s", username)
+        _actor_networks[username] = network_index(())
+    else:
+        baseline_store.touch(username)
+        _load_networks(username)
+    _known_actors[username] = time.monotonic()
+
+def _observe_sharded(username, field_key, value):
+    if _ip_covered(username, field_key, value):
+        return
+    if record_candidate_sharded(username, field_key, value, baseline_store, PROM_THRESH):
+        if baseline_store.promote(username, field_key, value):
+            log.info("Promoted value '%s' for user '%s' under field '%s'", value, username, field_key)
+            alert_promotion(username, field_key, value, write_alert)
+
+def _observe_per_record(username, field_key, value):
+    if ATOMIC_CANDIDATES:
+        return _observe_atomic(username, field_key, value)
+
+    item = table.get_item(Key={"username": username}).get("Item", {})
+    if is_trusted(item, field_key, value):
+        return
+
+    record_candidate(username, field_key, value, table, PROM_THRESH)
+
+    item = table.get_item(Key={"username": username}).get("Item", {})
+    if not should_promote_candidate(item, field_key, value, PROM_THRESH):
+        return
+
+    if field_key == "work_hours_utc":
+        table.update_item(
+            Key={"username": username},
+            UpdateExpression="ADD work_hours_utc_ns :h",
+            ExpressionAttributeValues={":h": set([int(value)])}
+        )
+        clear_candidate(username, field_key, value, table)
+    else:
+        promote_candidate(username, field_key, value, table)
+    alert_promotion(username, field_key, value, write_alert)
 
-            username, actor_type = classify_identity(identity)
-            print(f"[DEBUG] Baseline actor resolved: id={username}, type={actor_type}", flush=True)
+def _observe_whole_item(username, field_key, value):
+    delta = new_delta()
+    add_observation(delta, username, field_key, value)
+    apply_delta(delta, baseline_store, PROM_THRESH, write_alert)
 
-            if should_suppress_actor(actor_type, SUPPRESSED_ACTOR_TYPES):
-                print(f"[SKIP] Suppressed actor at baseline: {actor_type} ({username})", flush=True)
+def _process_records_per_record(records):
+    if baseline_store.sharded:
+        ensure, observe = _ensure_actor_sharded, _observe_sharded
+    elif baseline_store.native_updates:
+        ensure, observe = _ensure_actor, _observe_per_record
+    else:
+        ensure, observe = None, _observe_whole_item
+    users = set()
+    for i, record in enumerate(records):
+        try:
+            username = resolve_actor(record)
+            if not username:
                 continue
+            users.add(username)
 
-            if actor_type == "unknown" or not username or username == "unknown":
-                try:
-                    print(f"[DEBUG] Raw userIdentity for unknown (baseline): {json.dumps(identity)}", flush=True)
-                except Exception:
-                    print("[DEBUG] Raw userIdentity for unknown (baseline): <unserializable>", flush=True)
-                print("[INFO] Unknown actor, skipping baseline", flush=True)
+            if ensure:
+                ensure(username)
+            for field_key, value in extract_observations(record, username):
+                observe(username, field_key, value)
+
+        except Exception as e:
+            log.error("Failed to process record %d: %s", i + 1, e)
+
+    return len(users)
+
+def _build_delta(records):
+    # A read/parse error while streaming propagates out of the loop below, so
+    # a truncated file never gets a partial delta applied.
+    delta = new_delta()
+    for i, record in enumerate(records):
+        try:
+            username = resolve_actor(record)
+            if not username:
                 continue
 
-            item = table.get_item(Key={"username": username}).get("Item", {})
-            if not item:
-                now = datetime.utcnow().isoformat() + "Z"
-                print(f"[INFO] New actor detected for baseline: {username}", flush=True)
-                table.put_item(Item={
-                    "username": username,
-                    "first_seen": now,
-                    "known_ips": [],
-                    "user_agents": [],
-                    "regions": [],
-                    "services": [],
-                    "actions": [],
-                    "assumed_roles": [],
-                    "candidates": {}
-                })
-                item = {"username": username, "first_seen": now}
-
-            for raw_key, base_key in FIELD_MAP.items():
-                val = record.get(raw_key)
-                if not val or is_suppressed(username, val):
-                    continue
-
-                item = table.get_item(Key={"username": username}).get("Item", {})
-                if is_trusted(item, base_key, val):
-                    continue
-
-                record_candidate(username, base_key, val, table, PROM_THRESH)
-
-                item = table.get_item(Key={"username": username}).get("Item", {})
-                if should_promote_candidate(item, base_key, val, PROM_THRESH):
-                    promote_candidate(username, base_key, val, table)  
-                    alert_promotion(username, base_key, val, write_alert)
-
-            timestamp = record.get("eventTime")
-            if timestamp:
-                try:
-                    event_hour = datetime.fromisoformat(timestamp.replace("Z", "+00:00")).hour
-                    hour_str = str(event_hour).zfill(2)
-
-                    item = table.get_item(Key={"username": username}).get("Item", {})
-                    if int(hour_str) not in _trusted_hours_set(item):
-                        record_candidate(username, "work_hours_utc", hour_str, table, PROM_THRESH)
-
-                        item = table.get_item(Key={"username": username}).get("Item", {})
-                        if should_promote_candidate(item, "work_hours_utc", hour_str, PROM_THRESH):
-                            table.update_item(
-                                Key={"username": username},
-                                UpdateExpression="ADD work_hours_utc_ns :h",
-                                ExpressionAttributeValues={":h": set([event_hour])}  
-                            )
-                            clear_candidate(username, "work_hours_utc", hour_str, table)
-                            alert_promotion(username, "work_hours_utc", hour_str, write_alert)
-                except Exception as e:
-                    print(f"[WARN] Could not parse eventTime for work-hours: {e}", flush=True)
-
-            if record.get("eventName") == "AssumeRole":
-                role_arn = record.get("requestParameters", {}).get("roleArn")
-                if role_arn:
-                    # Skip if already trusted
-                    item = table.get_item(Key={"username": username}).get("Item", {})
-                    if not is_trusted(item, "assumed_roles", role_arn):
-                        record_candidate(username, "assumed_roles", role_arn, table, PROM_THRESH)
-
-                        item = table.get_item(Key={"username": username}).get("Item", {})
-                        if should_promote_candidate(item, "assumed_roles", role_arn, PROM_THRESH):
-                            promote_candidate(username, "assumed_roles", role_arn, table)
-                            alert_promotion(username, "assumed_roles", role_arn, write_alert)
-
-            service = record.get("eventSource", "unknown").replace(".amazonaws.com", "")
-            action = record.get("eventName", "unknown")
-            service_action = f"{service}:{action}"
-
-            item = table.get_item(Key={"username": username}).get("Item", {})
-            if not is_trusted(item, "actions", service_action):
-                record_candidate(username, "actions", service_action, table, PROM_THRESH)
-
-                item = table.get_item(Key={"username": username}).get("Item", {})
-                if should_promote_candidate(item, "actions", service_action, PROM_THRESH):
-                    promote_candidate(username, "actions", service_action, table)
-                    alert_promotion(username, "actions", service_action, write_alert)
+            for field_key, value in extract_observations(record, username):
+                add_observation(delta, username, field_key, value)
 
         except Exception as e:
-            print(f"[ERROR] Failed to process record {i + 1}: {e}", flush=True)
+            log.error("Failed to process record %d: %s", i + 1, e)
+    return delta
+
+def _apply_file_delta(delta, failed=None):
+    promoted = apply_delta(delta, baseline_store, PROM_THRESH, write_alert, failed)
+    log.info("Applied baseline delta: users=%d, promoted=%d", len(delta), promoted)
+    return len(delta)
+
+def _flush_deltas(delta, failed):
+    # Write-behind flush: the covered files are only settled once the
+    # promotion alerts it raised are written too.
+    since = alert_buffer.added
+    _apply_file_delta(delta, failed)
+    until = alert_buffer.added
+    # Promotion alerts belong to the flush rather than to any one file.
+    metrics.inc("alerts", until - since)
+    with metrics.timed("alert_flush"):
+        return alert_buffer.wait_until(since, until)
+
+# Per-file deltas are held across files and flushed coalesced (aggregate
+# mode only; per-record mode writes as it goes).
+write_behind = WriteBehind(_flush_deltas) if WRITE_BEHIND_ENABLED and AGGREGATE_PER_FILE else None
+# Set by main(); write-behind completes pipeline tasks after their flush.
+pipeline = None
+
+def _defer_delta(bucket, key, etag, delta, stages, records, started, done):
+    # Hands the file's delta to the write-behind layer; the ledger entry,
+    # the file report and done(ok) wait for the flush that writes it.
+    # delta is None when the file could not be read; it is released for
+    # redelivery rather than marked complete.
+    def settle(ok):
+        _settle(bucket, key, etag, ok)
+        _report_file(bucket, key, stages, records, len(delta or ()), 0, time.monotonic() - started, ok)
+        done(ok)
+
+    if delta:
+        write_behind.add(delta, settle)
+    else:
+        settle(delta is not None)
+
+def _process_records_aggregated(records, failed=None):
+    return _apply_file_delta(_build_delta(records), failed)
+
+def _report_file(bucket, key, stages, records, users, alerts, elapsed, ok):
+    metrics.observe_file(stages, records, elapsed, alerts, ok)
+    log_summary(
+        "baseline", bucket=bucket, key=key, records=records, users=users,
+        alerts=alerts, elapsed_s=round(elapsed, 3), ok=ok
+    )
+
+def process_log_file(bucket, key):
+    log.info("Processing: %s/%s", bucket, key)
+    started = time.monotonic()
+    snap = metrics.snapshot()
+    alerts_before = alert_buffer.added
+    stats = {}
+    users = 0
+    read_ok = True
+    failed = set()
+    try:
+        records = open_records(s3, bucket, key, stats)
+        if AGGREGATE_PER_FILE:
+            users = _process_records_aggregated(records, failed)
+        else:
+            users = _process_records_per_record(records)
+        log.debug("Streamed %s/%s: %s", bucket, key, format_stats(stats))
+    except Exception as e:
+        log.error("Failed to load log: %s", e)
+        read_ok = False
+    metrics.add_reader_stats(stats)
+
+    # A file that failed mid-stream, or whose delta could not be written for
+    # some principal, is released, not completed, so the object is
+    # redelivered and read again.
+    with metrics.timed("alert_flush"):
+        ok = flush_alerts() and read_ok and not failed
+    _report_file(
+        bucket, key, metrics.since(snap), stats.get("records", 0), users,
+        alert_buffer.added - alerts_before, time.monotonic() - started, ok
+    )
+    return ok
+
+def _claim(bucket, key, etag):
+    # Objects already in the processed ledger are skipped, so a redelivered
+    # message does not count the same observations twice. True: process it,
+    # False: already done, None: held by another consumer.
+    status = ledger.claim(bucket, key, etag)
+    if status == DONE:
+        log.info("Skipping already processed object: %s/%s", bucket, key)
+        return False
+    if status == BUSY:
+        log.info("Object is being processed elsewhere: %s/%s", bucket, key)
+        return None
+    return True
+
+def _settle(bucket, key, etag, ok):
+    if ok:
+        ledger.complete(bucket, key, etag)
+    else:
+        ledger.release(bucket, key, etag)
+
+def handle_log_file(bucket, key, etag):
+    claimed = _claim(bucket, key, etag)
+    if not claimed:
+        return claimed is False
+    ok = process_log_file(bucket, key)
+    _settle(bucket, key, etag, ok)
+    return ok
+
+def defer_log_file(bucket, key, etag, done):
+    # handle_log_file with write-behind: done(ok) runs once the file's delta
+    # has been flushed.
+    claimed = _claim(bucket, key, etag)
+    if not claimed:
+        done(claimed is False)
+        return
+    log.info("Processing: %s/%s", bucket, key)
+    started = time.monotonic()
+    snap = metrics.snapshot()
+    stats = {}
+    delta = None
+    try:
+        delta = _build_delta(open_records(s3, bucket, key, stats))
+        log.debug("Streamed %s/%s: %s", bucket, key, format_stats(stats))
+    except Exception as e:
+        log.error("Failed to load log: %s", e)
+    metrics.add_reader_stats(stats)
+    _defer_delta(bucket, key, etag, delta, metrics.since(snap), stats.get("records", 0), started, done)
+
+# Pipeline hooks (see utils/pipeline.py). The evaluator only builds the
+# file's delta; the sink thread applies it (or hands it to write-behind), so
+# DynamoDB writes stay in file order while the next file is already being read.
+
+def _fetch_object(bucket, key):
+    return s3.get_object(Bucket=bucket, Key=key)["Body"]
+
+def _claim_task(task):
+    return _claim(task.bucket, task.key, task.etag)
+
+def _evaluate_task(task, batches):
+    snap = metrics.snapshot()
+    alerts_since = alert_buffer.added
+    delta = None
+    users = 0
+    read_ok = True
+    try:
+        log.info("Processing: %s/%s", task.bucket, task.key)
+        records = (record for batch in batches for record in batch)
+        if AGGREGATE_PER_FILE:
+            delta = _build_delta(records)
+        else:
+            users = _process_records_per_record(records)
+        log.debug("Streamed %s/%s: %s", task.bucket, task.key, format_stats(task.stats))
+    except Exception as e:
+        log.error("Failed to load log: %s", e)
+        read_ok = False
+    return {
+        "delta": delta, "users": users, "read_ok": read_ok, "alerts": (alerts_since, alert_buffer.added),
+        "stages": metrics.since(snap, exclude=metrics.READER_STAGES)
+    }
+
+def _finish_task(task, result):
+    if result is None:
+        ledger.release(task.bucket, task.key, task.etag)
+        return False
+    stages = {**result["stages"], **metrics.reader_stages(task.stats)}
+    metrics.add_reader_stats(task.stats)
+    since, until = result["alerts"]
+    users = result["users"]
+    failed = set()
+    if result["delta"] is not None and write_behind:
+        _defer_delta(
+            task.bucket, task.key, task.etag, result["delta"], stages, task.stats.get("records", 0),
+            task.started, lambda ok: pipeline.complete(task, ok)
+        )
+        return DEFERRED
+    if result["delta"] is not None:
+        snap = metrics.snapshot()
+        since = alert_buffer.added
+        users = _apply_file_delta(result["delta"], failed)
+        until = alert_buffer.added
+        stages.update(metrics.since(snap, include=SINK_STAGES))
+
+    with metrics.timed("alert_flush"):
+        ok = alert_buffer.wait_until(since, until) and result["read_ok"] and not failed
+    _settle(task.bucket, task.key, task.etag, ok)
+    _report_file(
+        task.bucket, task.key, stages, task.stats.get("records", 0), users,
+        until - since, time.monotonic() - task.started, ok
+    )
+    return ok
+
+def _settle_message(consumer, msg, ok):
+    if ok:
+        consumer.ack(msg)
+        return
+    log.error("Not all objects completed, leaving message for redelivery")
+    consumer.release(msg)
 
 def main():
-    print("[BOOT] Baseline builder starting ...", flush=True)
-    while True:
-        try:
-            resp = sqs.receive_message(
-                QueueUrl=QUEUE_URL,
-                MaxNumberOfMessages=10,
-                WaitTimeSeconds=20
-            )
-            messages = resp.get("Messages", [])
-            print(f"[DEBUG] Received {len(messages)} messages", flush=True)
+    global pipeline
+    log.info("Baseline builder starting ...")
+    metrics.start_http_server()
+    if COMPACTION_BACKGROUND and baseline_store.native_updates:
+        start_compaction(baseline_store)
+    if write_behind:
+        log.info("Baseline write-behind: up to %d users, %d files or %ss per flush",
+                 write_behind.max_users, write_behind.max_files, write_behind.max_age_seconds)
+    if PIPELINE_ENABLED:
+        pipeline = FilePipeline(_fetch_object, _claim_task, _evaluate_task, _finish_task)
+    # Receiving, visibility extension and batched deletes run in the
+    # background; this loop only processes messages.
+    consumer = SqsConsumer(sqs, QUEUE_URL)
+    try:
+        while True:
+            messages = consumer.get_batch()
+            log.debug("Received %d messages", len(messages))
 
             for msg in messages:
                 try:
+                    metrics.observe_queue_lag(msg)
                     body = json.loads(msg["Body"])
                     msg_data = json.loads(body.get("Message", "{}"))
+                    objects = []
                     for record in msg_data.get("Records", []):
                         bucket = record["s3"]["bucket"]["name"]
                         key    = record["s3"]["object"]["key"]
-                        process_log_file(bucket, key)
+                        etag   = record["s3"]["object"].get("eTag")
+                        objects.append((bucket, key, etag))
 
-                    sqs.delete_message(
-                        QueueUrl=QUEUE_URL,
-                        ReceiptHandle=msg["ReceiptHandle"]
-                    )
-                except Exception as e:
-                    print(f"[ERROR] Message processing failed: {e}", flush=True)
+                    if pipeline:
+                        group = TaskGroup(len(objects), lambda ok, msg=msg: _settle_message(consumer, msg, ok))
+                        for obj in objects:
+                            pipeline.submit(*obj, group.task_done)
+                        continue
 
-        except Exception as e:
-            print(f"[ERROR] SQS polling failed: {e}", flush=True)
-        time.sleep(1)
+                    if write_behind:
+                        # Acknowledged once every object's delta is flushed.
+                        group = TaskGroup(len(objects), lambda ok, msg=msg: _settle_message(consumer, msg, ok))
+                        for obj in objects:
+                            defer_log_file(*obj, group.task_done)
+                        continue
+
+                    results = [handle_log_file(*obj) for obj in objects]
+                    _settle_message(consumer, msg, all(results))
+                except Exception as e:
+                    log.error("Message processing failed: %s", e)
+                    consumer.release(msg)
+    finally:
+        if write_behind:
+            write_behind.flush()
+        consumer.close()
 
 if __name__ == "__main__":
     main()
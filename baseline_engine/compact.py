@@ -0,0 +1,37 @@
+import argparse
+
+import baseline_engine as engine
+from utils.compaction import Compactor, SEGMENTS, READ_UNITS, WRITE_UNITS, PAGE_SIZE
+from utils.log import get_logger, flush_logs
+
+# One-shot compaction of the baseline table per the cleanup: section of
+# config.yaml. Safe to run next to the live engines: reads and writes stay
+# within the given capacity budgets and every write is conditional.
+#
+#   python compact.py --segments 8 --read-units 200 --write-units 100
+#   python compact.py --dry-run
+
+log = get_logger("compaction")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Expire stale candidates, trusted values and inactive principals.")
+    parser.add_argument("--segments", type=int, default=SEGMENTS, help="parallel Scan segments (threads)")
+    parser.add_argument("--read-units", type=float, default=READ_UNITS, help="RCU per second, 0 for unlimited")
+    parser.add_argument("--write-units", type=float, default=WRITE_UNITS, help="WCU per second, 0 for unlimited")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="report what would be removed without writing")
+    args = parser.parse_args(argv)
+
+    if not engine.baseline_store.native_updates:
+        log.error("Compaction runs against the DynamoDB baseline table; backend is not dynamodb")
+        return 2
+    stats = Compactor(
+        engine.baseline_store, segments=args.segments, read_units=args.read_units,
+        write_units=args.write_units, page_size=args.page_size, dry_run=args.dry_run
+    ).run()
+    return 1 if stats["errors"] else 0
+
+if __name__ == "__main__":
+    code = main()
+    flush_logs()
+    raise SystemExit(code)
@@ -0,0 +1,139 @@
+import time
+from types import SimpleNamespace
+
+from utils import compaction
+from utils.compaction import (
+    ACTIVE_ATTR,
+    COMPACTED_ATTR,
+    Compactor,
+    TokenBucket,
+    expired_candidates,
+    last_active,
+    stale_values
+)
+
+DAY = 86400
+
+class FakeClient:
+    # One scan page; records every write the compactor issues.
+    def __init__(self, items):
+        self.items = items
+        self.calls = []
+
+    def scan(self, **kwargs):
+        return {"Items": self.items if kwargs["Segment"] == 0 else []}
+
+    def update_item(self, **kwargs):
+        self.calls.append(("update_item", kwargs))
+        return {}
+
+    def delete_item(self, **kwargs):
+        self.calls.append(("delete_item", kwargs))
+        return {}
+
+def make_compactor(items, **kwargs):
+    client = FakeClient(items)
+    store = SimpleNamespace(
+        native_updates=True, sharded=False, table_name="baselines", version_attr="baseline_version",
+        dynamodb=SimpleNamespace(meta=SimpleNamespace(client=client))
+    )
+    kwargs.setdefault("segments", 1)
+    return Compactor(store, read_units=0, write_units=0, **kwargs), client
+
+def test_last_active_needs_a_write_stamp():
+    assert last_active({"username": "alice", "first_seen": 100}) is None
+    assert last_active({"updated_at": 500}) == 500
+    # updated_at moved by compaction itself: active_at holds the real time.
+    assert last_active({"updated_at": 900, COMPACTED_ATTR: 900, ACTIVE_ATTR: 500}) == 500
+    assert last_active({"updated_at": 900, COMPACTED_ATTR: 800, ACTIVE_ATTR: 500}) == 900
+
+def test_expired_candidates_uses_last_seen():
+    candidates = {
+        "regions": {"eu-west-1": {"last_seen": 99}, "us-east-1": {"last_seen": 100}},
+        "actions": {"s3:GetObject": {"last_seen": 500}}
+    }
+    assert expired_candidates(candidates, 100) == {"regions": ["eu-west-1"]}
+    assert expired_candidates(None, 100) == {}
+
+def test_stale_values_keeps_unstamped():
+    stale, orphans = stale_values(["a", "b", "c"], {"a": 10, "b": 500, "gone": 10}, 100)
+    assert stale == ["a"]
+    assert orphans == ["gone"]
+
+def test_missing_users_kept_by_default():
+    now = int(time.time())
+    compactor, client = make_compactor([{"username": "alice", "updated_at": now - 365 * DAY}])
+    stats = compactor.run()
+    assert client.calls == []
+    assert stats["deleted_users"] == 0
+
+def test_missing_users_deleted_past_cutoff(monkeypatch):
+    monkeypatch.setattr(compaction, "DELETE_MISSING_USERS", True)
+    now = int(time.time())
+    old = now - (compaction.BASELINE_MAX_AGE_DAYS + 1) * DAY
+    items = [
+        {"username": "old", "updated_at": old},
+        {"username": "recent", "updated_at": now - DAY},
+        {"username": "unstamped", "first_seen": old}
+    ]
+    compactor, client = make_compactor(items)
+    stats = compactor.run()
+    assert stats["deleted_users"] == 1
+    [(method, kwargs)] = client.calls
+    assert method == "delete_item" and kwargs["Key"] == {"username": "old"}
+    assert kwargs["ConditionExpression"] == "#upd = :old_upd"
+    assert kwargs["ExpressionAttributeValues"] == {":old_upd": old}
+
+def test_candidate_cutoff():
+    now = int(time.time())
+    stale = now - (compaction.CANDIDATE_MAX_AGE_DAYS + 1) * DAY
+    item = {
+        "username": "alice", "updated_at": now - DAY, "baseline_version": 3,
+        "candidates": {
+            "regions": {"eu-west-1": {"count": 1, "last_seen": stale}},
+            "actions": {"s3:GetObject": {"count": 1, "last_seen": stale}, "s3:PutObject": {"count": 1, "last_seen": now}}
+        }
+    }
+    compactor, client = make_compactor([item])
+    stats = compactor.run()
+    assert stats["expired_candidates"] == 2 and stats["updated"] == 1
+    [(method, kwargs)] = client.calls
+    assert method == "update_item"
+    expr = kwargs["UpdateExpression"]
+    assert "REMOVE candidates.#cf0" in expr
+    assert "candidates.#cf1.#cv1_0" in expr
+    names = kwargs["ExpressionAttributeNames"]
+    assert names["#cf0"] == "regions" and names["#cv1_0"] == "s3:GetObject"
+    assert kwargs["ExpressionAttributeValues"][":act"] == now - DAY
+    assert kwargs["ConditionExpression"] == "#upd = :old_upd AND #ver = :old_ver"
+
+def test_trusted_value_cutoff():
+    now = int(time.time())
+    stale = now - (compaction.BASELINE_MAX_AGE_DAYS + 1) * DAY
+    item = {
+        "username": "alice", "updated_at": now,
+        "regions": ["us-east-1", "eu-west-1", "ap-south-1"],
+        "trusted_seen": {"regions": {"us-east-1": now, "eu-west-1": stale}}
+    }
+    compactor, client = make_compactor([item])
+    stats = compactor.run()
+    assert stats["dropped_values"] == 1
+    [(_, kwargs)] = client.calls
+    assert "REMOVE #seen.#sf" in kwargs["UpdateExpression"]
+    kept = [v for k, v in kwargs["ExpressionAttributeValues"].items() if k.startswith(":lv")]
+    assert kept == [["us-east-1", "ap-south-1"]]
+
+def test_dry_run_counts_without_writing():
+    now = int(time.time())
+    item = {"username": "alice", "updated_at": now, "candidates": {"regions": {"eu-west-1": {"last_seen": 0}}}}
+    compactor, client = make_compactor([item], dry_run=True)
+    stats = compactor.run()
+    assert client.calls == []
+    assert stats["expired_candidates"] == 1 and stats["write_units"] == 1
+
+def test_token_bucket_zero_rate_is_unlimited():
+    bucket = TokenBucket(0)
+    bucket.charge(1000)
+    started = time.monotonic()
+    bucket.wait()
+    assert time.monotonic() - started < 0.1
@@ -0,0 +1,140 @@
+from utils import baseline
+from utils.baseline_store import MemoryStore
+from utils.delta import (
+    MAX_CLAUSES_PER_UPDATE,
+    add_observation,
+    apply_user_delta,
+    merge_delta,
+    merge_into_items,
+    new_delta,
+    resolve_user_delta
+)
+
+THRESHOLDS = {"min_count": 3, "max_age_days": 7}
+NOW = 1_700_000_000
+
+class RecordingTable:
+    def __init__(self):
+        self.updates = []
+        self.puts = []
+
+    def update_item(self, **kwargs):
+        self.updates.append(kwargs)
+
+    def put_item(self, **kwargs):
+        self.puts.append(kwargs["Item"])
+
+class TableStore:
+    sharded = False
+    native_updates = True
+
+    def __init__(self, item):
+        self.item = item
+        self.table = RecordingTable()
+
+    def get(self, username):
+        return self.item
+
+def fields(*observations):
+    delta = new_delta()
+    for field_key, value, ts in observations:
+        add_observation(delta, "alice", field_key, value, ts)
+    return delta["alice"]
+
+def test_add_and_merge_observations():
+    delta = new_delta()
+    add_observation(delta, "alice", "regions", "us-east-1", 200)
+    add_observation(delta, "alice", "regions", "us-east-1", 100)
+    other = new_delta()
+    add_observation(other, "alice", "regions", "us-east-1", 300)
+    add_observation(other, "bob", "regions", "eu-west-1", 50)
+    merge_delta(delta, other)
+    assert delta["alice"]["regions"]["us-east-1"] == {"count": 3, "first_seen": 100, "last_seen": 300}
+    assert delta["bob"]["regions"]["eu-west-1"]["count"] == 1
+    # merge copies: later merges never write through to `other`.
+    merge_delta(delta, other)
+    assert other["bob"]["regions"]["eu-west-1"]["count"] == 1
+
+def test_resolve_promotes_at_min_count(monkeypatch):
+    monkeypatch.setattr(baseline, "_now_ts", lambda: NOW)
+    item = {"regions": ["us-east-1"], "candidates": {"regions": {"eu-west-1": {"count": 2, "first_seen": NOW - 60}}}}
+    obs = fields(
+        ("regions", "us-east-1", NOW), ("regions", "eu-west-1", NOW),
+        ("regions", "ap-south-1", NOW), ("regions", "ap-south-1", NOW)
+    )
+    candidates, promoted = resolve_user_delta(item, obs, THRESHOLDS)
+    assert promoted == {"regions": ["eu-west-1"]}
+    assert candidates["regions"]["ap-south-1"]["count"] == 2
+    assert "us-east-1" not in candidates.get("regions", {})
+
+def test_resolve_does_not_promote_stale_candidates(monkeypatch):
+    monkeypatch.setattr(baseline, "_now_ts", lambda: NOW)
+    old = NOW - 8 * 86400
+    item = {"candidates": {"actions": {"iam:PassRole": {"count": 5, "first_seen": old, "first_seen_hr": "old"}}}}
+    candidates, promoted = resolve_user_delta(item, fields(("actions", "iam:PassRole", NOW)), THRESHOLDS)
+    assert promoted == {}
+    cand = candidates["actions"]["iam:PassRole"]
+    assert (cand["count"], cand["first_seen"], cand["first_seen_hr"], cand["last_seen"]) == (6, old, "old", NOW)
+
+def test_resolve_replay_promotes_on_count_alone(monkeypatch):
+    monkeypatch.setattr(baseline, "_now_ts", lambda: NOW)
+    year_ago = NOW - 365 * 86400
+    obs = fields(*[("user_agents", "aws-cli/2", year_ago + i * 86400) for i in range(3)])
+    assert resolve_user_delta({}, obs, THRESHOLDS)[1] == {}
+    assert resolve_user_delta({}, obs, THRESHOLDS, replay=True)[1] == {"user_agents": ["aws-cli/2"]}
+
+def test_resolve_skips_ips_inside_known_cidrs():
+    item = {"known_cidrs": ["10.0.0.0/24"]}
+    obs = fields(("known_ips", "10.0.0.7", NOW), ("known_ips", "10.0.1.7", NOW))
+    candidates, promoted = resolve_user_delta(item, obs, THRESHOLDS)
+    assert list(candidates["known_ips"]) == ["10.0.1.7"]
+    assert promoted == {}
+
+def test_apply_new_user_is_one_put():
+    store = TableStore({})
+    apply_user_delta("alice", fields(("regions", "us-east-1", NOW)), store, THRESHOLDS, lambda **kw: None)
+    assert store.table.updates == []
+    [item] = store.table.puts
+    assert item["username"] == "alice"
+    assert item["candidates"]["regions"]["us-east-1"]["count"] == 1
+
+def test_apply_chunks_large_updates():
+    store = TableStore({"username": "alice", "candidates": {"actions": {}}})
+    n = 2 * MAX_CLAUSES_PER_UPDATE + 7
+    obs = fields(*[("actions", f"svc:Action{i}", NOW) for i in range(n)])
+    apply_user_delta("alice", obs, store, THRESHOLDS, lambda **kw: None)
+    updates = store.table.updates
+    assert len(updates) == 3
+    written = set()
+    for update in updates:
+        expr = update["UpdateExpression"]
+        assert "ADD #ver :one" in expr and "#upd = :now" in expr
+        written.update(v for k, v in update["ExpressionAttributeNames"].items() if k.startswith("#cv"))
+    assert written == {f"svc:Action{i}" for i in range(n)}
+
+def test_apply_promotion_alerts_and_removes_candidate():
+    now = baseline._now_ts()
+    item = {"username": "alice", "regions": [], "candidates": {"regions": {"eu-west-1": {"count": 2, "first_seen": now}}}}
+    store = TableStore(item)
+    alerts = []
+    promoted = apply_user_delta(
+        "alice", fields(("regions", "eu-west-1", now)), store, THRESHOLDS,
+        lambda **kw: alerts.append(kw["details"]["value"])
+    )
+    assert promoted == 1 and alerts == ["eu-west-1"]
+    [update] = store.table.updates
+    assert "REMOVE candidates." in update["UpdateExpression"]
+    assert "list_append" in update["UpdateExpression"]
+
+def test_merge_into_items_with_whole_item_store():
+    store = MemoryStore([{"username": "alice", "regions": ["us-east-1"], "candidates": {}, "baseline_version": 4}])
+    delta = new_delta()
+    for _ in range(3):
+        add_observation(delta, "alice", "regions", "eu-west-1")
+        add_observation(delta, "bob", "regions", "eu-west-1")
+    promotions = merge_into_items(store, delta, THRESHOLDS)
+    assert promotions == {"alice": {"regions": ["eu-west-1"]}, "bob": {"regions": ["eu-west-1"]}}
+    alice = store.get("alice")
+    assert alice["regions"] == ["us-east-1", "eu-west-1"]
+    assert alice["baseline_version"] == 5
+    assert store.get("bob")["regions"] == ["eu-west-1"]
@@ -0,0 +1,122 @@
+import threading
+
+from botocore.exceptions import ClientError
+
+from utils import ledger as ledger_module
+from utils.ledger import ProcessedLedger, CLAIMED, DONE, BUSY
+
+def _conditional_failure(item=None):
+    response = {"Error": {"Code": "ConditionalCheckFailedException", "Message": "failed"}}
+    if item is not None:
+        response["Item"] = {k: {"S": v} if isinstance(v, str) else {"N": str(v)} for k, v in item.items()}
+    return ClientError(response, "PutItem")
+
+class FakeTable:
+    # Just the two condition expressions ProcessedLedger issues.
+    def __init__(self):
+        self.items = {}
+        self.puts = 0
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeValues=None, **kwargs):
+        self.puts += 1
+        old = self.items.get(Item["object_id"])
+        if ConditionExpression and old is not None:
+            values = ExpressionAttributeValues
+            expired = old["status"] == values[":in_progress"] and old["lease_expires"] < values[":now"]
+            if not expired:
+                raise _conditional_failure(old)
+        self.items[Item["object_id"]] = dict(Item)
+
+    def get_item(self, Key, **kwargs):
+        item = self.items.get(Key["object_id"])
+        return {"Item": dict(item)} if item else {}
+
+    def delete_item(self, Key, ExpressionAttributeValues, **kwargs):
+        old = self.items.get(Key["object_id"])
+        if old is None or old["owner"] != ExpressionAttributeValues[":owner"] or old["status"] != ExpressionAttributeValues[":in_progress"]:
+            raise _conditional_failure()
+        del self.items[Key["object_id"]]
+
+def make_ledger(table=None, **kwargs):
+    return ProcessedLedger(table or FakeTable(), consumer="test", **kwargs)
+
+def test_claim_complete_then_duplicate():
+    ledger = make_ledger()
+    assert ledger.claim("b", "k", "e1") == CLAIMED
+    ledger.complete("b", "k", "e1")
+    assert ledger.claim("b", "k", "e1") == DONE
+    assert ledger.stats == {"claimed": 1, "duplicates": 1, "busy": 0, "cache_hits": 1}
+
+def test_new_etag_is_a_new_object():
+    ledger = make_ledger()
+    ledger.claim("b", "k", "e1")
+    ledger.complete("b", "k", "e1")
+    assert ledger.claim("b", "k", "e2") == CLAIMED
+
+def test_other_consumer_sees_busy_then_done():
+    table = FakeTable()
+    first, second = make_ledger(table), make_ledger(table)
+    assert first.claim("b", "k", "e") == CLAIMED
+    assert second.claim("b", "k", "e") == BUSY
+    first.complete("b", "k", "e")
+    assert second.claim("b", "k", "e") == DONE
+    # Remembered locally: no further table call.
+    puts = table.puts
+    assert second.claim("b", "k", "e") == DONE
+    assert table.puts == puts
+
+def test_release_lets_the_object_be_reclaimed():
+    table = FakeTable()
+    first, second = make_ledger(table), make_ledger(table)
+    first.claim("b", "k", "e")
+    first.release("b", "k", "e")
+    assert second.claim("b", "k", "e") == CLAIMED
+    # Releasing someone else's claim is a no-op.
+    first.release("b", "k", "e")
+    assert make_ledger(table).claim("b", "k", "e") == BUSY
+
+def test_expired_lease_is_taken_over(monkeypatch):
+    table = FakeTable()
+    now = [1_000_000]
+    monkeypatch.setattr(ledger_module.time, "time", lambda: now[0])
+    first, second = make_ledger(table, lease_seconds=60), make_ledger(table, lease_seconds=60)
+    assert first.claim("b", "k", "e") == CLAIMED
+    now[0] += 30
+    assert second.claim("b", "k", "e") == BUSY
+    now[0] += 31
+    assert second.claim("b", "k", "e") == CLAIMED
+
+def test_done_cache_is_bounded_lru():
+    table = FakeTable()
+    ledger = make_ledger(table, cache_size=2)
+    for key in ("a", "b", "c"):
+        ledger.claim("b", key, "e")
+        ledger.complete("b", key, "e")
+    assert list(ledger._done) == [ledger.object_id("b", k, "e") for k in ("b", "c")]
+    # Evicted locally, still done in the table.
+    assert ledger.claim("b", "a", "e") == DONE
+    assert ledger.stats["cache_hits"] == 0
+
+def test_concurrent_claims_and_completes():
+    ledger = make_ledger(cache_size=50)
+    errors = []
+
+    def worker(n):
+        try:
+            for i in range(200):
+                key = f"{n}-{i}"
+                if ledger.claim("b", key, "e") == CLAIMED:
+                    ledger.complete("b", key, "e")
+                ledger.claim("b", key, "e")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert len(ledger._done) == 50
+    assert ledger.stats["claimed"] == 800
+    assert ledger.stats["duplicates"] == 800
@@ -0,0 +1,88 @@
+import ipaddress
+
+import pytest
+
+from utils import trusted_networks
+from utils.cidr_trie import CidrTrie
+from utils.delta import fold_networks
+from utils.trusted_networks import aggregate, ip_trusted, network_index
+
+@pytest.fixture
+def folding(monkeypatch):
+    monkeypatch.setattr(trusted_networks, "AGGREGATE", True)
+    monkeypatch.setattr(trusted_networks, "IPV4_PREFIX", 28)
+    monkeypatch.setattr(trusted_networks, "IPV6_PREFIX", 64)
+    monkeypatch.setattr(trusted_networks, "MIN_ADDRESSES", 3)
+
+def test_trie_lookup_returns_shortest_covering_prefix():
+    trie = CidrTrie()
+    trie.add("10.0.0.0/8", "wide")
+    trie.add("10.1.0.0/16", "narrow")
+    network, value = trie.lookup("10.1.2.3")
+    assert (network, value) == (ipaddress.ip_network("10.0.0.0/8"), "wide")
+    assert trie.lookup("11.0.0.1") is None
+
+def test_trie_host_routes_and_versions():
+    trie = CidrTrie(["192.0.2.7/32", "2001:db8::/48"])
+    assert "192.0.2.7" in trie
+    assert "192.0.2.8" not in trie
+    assert "2001:db8:0:1::1" in trie
+    assert "2001:db9::1" not in trie
+    assert ipaddress.ip_address("192.0.2.7") in trie
+
+def test_trie_ignores_non_addresses():
+    trie = CidrTrie(["0.0.0.0/0"])
+    assert "1.2.3.4" in trie
+    assert "ec2.amazonaws.com" not in trie
+    assert None not in trie
+
+def test_trie_size_and_networks():
+    trie = CidrTrie(["10.0.0.0/24", "10.0.0.0/24", "10.0.1.0/24", "::1/128"])
+    assert len(trie) == 3
+    assert sorted(map(str, trie.networks())) == ["10.0.0.0/24", "10.0.1.0/24", "::1/128"]
+    # Non-strict: host bits are dropped.
+    assert str(trie.add("10.0.2.9/24")) == "10.0.2.0/24"
+
+def test_network_index_skips_invalid_cidrs():
+    index = network_index(["10.0.0.0/24", "not-a-cidr", None])
+    assert len(index) == 1
+
+def test_ip_trusted_uses_principal_index():
+    index = network_index(["10.0.0.0/24"])
+    assert ip_trusted("10.0.0.5", index)
+    assert not ip_trusted("10.0.1.5", index)
+    assert not ip_trusted("10.0.0.5", None)
+    assert not ip_trusted("s3.amazonaws.com", index)
+
+def test_aggregate_disabled(monkeypatch):
+    monkeypatch.setattr(trusted_networks, "AGGREGATE", False)
+    assert aggregate(["10.0.0.1", "10.0.0.2", "10.0.0.3"]) == ([], [])
+
+def test_aggregate_needs_min_addresses_per_prefix(folding):
+    cidrs, covered = aggregate(["10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.17", "10.0.0.18", "dns.example"])
+    assert cidrs == ["10.0.0.0/28"]
+    assert sorted(covered) == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+
+def test_aggregate_ipv6(folding):
+    cidrs, _ = aggregate(["2001:db8::1", "2001:db8::2", "2001:db8::3"])
+    assert cidrs == ["2001:db8::/64"]
+
+def test_fold_networks_promotes_prefix_and_drops_covered(folding):
+    item = {"known_ips": ["10.0.0.1", "10.0.0.2"], "candidates": {"known_ips": {"10.0.0.9": {"count": 1}}}}
+    candidates = {"known_ips": {"10.0.0.10": {"count": 1}, "192.0.2.1": {"count": 1}}}
+    promoted = {"known_ips": ["10.0.0.3"]}
+    candidates, promoted, removed = fold_networks(item, candidates, promoted)
+    assert promoted == {"known_ips": ["10.0.0.3"], "known_cidrs": ["10.0.0.0/28"]}
+    assert removed == {"known_ips": {"10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.9", "10.0.0.10"}}
+    assert candidates == {"known_ips": {"192.0.2.1": {"count": 1}}}
+
+def test_fold_networks_below_threshold_is_unchanged(folding):
+    item = {"known_ips": ["10.0.0.1"]}
+    promoted = {"known_ips": ["10.0.0.2"]}
+    assert fold_networks(item, {}, promoted) == ({}, promoted, {})
+
+def test_fold_networks_existing_prefix_is_not_promoted_again(folding):
+    item = {"known_ips": ["10.0.0.1", "10.0.0.2"], "known_cidrs": ["10.0.0.0/28"]}
+    _, promoted, removed = fold_networks(item, {}, {"known_ips": ["10.0.0.3"]})
+    assert "known_cidrs" not in promoted
+    assert removed == {"known_ips": {"10.0.0.1", "10.0.0.2", "10.0.0.3"}}
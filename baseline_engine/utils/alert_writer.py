@@ -1,17 +1,219 @@
 import boto3
+import collections
+import gzip
 import json
+import os
+import queue
+import sys
+import threading
+import time
 import uuid
 from datetime import datetime
 from utils.config_loader import load_config
+from utils.log import get_logger
+from utils import metrics
 
+# Load settings from config.yaml
 cfg = load_config()
 REGION = cfg["aws"]["region"]
 ALERT_BUCKET = cfg["s3"]["alert_bucket"]
+ALERT_PREFIX = cfg["s3"].get("alert_prefix", "alerts").rstrip("/")
 
-s3 = boto3.client("s3", region_name=REGION)
+ALERT_CFG = cfg.get("alerts", {}) or {}
+SINK_TYPE = ALERT_CFG.get("sink", "s3")
+BATCH_MAX_ALERTS = ALERT_CFG.get("batch_max_alerts", 500)
+BATCH_MAX_BYTES = ALERT_CFG.get("batch_max_bytes", 1024 * 1024)
+FLUSH_INTERVAL = ALERT_CFG.get("flush_interval_seconds", 5)
+WRITE_RETRIES = ALERT_CFG.get("write_retries", 3)
 
-def write_alert(alert_type, metadata, details):
-    alert = {
+AGGREGATION_CFG = ALERT_CFG.get("aggregation", {}) or {}
+AGGREGATE = AGGREGATION_CFG.get("enabled", False)
+AGGREGATE_WINDOW = AGGREGATION_CFG.get("window_seconds", 3600)
+AGGREGATE_SAMPLES = AGGREGATION_CFG.get("max_samples", 10)
+AGGREGATE_VALUES = AGGREGATION_CFG.get("max_values", 50)
+# alert_type -> detail fields that keep alerts apart besides the user; types
+# not listed only merge exact repeats (every field but the volatile ones).
+AGGREGATE_KEYS = AGGREGATION_CFG.get("keys", {}) or {}
+VOLATILE_FIELDS = ("timestamp", "event")
+SEVERITY_RANK = {"info": 0, "low": 1, "medium": 2, "high": 3, "critical": 4}
+
+log = get_logger("alerts")
+
+class S3BatchSink:
+    def __init__(self, bucket, prefix, region):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.region = region
+        self._client = None
+        self._pid = None
+
+    def _s3(self):
+        if self._client is None or self._pid != os.getpid():
+            self._client = boto3.client("s3", region_name=self.region)
+            self._pid = os.getpid()
+        return self._client
+
+    def write_batch(self, alerts):
+        today = datetime.utcnow().strftime("%Y-%m-%d")
+        file_key = f"{self.prefix}/{today}/{uuid.uuid4()}.ndjson.gz"
+        body = "".join(json.dumps(a, default=str) + "\n" for a in alerts)
+        self._s3().put_object(
+            Bucket=self.bucket,
+            Key=file_key,
+            Body=gzip.compress(body.encode("utf-8")),
+            ContentType="application/x-ndjson",
+            ContentEncoding="gzip"
+        )
+        return f"s3://{self.bucket}/{file_key}"
+
+class LocalFileSink:
+    def __init__(self, path):
+        self.path = path
+
+    def write_batch(self, alerts):
+        with open(self.path, "a") as f:
+            for a in alerts:
+                f.write(json.dumps(a, default=str) + "\n")
+        return self.path
+
+class StdoutSink:
+    def write_batch(self, alerts):
+        for a in alerts:
+            sys.stdout.write(json.dumps(a, default=str) + "\n")
+        sys.stdout.flush()
+        return "stdout"
+
+def make_sink(sink_type=SINK_TYPE):
+    if sink_type == "s3":
+        return S3BatchSink(ALERT_BUCKET, ALERT_PREFIX, REGION)
+    if sink_type == "file":
+        return LocalFileSink(ALERT_CFG.get("local_path", "alerts.ndjson"))
+    if sink_type == "stdout":
+        return StdoutSink()
+    raise ValueError(f"Unknown alert sink: {sink_type}")
+
+class AlertBuffer:
+    # Alerts are gathered in memory and written as one batch per flush. A
+    # background thread does the writes; flush() blocks until everything
+    # buffered so far is written and reports whether any batch failed since
+    # the previous flush, so callers only acknowledge SQS messages once their
+    # alerts are durable (at-least-once). Every alert also gets a sequence
+    # number (the value of `added` after it), so wait_until() can report on
+    # just one file's alerts while other files keep adding.
+    def __init__(self, sink, max_alerts=BATCH_MAX_ALERTS, max_bytes=BATCH_MAX_BYTES,
+                 flush_interval=FLUSH_INTERVAL, retries=WRITE_RETRIES):
+        self.sink = sink
+        self.max_alerts = max_alerts
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self._pid = None
+
+        self.added = 0
+        self.written = 0
+        self.batches = 0
+        self.failed_batches = 0
+
+    def _ensure_started(self):
+        # Threads do not survive fork(), so (re)start them per process.
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self._alerts = []
+        self._bytes = 0
+        self._pending = 0
+        self._failed = False
+        self._queued_seq = self.added
+        self._written_seq = self.added
+        self._failed_ranges = collections.deque(maxlen=1000)
+        self._batches = queue.Queue()
+        threading.Thread(target=self._writer, name="alert-writer", daemon=True).start()
+        if self.flush_interval:
+            threading.Thread(target=self._ticker, name="alert-flush-timer", daemon=True).start()
+
+    def add(self, alert):
+        self._ensure_started()
+        size = len(json.dumps(alert, default=str))
+        with self._cond:
+            self._alerts.append(alert)
+            self.added += 1
+            self._bytes += size
+            if len(self._alerts) >= self.max_alerts or self._bytes >= self.max_bytes:
+                self._enqueue_locked()
+
+    def _enqueue_locked(self):
+        if not self._alerts:
+            return
+        self._batches.put((self._alerts, self._queued_seq + 1, self.added))
+        self._queued_seq = self.added
+        self._pending += 1
+        self._alerts = []
+        self._bytes = 0
+
+    def _ticker(self):
+        while True:
+            time.sleep(self.flush_interval)
+            with self._cond:
+                self._enqueue_locked()
+
+    def _writer(self):
+        while True:
+            batch, first_seq, last_seq = self._batches.get()
+            ok = False
+            for attempt in range(self.retries):
+                try:
+                    with metrics.timed("alert_write"):
+                        location = self.sink.write_batch(batch)
+                    log.info("Wrote %d alerts to %s", len(batch), location)
+                    ok = True
+                    break
+                except Exception as e:
+                    log.error("Failed to write alert batch (attempt %d): %s", attempt + 1, e)
+                    time.sleep(min(2 ** attempt, 5))
+            with self._cond:
+                self._pending -= 1
+                self.batches += 1
+                self._written_seq = last_seq
+                if ok:
+                    self.written += len(batch)
+                else:
+                    self.failed_batches += 1
+                    self._failed = True
+                    self._failed_ranges.append((first_seq, last_seq))
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        self._ensure_started()
+        with self._cond:
+            self._enqueue_locked()
+            if not self._cond.wait_for(lambda: self._pending == 0, timeout=timeout):
+                return False
+            ok = not self._failed
+            self._failed = False
+            return ok
+
+    def wait_until(self, since, until, timeout=None):
+        # Waits for the alerts numbered since+1..until and reports whether
+        # all of them were written. Batches are written in order, so
+        # everything up to _written_seq has been attempted.
+        if until <= since:
+            return True
+        self._ensure_started()
+        with self._cond:
+            if self._queued_seq < until:
+                self._enqueue_locked()
+            if not self._cond.wait_for(lambda: self._written_seq >= until, timeout=timeout):
+                return False
+            return not any(first <= until and last > since for first, last in self._failed_ranges)
+
+    def stats(self):
+        return {"added": self.added, "written": self.written, "batches": self.batches, "failed_batches": self.failed_batches}
+
+alert_buffer = AlertBuffer(make_sink())
+
+def make_alert(alert_type, metadata, details):
+    return {
         "alert_type": alert_type,
         "severity": metadata.get("severity", "medium"),
         "category": metadata.get("category", "general"),
@@ -20,17 +222,128 @@ def write_alert(alert_type, metadata, details):
         **details
     }
 
-    today = datetime.utcnow().strftime("%Y-%m-%d")
-    file_key = f"alerts/{today}/{uuid.uuid4()}.json"
+def write_alert(alert_type, metadata, details):
+    alert_buffer.add(make_alert(alert_type, metadata, details))
+
+def _hashable(value):
+    if isinstance(value, (list, tuple, dict, set)):
+        return json.dumps(value, sort_keys=True, default=str)
+    return value
 
+def _event_epoch(timestamp):
     try:
-        s3.put_object(
-            Bucket=ALERT_BUCKET,
-            Key=file_key,
-            Body=json.dumps(alert),
-            ContentType="application/json"
-        )
-        print(f"[S3] Alert written to s3://{ALERT_BUCKET}/{file_key}")
-    except Exception as e:
-        print(f"[ERROR] Failed to write alert to S3: {e}")
+        return datetime.fromisoformat(str(timestamp).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+class _AlertGroup:
+    __slots__ = ("alert", "skip", "count", "first", "last", "first_ts", "last_ts", "events", "values")
+
+    def __init__(self, alert, skip, ts):
+        self.alert = alert
+        self.skip = skip
+        self.count = 1
+        self.first = self.last = alert.get("timestamp")
+        self.first_ts = self.last_ts = ts
+        self.events = {}
+        self.values = {}
+        self._event(alert)
+
+    def _event(self, alert):
+        event = alert.get("event") or alert.get("action")
+        if event is not None and len(self.events) < AGGREGATE_SAMPLES:
+            self.events[event] = None
+
+    def outside(self, ts, window):
+        if not window or ts is None or self.first_ts is None:
+            return False
+        return max(self.last_ts, ts) - min(self.first_ts, ts) > window
+
+    def add(self, alert, ts):
+        self.count += 1
+        if ts is not None and self.first_ts is not None:
+            if ts < self.first_ts:
+                self.first, self.first_ts = alert.get("timestamp"), ts
+            elif ts > self.last_ts:
+                self.last, self.last_ts = alert.get("timestamp"), ts
+        self._event(alert)
+        base = self.alert
+        if SEVERITY_RANK.get(alert.get("severity"), 0) > SEVERITY_RANK.get(base.get("severity"), 0):
+            base["severity"] = alert["severity"]
+        for field, value in alert.items():
+            if field in self.skip:
+                continue
+            hv = _hashable(value)
+            seen = self.values.get(field)
+            if seen is None:
+                first = _hashable(base.get(field))
+                if hv == first:
+                    continue
+                seen = self.values[field] = {first: base.get(field)}
+            if hv not in seen:
+                seen[hv] = value
+
+    def merged(self):
+        alert = dict(self.alert)
+        alert.update(count=self.count, first_seen=self.first, last_seen=self.last, sample_events=list(self.events))
+        if self.values:
+            alert["distinct_values"] = {f: list(v.values())[:AGGREGATE_VALUES] for f, v in self.values.items()}
+            alert["distinct_counts"] = {f: len(v) for f, v in self.values.items()}
+        return alert
+
+class AlertAggregator:
+    # Sits between the rules and the buffer for one file (or worker part):
+    # alerts with the same user, alert_type and key fields whose event times
+    # fall within window_seconds of each other become one alert with a
+    # count, first/last timestamps, sample event names and the distinct
+    # values of fields that varied. write_alert() has the module function's
+    # signature, so it can be handed to the rules as is; alerts are held
+    # until flush(), which callers run before waiting on the buffer.
+    def __init__(self, buffer=None, enabled=AGGREGATE, window=AGGREGATE_WINDOW, keys=AGGREGATE_KEYS):
+        self.buffer = buffer or alert_buffer
+        self.enabled = enabled
+        self.window = window
+        self.keys = keys
+        self.groups = {}
+        self.received = 0
+        self.emitted = 0
+
+    def _key(self, alert):
+        fields = self.keys.get(alert["alert_type"])
+        if fields is None:
+            fields = sorted(f for f in alert if f not in VOLATILE_FIELDS and f != "severity")
+        key = (alert["alert_type"], alert.get("user")) + tuple(_hashable(alert.get(f)) for f in fields)
+        return key, set(fields) | {"timestamp", "event", "severity", "user", "alert_type"}
+
+    def write_alert(self, alert_type, metadata, details):
+        alert = make_alert(alert_type, metadata, details)
+        self.received += 1
+        if not self.enabled:
+            self._emit(alert)
+            return
+        key, skip = self._key(alert)
+        ts = _event_epoch(alert.get("timestamp"))
+        group = self.groups.get(key)
+        if group is not None and group.outside(ts, self.window):
+            self._emit(group.merged())
+            group = None
+        if group is None:
+            self.groups[key] = _AlertGroup(alert, skip, ts)
+        else:
+            group.add(alert, ts)
+
+    def _emit(self, alert):
+        self.buffer.add(alert)
+        self.emitted += 1
+
+    def flush(self):
+        for group in self.groups.values():
+            self._emit(group.merged())
+        self.groups = {}
+        if self.received > self.emitted:
+            metrics.inc("alerts_merged", self.received - self.emitted)
+        merged, self.received, self.emitted = self.received - self.emitted, 0, 0
+        return merged
 
+def flush_alerts(timeout=None):
+    return alert_buffer.flush(timeout)
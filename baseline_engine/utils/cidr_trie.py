@@ -0,0 +1,73 @@
+import ipaddress
+
+_VALUE = 2
+
+def _parse_address(address):
+    try:
+        return ipaddress.ip_address(address)
+    except (ValueError, TypeError):
+        return None
+
+class CidrTrie:
+    # Binary (radix-2) trie over address bits, one root per IP version.
+    # Lookups walk at most 32/128 nodes regardless of how many prefixes are
+    # stored. Nodes are [child0, child1, (network, value) or None].
+    __slots__ = ("_roots", "_size")
+
+    def __init__(self, networks=None):
+        self._roots = {4: [None, None, None], 6: [None, None, None]}
+        self._size = 0
+        for network in networks or ():
+            self.add(network)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, network, value=True):
+        net = ipaddress.ip_network(network, strict=False)
+        node = self._roots[net.version]
+        bits = int(net.network_address)
+        width = net.max_prefixlen
+        for i in range(net.prefixlen):
+            b = (bits >> (width - 1 - i)) & 1
+            child = node[b]
+            if child is None:
+                child = node[b] = [None, None, None]
+            node = child
+        if node[_VALUE] is None:
+            self._size += 1
+        node[_VALUE] = (net, value)
+        return net
+
+    def lookup(self, address):
+        # Returns (network, value) for the shortest stored prefix covering
+        # address, or None.
+        ip = address if isinstance(address, (ipaddress.IPv4Address, ipaddress.IPv6Address)) else _parse_address(address)
+        if ip is None:
+            return None
+        node = self._roots[ip.version]
+        bits = int(ip)
+        width = ip.max_prefixlen
+        for i in range(width + 1):
+            if node[_VALUE] is not None:
+                return node[_VALUE]
+            if i == width:
+                break
+            node = node[(bits >> (width - 1 - i)) & 1]
+            if node is None:
+                return None
+        return None
+
+    def __contains__(self, address):
+        return self.lookup(address) is not None
+
+    def networks(self):
+        for version in (4, 6):
+            stack = [self._roots[version]]
+            while stack:
+                node = stack.pop()
+                if node[_VALUE] is not None:
+                    yield node[_VALUE][0]
+                for child in (node[1], node[0]):
+                    if child is not None:
+                        stack.append(child)
@@ -0,0 +1,145 @@
+import codecs
+import gzip
+import json
+import resource
+import time
+
+READ_CHUNK = 64 * 1024
+
+_WS = " \t\n\r"
+_decoder = json.JSONDecoder()
+_perf_counter = time.perf_counter
+
+class _CountingReader:
+    def __init__(self, raw, stats):
+        self.raw = raw
+        self.stats = stats
+
+    def read(self, size=-1):
+        started = time.perf_counter()
+        data = self.raw.read(size)
+        self.stats["fetch_s"] += time.perf_counter() - started
+        self.stats["compressed_bytes"] += len(data)
+        return data
+
+class _Scanner:
+    # Incremental tokenizer over a text buffer that only ever holds the
+    # unconsumed tail of the stream plus the next chunk.
+    def __init__(self, stream, stats, chunk_size):
+        self.stream = stream
+        self.stats = stats
+        self.chunk_size = chunk_size
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        # Kept on the scanner per record and copied into stats per chunk.
+        self.parse_s = 0.0
+
+    def fill(self):
+        if self.eof:
+            return False
+        self.stats["parse_s"] = self.parse_s
+        fetched = self.stats["fetch_s"]
+        started = time.perf_counter()
+        data = self.stream.read(max(self.chunk_size, len(self.buf) - self.pos))
+        # Body reads happen inside the gzip read; count them as fetch only.
+        self.stats["inflate_s"] += time.perf_counter() - started - (self.stats["fetch_s"] - fetched)
+        if data:
+            self.stats["decompressed_bytes"] += len(data)
+            tail = self.text.decode(data)
+        else:
+            self.eof = True
+            tail = self.text.decode(b"", final=True)
+        self.buf = self.buf[self.pos:] + tail
+        self.pos = 0
+        self.stats["peak_buffer_bytes"] = max(self.stats["peak_buffer_bytes"], len(self.buf))
+        return bool(data) or bool(tail)
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars):
+        ch = self.peek()
+        if not ch or ch not in chars:
+            raise ValueError(f"Malformed CloudTrail JSON: expected {chars!r}, got {ch or 'EOF'!r}")
+        self.pos += 1
+        return ch
+
+    def value(self):
+        self.peek()
+        while True:
+            started = _perf_counter()
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                self.parse_s += _perf_counter() - started
+                if not self.fill():
+                    raise
+                continue
+            self.parse_s += _perf_counter() - started
+            # A bare number can end exactly at the chunk boundary; make sure
+            # it is not cut short before accepting it.
+            if end == len(self.buf) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return obj
+
+def iter_records(body, stats=None, chunk_size=READ_CHUNK, request_s=0.0):
+    stats = stats if stats is not None else {}
+    stats.update(compressed_bytes=0, decompressed_bytes=0, records=0, peak_buffer_bytes=0,
+                 fetch_s=request_s, inflate_s=0.0, parse_s=0.0)
+
+    stream = gzip.GzipFile(fileobj=_CountingReader(body, stats), mode="rb")
+    scanner = _Scanner(stream, stats, chunk_size)
+
+    try:
+        scanner.expect("{")
+        if scanner.peek() == "}":
+            return
+
+        while True:
+            key = scanner.value()
+            scanner.expect(":")
+
+            if key == "Records":
+                scanner.expect("[")
+                if scanner.peek() == "]":
+                    scanner.pos += 1
+                else:
+                    while True:
+                        record = scanner.value()
+                        stats["records"] += 1
+                        yield record
+                        if scanner.expect(",]") == "]":
+                            break
+            else:
+                scanner.value()
+
+            if scanner.expect(",}") == "}":
+                break
+    finally:
+        stats["parse_s"] = scanner.parse_s
+
+def open_records(s3, bucket, key, stats=None):
+    started = time.perf_counter()
+    obj = s3.get_object(Bucket=bucket, Key=key)
+    return iter_records(obj["Body"], stats, request_s=time.perf_counter() - started)
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def format_stats(stats):
+    return (
+        f"records={stats.get('records', 0)}, "
+        f"compressed={stats.get('compressed_bytes', 0)}B, "
+        f"decompressed={stats.get('decompressed_bytes', 0)}B, "
+        f"peak_buffer={stats.get('peak_buffer_bytes', 0)}B, "
+        f"peak_rss={peak_rss_kb()}KB"
+    )
@@ -0,0 +1,443 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+from utils.baseline import UPDATED_ATTR, SEEN_ATTR, _days_to_seconds
+from utils.baseline_store import SHARD_KEY, META_SHARD, _shard_field, _error_code
+from utils.config_loader import load_config
+from utils.delta import SEEN_FIELDS, MAX_CLAUSES_PER_UPDATE
+from utils.log import get_logger, log_summary
+
+cfg = load_config()
+CLEANUP_CFG = cfg.get("cleanup", {}) or {}
+CANDIDATE_MAX_AGE_DAYS = CLEANUP_CFG.get("candidate_max_age_days", 14)
+BASELINE_MAX_AGE_DAYS = CLEANUP_CFG.get("baseline_max_age_days", 60)
+DELETE_MISSING_USERS = CLEANUP_CFG.get("delete_missing_users", False)
+SEGMENTS = CLEANUP_CFG.get("segments", 4)
+READ_UNITS = CLEANUP_CFG.get("read_units_per_second", 50)
+WRITE_UNITS = CLEANUP_CFG.get("write_units_per_second", 25)
+PAGE_SIZE = CLEANUP_CFG.get("page_size", 100)
+BACKGROUND = CLEANUP_CFG.get("background", False)
+INTERVAL_HOURS = CLEANUP_CFG.get("interval_hours", 24)
+
+# Compaction writes move updated_at too, so replicas copy them; the activity
+# time they found is kept in active_at, and compacted_at tells the next run
+# that updated_at was its own write rather than the engine's.
+COMPACTED_ATTR = "compacted_at"
+ACTIVE_ATTR = "active_at"
+
+STAT_KEYS = (
+    "scanned", "updated", "deleted_users", "expired_candidates", "dropped_values",
+    "conflicts", "errors", "bytes_scanned", "bytes_reclaimed", "read_units", "write_units"
+)
+
+log = get_logger("compaction")
+
+class TokenBucket:
+    # Capacity units per second shared by every scan segment. DynamoDB
+    # reports what a call consumed only after it returns, so callers wait
+    # for a positive balance, then charge the actual cost, possibly going
+    # into debt that the next caller waits off. A rate of 0 is unlimited.
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait(self, stop=None):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens > 0:
+                    return
+                delay = -self.tokens / self.rate
+            if stop is not None:
+                if stop.wait(delay):
+                    return
+            else:
+                time.sleep(delay)
+
+    def charge(self, units):
+        if not self.rate:
+            return
+        with self.lock:
+            self._refill()
+            self.tokens -= units
+
+def _size(value):
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, (int, float, Decimal)):
+        return len(str(value).lstrip("-").replace(".", "")) // 2 + 1
+    if isinstance(value, dict):
+        return 3 + sum(len(k.encode("utf-8")) + 1 + _size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 3 + sum(1 + _size(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return sum(_size(v) for v in value)
+    return len(str(value))
+
+def item_size(item):
+    # Approximate stored size by DynamoDB's sizing rules (names + values).
+    return sum(len(k.encode("utf-8")) + _size(v) for k, v in item.items())
+
+def _consumed(resp, fallback):
+    capacity = resp.get("ConsumedCapacity") or {}
+    return float(capacity.get("CapacityUnits", fallback))
+
+def last_active(item):
+    # Epoch seconds of the principal's last engine write, or None if the
+    # item carries no write stamp (never treated as dead). first_seen is not
+    # a fallback: items written before updated_at existed say nothing about
+    # recent activity.
+    updated = item.get(UPDATED_ATTR)
+    if updated is not None and updated != item.get(COMPACTED_ATTR):
+        return int(updated)
+    if item.get(ACTIVE_ATTR) is not None:
+        return int(item[ACTIVE_ATTR])
+    if updated is not None:
+        return int(updated)
+    return None
+
+def expired_candidates(candidates, cutoff):
+    # {field: [values]} whose last observation is older than cutoff.
+    expired = {}
+    for field_key, values in (candidates or {}).items():
+        if not isinstance(values, dict):
+            continue
+        stale = [v for v, cand in values.items() if int(cand.get("last_seen", 0)) < cutoff]
+        if stale:
+            expired[field_key] = stale
+    return expired
+
+def stale_values(values, stamps, cutoff):
+    # Trusted values whose trusted_seen stamp is older than cutoff, and
+    # stamps left behind by values no longer trusted. Values never stamped
+    # (written by the per-record paths) are kept.
+    values = set(values or ())
+    stamps = stamps if isinstance(stamps, dict) else {}
+    stale = [v for v in values if v in stamps and int(stamps[v]) < cutoff]
+    orphans = [v for v in stamps if v not in values]
+    return stale, orphans
+
+class Compactor:
+    # Expires stale candidates, drops trusted values not seen within
+    # baseline_max_age_days and deletes principals with no writes in that
+    # window. The table is read with a segmented parallel Scan, one thread
+    # per segment, through the resource's (thread-safe) client; reads and
+    # writes draw on per-second RCU/WCU budgets. Every write is conditional
+    # on the item being unchanged since it was scanned, so the live engine
+    # always wins and a conflicting item is left for the next run.
+    def __init__(self, store, segments=SEGMENTS, read_units=READ_UNITS, write_units=WRITE_UNITS,
+                 page_size=PAGE_SIZE, dry_run=False):
+        if not store.native_updates:
+            raise ValueError("compaction needs a DynamoDB baseline store")
+        self.client = store.dynamodb.meta.client
+        self.table_name = store.table_name
+        self.sharded = store.sharded
+        self.version_attr = store.version_attr
+        self.segments = max(1, segments)
+        self.page_size = page_size
+        self.dry_run = dry_run
+        self.reads = TokenBucket(read_units)
+        self.writes = TokenBucket(write_units)
+        self.stop = threading.Event()
+
+    def run(self):
+        now = int(time.time())
+        self.candidate_cutoff = now - _days_to_seconds(CANDIDATE_MAX_AGE_DAYS)
+        self.value_cutoff = now - _days_to_seconds(BASELINE_MAX_AGE_DAYS)
+        started = time.monotonic()
+        with ThreadPoolExecutor(self.segments, thread_name_prefix="compaction") as pool:
+            results = list(pool.map(self._scan_segment, range(self.segments)))
+        stats = {key: sum(r[key] for r in results) for key in STAT_KEYS}
+        stats["read_units"] = round(stats["read_units"], 1)
+        stats["write_units"] = round(stats["write_units"], 1)
+        log_summary(
+            "compaction", **stats, segments=self.segments, dry_run=self.dry_run,
+            layout="sharded" if self.sharded else "single",
+            elapsed_s=round(time.monotonic() - started, 3)
+        )
+        return stats
+
+    def _scan_segment(self, segment):
+        stats = dict.fromkeys(STAT_KEYS, 0)
+        kwargs = {
+            "TableName": self.table_name,
+            "Segment": segment,
+            "TotalSegments": self.segments,
+            "Limit": self.page_size,
+            "ReturnConsumedCapacity": "TOTAL"
+        }
+        while not self.stop.is_set():
+            self.reads.wait(self.stop)
+            resp = self.client.scan(**kwargs)
+            items = resp.get("Items", [])
+            sizes = [item_size(item) for item in items]
+            # Eventually consistent: half a unit per 4 KB read.
+            units = _consumed(resp, math.ceil(sum(sizes) / 4096) / 2)
+            self.reads.charge(units)
+            stats["read_units"] += units
+            for item, size in zip(items, sizes):
+                stats["scanned"] += 1
+                stats["bytes_scanned"] += size
+                try:
+                    self._compact(item, size, stats)
+                except ClientError as e:
+                    if _error_code(e) != "ConditionalCheckFailedException":
+                        stats["errors"] += 1
+                        log.error("Compaction of %s failed: %s", item.get("username"), e)
+                    else:
+                        stats["conflicts"] += 1
+            if "LastEvaluatedKey" not in resp:
+                break
+            kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+        return stats
+
+    def _compact(self, item, size, stats):
+        if self.sharded:
+            name = item.get(SHARD_KEY)
+            if name == META_SHARD:
+                return self._compact_user(item, size, stats)
+            return self._compact_shard(item, size, stats)
+        if self._dead(item):
+            return self._delete_user(item, size, stats)
+        return self._compact_item(item, size, stats)
+
+    def _dead(self, item):
+        if not DELETE_MISSING_USERS:
+            return False
+        active = last_active(item)
+        return active is not None and active < self.value_cutoff
+
+    def _write(self, method, size, stats, **kwargs):
+        # One unit per KB of the item written; dry runs count the estimate.
+        units = math.ceil(size / 1024) or 1
+        if not self.dry_run:
+            self.writes.wait(self.stop)
+            resp = getattr(self.client, method)(ReturnConsumedCapacity="TOTAL", **kwargs)
+            units = _consumed(resp, units)
+            self.writes.charge(units)
+        stats["write_units"] += units
+
+    def _unchanged(self, item):
+        # Condition: updated_at (and, where present, the version) as scanned.
+        names = {"#upd": UPDATED_ATTR}
+        values = {}
+        if item.get(UPDATED_ATTR) is None:
+            cond = "attribute_not_exists(#upd)"
+        else:
+            cond = "#upd = :old_upd"
+            values[":old_upd"] = item[UPDATED_ATTR]
+        if item.get(self.version_attr) is not None:
+            cond += " AND #ver = :old_ver"
+            names["#ver"] = self.version_attr
+            values[":old_ver"] = item[self.version_attr]
+        return cond, names, values
+
+    def _key(self, item):
+        if self.sharded:
+            return {"username": item["username"], SHARD_KEY: item[SHARD_KEY]}
+        return {"username": item["username"]}
+
+    def _delete_user(self, item, size, stats):
+        cond, names, values = self._unchanged(item)
+        kwargs = {"Key": self._key(item), "ConditionExpression": cond, "ExpressionAttributeNames": names}
+        if values:
+            kwargs["ExpressionAttributeValues"] = values
+        self._write("delete_item", size, stats, TableName=self.table_name, **kwargs)
+        log.info("Deleted baseline for inactive principal %s", item["username"])
+        stats["deleted_users"] += 1
+        stats["bytes_reclaimed"] += size
+
+    def _compact_item(self, item, size, stats):
+        clauses = []
+        compacted = dict(item)
+        expired = expired_candidates(item.get("candidates"), self.candidate_cutoff)
+        cands = {f: dict(v) for f, v in (item.get("candidates") or {}).items() if isinstance(v, dict)}
+        for n, (field_key, values) in enumerate(expired.items()):
+            stats["expired_candidates"] += len(values)
+            if len(values) == len(cands[field_key]):
+                clauses.append(("REMOVE", f"candidates.#cf{n}", {f"#cf{n}": field_key}, {}))
+                del cands[field_key]
+                continue
+            for m, value in enumerate(values):
+                clauses.append((
+                    "REMOVE", f"candidates.#cf{n}.#cv{n}_{m}",
+                    {f"#cf{n}": field_key, f"#cv{n}_{m}": value}, {}
+                ))
+                del cands[field_key][value]
+        compacted["candidates"] = cands
+
+        stamps = item.get(SEEN_ATTR) if isinstance(item.get(SEEN_ATTR), dict) else {}
+        kept_stamps = {f: dict(v) for f, v in stamps.items() if isinstance(v, dict)}
+        for n, field_key in enumerate(SEEN_FIELDS):
+            stale, orphans = stale_values(item.get(field_key), stamps.get(field_key), self.value_cutoff)
+            if stale:
+                stats["dropped_values"] += len(stale)
+                kept = [v for v in item.get(field_key) or [] if v not in stale]
+                clauses.append(("SET", f"#lf{n} = :lv{n}", {f"#lf{n}": field_key}, {f":lv{n}": kept}))
+                compacted[field_key] = kept
+            for m, value in enumerate(stale + orphans):
+                clauses.append((
+                    "REMOVE", f"#seen.#sf{n}.#sv{n}_{m}",
+                    {"#seen": SEEN_ATTR, f"#sf{n}": field_key, f"#sv{n}_{m}": value}, {}
+                ))
+                kept_stamps[field_key].pop(value, None)
+        compacted[SEEN_ATTR] = kept_stamps
+        if not clauses:
+            return
+
+        now = int(time.time())
+        active = last_active(item)
+        expected = item
+        for i in range(0, len(clauses), MAX_CLAUSES_PER_UPDATE):
+            sections = {"SET": ["#upd = :now", "#cmp = :now"], "ADD": ["#ver :one"]}
+            cond, names, values = self._unchanged(expected)
+            names.update({"#cmp": COMPACTED_ATTR, "#ver": self.version_attr})
+            values.update({":now": now, ":one": 1})
+            if active is not None:
+                sections["SET"].append("#act = :act")
+                names["#act"] = ACTIVE_ATTR
+                values[":act"] = active
+            for action, expr, c_names, c_values in clauses[i:i + MAX_CLAUSES_PER_UPDATE]:
+                sections.setdefault(action, []).append(expr)
+                names.update(c_names)
+                values.update(c_values)
+            self._write(
+                "update_item", size, stats,
+                TableName=self.table_name,
+                Key=self._key(item),
+                UpdateExpression=" ".join(f"{a} {', '.join(e)}" for a, e in sections.items()),
+                ConditionExpression=cond,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values
+            )
+            # Later chunks expect the item as this one left it.
+            expected = {UPDATED_ATTR: now, self.version_attr: int(expected.get(self.version_attr) or 0) + 1}
+        stats["updated"] += 1
+        stats["bytes_reclaimed"] += max(0, size - item_size(compacted))
+
+    def _compact_user(self, meta, size, stats):
+        # Sharded layout: the meta item carries the principal's activity;
+        # a dead principal loses its whole item collection, meta first so a
+        # concurrent engine write is not half undone.
+        if not self._dead(meta):
+            return
+        username = meta["username"]
+        self._delete_user(meta, size, stats)
+        kwargs = {
+            "TableName": self.table_name,
+            "KeyConditionExpression": "username = :u",
+            "ExpressionAttributeValues": {":u": username},
+            "ReturnConsumedCapacity": "TOTAL"
+        }
+        while True:
+            self.reads.wait()
+            resp = self.client.query(**kwargs)
+            shards = resp.get("Items", [])
+            units = _consumed(resp, 0.5)
+            self.reads.charge(units)
+            stats["read_units"] += units
+            for shard in shards:
+                shard_size = item_size(shard)
+                self._write(
+                    "delete_item", shard_size, stats,
+                    TableName=self.table_name, Key=self._key(shard)
+                )
+                stats["bytes_reclaimed"] += shard_size
+            if "LastEvaluatedKey" not in resp:
+                return
+            kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+    def _compact_shard(self, shard, size, stats):
+        field_key = _shard_field(shard[SHARD_KEY])
+        clauses = []
+        compacted = dict(shard)
+        expired = expired_candidates({field_key: shard.get("candidates") or {}}, self.candidate_cutoff)
+        stale, orphans = [], []
+        if field_key in SEEN_FIELDS:
+            stale, orphans = stale_values(shard.get("values"), shard.get("seen"), self.value_cutoff)
+
+        for n, value in enumerate(expired.get(field_key, [])):
+            clauses.append(("REMOVE", f"candidates.#c{n}", {f"#c{n}": value}, {}))
+        if stale:
+            clauses.append(("DELETE", "#vals :stale", {"#vals": "values"}, {":stale": set(stale)}))
+            compacted["values"] = set(shard["values"]) - set(stale)
+        for n, value in enumerate(stale + orphans):
+            clauses.append(("REMOVE", f"#seen.#s{n}", {"#seen": "seen", f"#s{n}": value}, {}))
+        if not clauses:
+            return
+        stats["expired_candidates"] += len(expired.get(field_key, []))
+        stats["dropped_values"] += len(stale)
+        compacted["candidates"] = {
+            v: c for v, c in (shard.get("candidates") or {}).items() if v not in expired.get(field_key, ())
+        }
+        compacted["seen"] = {v: t for v, t in (shard.get("seen") or {}).items() if v not in stale and v not in orphans}
+
+        now = int(time.time())
+        expected = shard
+        for i in range(0, len(clauses), MAX_CLAUSES_PER_UPDATE):
+            sections = {"SET": ["#upd = :now"]}
+            cond, names, values = self._unchanged(expected)
+            values[":now"] = now
+            for action, expr, c_names, c_values in clauses[i:i + MAX_CLAUSES_PER_UPDATE]:
+                sections.setdefault(action, []).append(expr)
+                names.update(c_names)
+                values.update(c_values)
+            self._write(
+                "update_item", size, stats,
+                TableName=self.table_name,
+                Key=self._key(shard),
+                UpdateExpression=" ".join(f"{a} {', '.join(e)}" for a, e in sections.items()),
+                ConditionExpression=cond,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values
+            )
+            expected = {UPDATED_ATTR: now}
+        if stale:
+            # Readers revalidate on the meta version; only trusted values
+            # leaving changes what they see.
+            self._write(
+                "update_item", 1, stats,
+                TableName=self.table_name,
+                Key={"username": shard["username"], SHARD_KEY: META_SHARD},
+                UpdateExpression="ADD #ver :one",
+                ConditionExpression="attribute_exists(username)",
+                ExpressionAttributeNames={"#ver": self.version_attr},
+                ExpressionAttributeValues={":one": 1}
+            )
+        stats["updated"] += 1
+        stats["bytes_reclaimed"] += max(0, size - item_size(compacted))
+
+def start_background(store, interval_hours=INTERVAL_HOURS, **kwargs):
+    # Daemon thread for the baseline engine: one pass per interval, within
+    # the same RCU/WCU budgets as the one-shot command.
+    compactor = Compactor(store, **kwargs)
+
+    def loop():
+        while not compactor.stop.is_set():
+            try:
+                compactor.run()
+            except Exception as e:
+                log.error("Background compaction failed: %s", e)
+            compactor.stop.wait(interval_hours * 3600)
+
+    threading.Thread(target=loop, name="compaction", daemon=True).start()
+    log.info("Background compaction every %sh (%s RCU/s, %s WCU/s)", interval_hours, compactor.reads.rate, compactor.writes.rate)
+    return compactor
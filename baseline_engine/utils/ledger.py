@@ -0,0 +1,166 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import boto3
+from botocore.exceptions import ClientError
+
+from utils.config_loader import load_config
+from utils.log import get_logger
+
+cfg = load_config()
+REGION = cfg["aws"]["region"]
+PROCESSED_TABLE = cfg["dynamodb"].get("processed_table")
+TTL_DAYS = cfg["dynamodb"].get("processed_key_ttl_days", 1)
+
+LEDGER_CFG = cfg.get("ledger", {}) or {}
+ENABLED = LEDGER_CFG.get("enabled", True) and bool(PROCESSED_TABLE)
+CONSUMER = LEDGER_CFG.get("consumer", "default")
+LEASE_SECONDS = LEDGER_CFG.get("lease_seconds", 900)
+CACHE_SIZE = LEDGER_CFG.get("cache_size", 10000)
+ENDPOINT_URL = LEDGER_CFG.get("endpoint_url")
+
+log = get_logger("ledger")
+
+CLAIMED = "claimed"
+DONE = "done"
+BUSY = "busy"
+
+_IN_PROGRESS = "in_progress"
+_DONE = "done"
+
+def _error_code(e):
+    return e.response.get("Error", {}).get("Code")
+
+class ProcessedLedger:
+    # Records which S3 objects a consumer has fully processed, keyed by
+    # consumer#bucket/key#etag so the baseline and detection engines can
+    # share one table. claim() is a single conditional put: it succeeds for
+    # a new object or one whose previous lease expired, and otherwise tells
+    # the caller whether the object is done or still being worked on. Done
+    # objects are also remembered in a local LRU so repeats cost no call.
+    # Claims come from the pipeline's fetch threads while its sink thread
+    # completes objects, so the LRU and stats are only touched under _lock.
+    def __init__(self, table, consumer=CONSUMER, ttl_days=TTL_DAYS,
+                 lease_seconds=LEASE_SECONDS, cache_size=CACHE_SIZE):
+        self.table = table
+        self.consumer = consumer
+        self.ttl_seconds = int(ttl_days * 86400)
+        self.lease_seconds = lease_seconds
+        self.cache_size = cache_size
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._done = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"claimed": 0, "duplicates": 0, "busy": 0, "cache_hits": 0}
+
+    def object_id(self, bucket, key, etag):
+        return f"{self.consumer}#{bucket}/{key}#{etag or '-'}"
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _remember(self, object_id):
+        with self._lock:
+            self._done[object_id] = True
+            self._done.move_to_end(object_id)
+            while len(self._done) > self.cache_size:
+                self._done.popitem(last=False)
+
+    def _cached(self, object_id):
+        with self._lock:
+            if object_id not in self._done:
+                return False
+            self._done.move_to_end(object_id)
+            self.stats["cache_hits"] += 1
+            self.stats["duplicates"] += 1
+            return True
+
+    def claim(self, bucket, key, etag):
+        object_id = self.object_id(bucket, key, etag)
+        if self._cached(object_id):
+            return DONE
+
+        now = int(time.time())
+        try:
+            self.table.put_item(
+                Item={
+                    "object_id": object_id,
+                    "status": _IN_PROGRESS,
+                    "owner": self.owner,
+                    "lease_expires": now + self.lease_seconds,
+                    "expires_at": now + self.ttl_seconds
+                },
+                ConditionExpression="attribute_not_exists(object_id) OR (#s = :in_progress AND lease_expires < :now)",
+                ExpressionAttributeNames={"#s": "status"},
+                ExpressionAttributeValues={":in_progress": _IN_PROGRESS, ":now": now},
+                ReturnValuesOnConditionCheckFailure="ALL_OLD"
+            )
+        except ClientError as e:
+            if _error_code(e) != "ConditionalCheckFailedException":
+                raise
+            old = e.response.get("Item")
+            if old is None:
+                old = self.table.get_item(Key={"object_id": object_id}, ConsistentRead=True).get("Item", {})
+            status = old.get("status")
+            if isinstance(status, dict):
+                # The low-level error response carries attribute-value maps.
+                status = status.get("S")
+            if status == _DONE:
+                self._remember(object_id)
+                self._count("duplicates")
+                return DONE
+            self._count("busy")
+            return BUSY
+
+        self._count("claimed")
+        return CLAIMED
+
+    def complete(self, bucket, key, etag):
+        object_id = self.object_id(bucket, key, etag)
+        self.table.put_item(Item={
+            "object_id": object_id,
+            "status": _DONE,
+            "owner": self.owner,
+            "completed_at": int(time.time()),
+            "expires_at": int(time.time()) + self.ttl_seconds
+        })
+        self._remember(object_id)
+
+    def release(self, bucket, key, etag):
+        # Drop our claim so a redelivery can retry right away instead of
+        # waiting for the lease to run out.
+        try:
+            self.table.delete_item(
+                Key={"object_id": self.object_id(bucket, key, etag)},
+                ConditionExpression="#o = :owner AND #s = :in_progress",
+                ExpressionAttributeNames={"#o": "owner", "#s": "status"},
+                ExpressionAttributeValues={":owner": self.owner, ":in_progress": _IN_PROGRESS}
+            )
+        except ClientError as e:
+            if _error_code(e) != "ConditionalCheckFailedException":
+                log.error("Failed to release claim on %s/%s: %s", bucket, key, e)
+
+class NullLedger:
+    # Used when no processed_table is configured: every object is processed.
+    stats = {}
+
+    def claim(self, bucket, key, etag):
+        return CLAIMED
+
+    def complete(self, bucket, key, etag):
+        pass
+
+    def release(self, bucket, key, etag):
+        pass
+
+def make_ledger():
+    if not ENABLED:
+        return NullLedger()
+    dynamodb = boto3.resource("dynamodb", region_name=REGION, endpoint_url=ENDPOINT_URL)
+    return ProcessedLedger(dynamodb.Table(PROCESSED_TABLE))
+
+ledger = make_ledger()
@@ -0,0 +1,310 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.config_loader import load_config
+from utils.log import get_logger, EMF_LOGGER
+
+cfg = load_config()
+METRICS_CFG = cfg.get("metrics", {}) or {}
+ENABLED = METRICS_CFG.get("enabled", True)
+SERVICE = METRICS_CFG.get("service", "trailblazer")
+HTTP_HOST = METRICS_CFG.get("http_host", "0.0.0.0")
+HTTP_PORT = METRICS_CFG.get("http_port", 0)
+EMF = METRICS_CFG.get("emf", False)
+NAMESPACE = METRICS_CFG.get("namespace", "TrailBlazer")
+RULE_TIMING = METRICS_CFG.get("rule_timing", True)
+
+PREFIX = "trailblazer"
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+LAG_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600)
+
+log = get_logger("metrics")
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        out = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            out.append(f'{name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+        out.append(f'{name}_bucket{{{labels}le="+Inf"}} {self.count}')
+        bare = labels.rstrip(",")
+        suffix = f"{{{bare}}}" if bare else ""
+        out.append(f"{name}_sum{suffix} {self.sum}")
+        out.append(f"{name}_count{suffix} {self.count}")
+        return out
+
+class StageTimer:
+    # Running totals for one stage. Per-record hot paths keep a reference
+    # and add to it directly instead of going through add_time().
+    __slots__ = ("seconds", "calls")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+
+class Registry:
+    # Stage time is accumulated as running totals. Per-file histograms are
+    # built from the difference between two snapshots of those totals, so
+    # one file's breakdown also covers helpers that never see the file.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timers = {}
+        self.stage_hist = {}
+        self.file_hist = Histogram(SECONDS_BUCKETS)
+        self.lag_hist = Histogram(LAG_BUCKETS)
+        self.counters = {}
+        self.gauges = {}
+
+    def timer(self, stage):
+        timer = self.timers.get(stage)
+        if timer is None:
+            timer = self.timers.setdefault(stage, StageTimer())
+        return timer
+
+    def add_time(self, stage, seconds, calls=1):
+        timer = self.timer(stage)
+        timer.seconds += seconds
+        timer.calls += calls
+
+    def inc(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
+
+    def snapshot(self):
+        return {stage: timer.seconds for stage, timer in list(self.timers.items())}
+
+    def since(self, snap, include=None, exclude=()):
+        return {
+            stage: timer.seconds - snap.get(stage, 0.0)
+            for stage, timer in list(self.timers.items())
+            if timer.seconds > snap.get(stage, 0.0) and stage not in exclude
+            and (include is None or stage in include)
+        }
+
+    def observe_file(self, stages, elapsed):
+        with self.lock:
+            for stage, seconds in stages.items():
+                hist = self.stage_hist.get(stage)
+                if hist is None:
+                    hist = self.stage_hist[stage] = Histogram(SECONDS_BUCKETS)
+                hist.observe(seconds)
+            self.file_hist.observe(elapsed)
+
+    def observe_lag(self, seconds):
+        with self.lock:
+            self.lag_hist.observe(seconds)
+
+    def render(self):
+        lines = []
+
+        def header(name, kind, text):
+            lines.append(f"# HELP {PREFIX}_{name} {text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+        timers = sorted(list(self.timers.items()))
+        with self.lock:
+            header("stage_seconds_total", "counter", "Seconds spent in each processing stage.")
+            for stage, timer in timers:
+                lines.append(f'{PREFIX}_stage_seconds_total{{stage="{stage}"}} {timer.seconds}')
+            header("stage_calls_total", "counter", "Timed calls per processing stage.")
+            for stage, timer in timers:
+                lines.append(f'{PREFIX}_stage_calls_total{{stage="{stage}"}} {timer.calls}')
+            header("file_stage_seconds", "histogram", "Seconds spent in each stage per log file.")
+            for stage, hist in sorted(self.stage_hist.items()):
+                lines.extend(hist.lines(f"{PREFIX}_file_stage_seconds", f'stage="{stage}",'))
+            header("file_seconds", "histogram", "Wall-clock seconds per log file.")
+            lines.extend(self.file_hist.lines(f"{PREFIX}_file_seconds", ""))
+            header("queue_lag_seconds", "histogram", "Age of SQS messages when received.")
+            lines.extend(self.lag_hist.lines(f"{PREFIX}_queue_lag_seconds", ""))
+            for name, value in sorted(list(self.counters.items())):
+                header(f"{name}_total", "counter", name.replace("_", " ").capitalize() + ".")
+                lines.append(f"{PREFIX}_{name}_total {value}")
+            for name, value in sorted(list(self.gauges.items())):
+                header(name, "gauge", name.replace("_", " ").capitalize() + ".")
+                lines.append(f"{PREFIX}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+def stage_timer(stage):
+    return registry.timer(stage)
+
+def add_time(stage, seconds, calls=1):
+    if ENABLED:
+        registry.add_time(stage, seconds, calls)
+
+@contextmanager
+def timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(stage, time.perf_counter() - started)
+
+def inc(name, value=1):
+    if ENABLED:
+        registry.inc(name, value)
+
+def set_gauge(name, value):
+    if ENABLED:
+        registry.set_gauge(name, value)
+
+def snapshot():
+    return registry.snapshot()
+
+def since(snap, include=None, exclude=()):
+    # With the pipeline, other threads add time concurrently; include and
+    # exclude keep a per-file window to the stages its own thread ran.
+    return registry.since(snap, include, exclude)
+
+def merge_times(stages):
+    # Stage totals measured in a worker process.
+    for stage, seconds in stages.items():
+        add_time(stage, seconds, calls=0)
+
+# Stage names for the streaming reader's own timings (see cloudtrail_reader).
+READER_STAGES = {"s3_fetch": "fetch_s", "decompress": "inflate_s", "parse": "parse_s"}
+
+def reader_stages(stats):
+    return {stage: stats.get(key, 0.0) for stage, key in READER_STAGES.items()}
+
+def add_reader_stats(stats):
+    # Split of the streaming reader's time; S3 body reads happen lazily
+    # inside decompression, so they are subtracted from it there.
+    for stage, seconds in reader_stages(stats).items():
+        add_time(stage, seconds)
+
+def observe_queue_lag(msg):
+    attrs = msg.get("Attributes", {}) or {}
+    sent = attrs.get("SentTimestamp")
+    if not ENABLED or not sent:
+        return None
+    lag = max(0.0, time.time() - int(sent) / 1000.0)
+    registry.observe_lag(lag)
+    registry.set_gauge("queue_lag_last_seconds", round(lag, 3))
+    registry.inc("messages")
+    if int(attrs.get("ApproximateReceiveCount", 1)) > 1:
+        registry.inc("messages_redelivered")
+    return lag
+
+def observe_file(stages, records, elapsed, alerts=0, ok=True):
+    if not ENABLED:
+        return
+    registry.observe_file(stages, elapsed)
+    registry.inc("records", records)
+    registry.inc("alerts", alerts)
+    registry.inc("files" if ok else "files_failed")
+    rate = round(records / elapsed, 1) if elapsed > 0 else 0.0
+    registry.set_gauge("records_per_second", rate)
+    if EMF:
+        emit_emf(stages, records, elapsed, alerts, rate)
+
+def emit_emf(stages, records, elapsed, alerts, rate):
+    # CloudWatch Embedded Metric Format: awslogs ships the line and
+    # CloudWatch Logs extracts the metrics, no PutMetricData calls needed.
+    values = {f"{stage}_seconds": round(seconds, 6) for stage, seconds in stages.items()}
+    values.update(file_seconds=round(elapsed, 6), records=records, records_per_second=rate, alerts=alerts)
+    lag = registry.gauges.get("queue_lag_last_seconds")
+    if lag is not None:
+        values["queue_lag_seconds"] = lag
+    units = {"records": "Count", "alerts": "Count", "records_per_second": "Count/Second"}
+    doc = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": NAMESPACE,
+                "Dimensions": [["Service"]],
+                "Metrics": [{"Name": name, "Unit": units.get(name, "Seconds")} for name in values]
+            }]
+        },
+        "Service": SERVICE,
+        **values
+    }
+    logging.getLogger(EMF_LOGGER).info("%s", json.dumps(doc))
+
+def totals():
+    return {stage: round(timer.seconds, 6) for stage, timer in sorted(registry.timers.items())}
+
+class TimedTable:
+    # DynamoDB Table wrapper that books reads and writes to stages; anything
+    # else (batch_writer, meta, ...) goes straight to the wrapped table.
+    def __init__(self, table, read_stage, write_stage):
+        self._table = table
+        self._read_stage = read_stage
+        self._write_stage = write_stage
+
+    def __getattr__(self, name):
+        return getattr(self._table, name)
+
+    def get_item(self, **kwargs):
+        with timed(self._read_stage):
+            return self._table.get_item(**kwargs)
+
+    def query(self, **kwargs):
+        with timed(self._read_stage):
+            return self._table.query(**kwargs)
+
+    def put_item(self, **kwargs):
+        with timed(self._write_stage):
+            return self._table.put_item(**kwargs)
+
+    def update_item(self, **kwargs):
+        with timed(self._write_stage):
+            return self._table.update_item(**kwargs)
+
+    def delete_item(self, **kwargs):
+        with timed(self._write_stage):
+            return self._table.delete_item(**kwargs)
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_server = None
+
+def start_http_server(host=HTTP_HOST, port=HTTP_PORT):
+    # Prometheus text endpoint on a daemon thread in the main process.
+    # Forked workers report their stage totals back to it instead.
+    global _server
+    if not ENABLED or not port or _server is not None:
+        return None
+    try:
+        _server = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as e:
+        log.error("Could not start metrics endpoint on %s:%d: %s", host, port, e)
+        return None
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    log.info("Metrics endpoint listening on http://%s:%d/metrics (pid %d)", host, port, os.getpid())
+    return _server
@@ -0,0 +1,71 @@
+import ipaddress
+
+from utils.cidr_trie import CidrTrie
+from utils.config_loader import load_config
+
+cfg = load_config()
+NETWORKS_CFG = cfg.get("trusted_networks", {}) or {}
+GLOBAL_CIDRS = NETWORKS_CFG.get("cidrs") or []
+AGGREGATE_CFG = NETWORKS_CFG.get("aggregate", {}) or {}
+AGGREGATE = AGGREGATE_CFG.get("enabled", False)
+IPV4_PREFIX = AGGREGATE_CFG.get("ipv4_prefix", 28)
+IPV6_PREFIX = AGGREGATE_CFG.get("ipv6_prefix", 64)
+MIN_ADDRESSES = AGGREGATE_CFG.get("min_addresses", 8)
+
+IP_FIELD = "known_ips"
+CIDR_FIELD = "known_cidrs"
+
+# Trusted for every principal (NAT egress ranges, VPC CIDRs).
+global_networks = CidrTrie(GLOBAL_CIDRS)
+
+def parse_ip(value):
+    try:
+        return ipaddress.ip_address(value)
+    except (ValueError, TypeError):
+        return None
+
+def is_valid_ip(value):
+    return parse_ip(value) is not None
+
+def network_index(cidrs):
+    index = CidrTrie()
+    for cidr in cidrs or ():
+        try:
+            index.add(cidr)
+        except ValueError:
+            pass
+    return index
+
+def ip_trusted(value, index=None):
+    # Covered by a configured network or one of the principal's own
+    # known_cidrs (index). sourceIPAddress may also be a service name,
+    # which never matches.
+    if not global_networks and not index:
+        return False
+    ip = parse_ip(value)
+    if ip is None:
+        return False
+    return ip in global_networks or (index is not None and ip in index)
+
+def covering_prefix(ip):
+    prefix = IPV4_PREFIX if ip.version == 4 else IPV6_PREFIX
+    return ipaddress.ip_network(f"{ip}/{prefix}", strict=False)
+
+def aggregate(addresses):
+    # Groups trusted addresses by covering prefix; a prefix holding at least
+    # MIN_ADDRESSES of them replaces those addresses. Returns (new cidrs,
+    # addresses they cover).
+    if not AGGREGATE:
+        return [], []
+    groups = {}
+    for value in addresses:
+        ip = parse_ip(value)
+        if ip is not None:
+            groups.setdefault(covering_prefix(ip), []).append(value)
+    cidrs = []
+    covered = []
+    for network, members in groups.items():
+        if len(members) >= MIN_ADDRESSES:
+            cidrs.append(str(network))
+            covered.extend(members)
+    return sorted(cidrs), covered
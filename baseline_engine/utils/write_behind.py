@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+
+from utils.config_loader import load_config
+from utils.delta import new_delta, merge_delta
+from utils.log import get_logger
+from utils import metrics
+
+cfg = load_config()
+WRITE_BEHIND_CFG = (cfg.get("baseline", {}) or {}).get("write_behind", {}) or {}
+ENABLED = WRITE_BEHIND_CFG.get("enabled", False)
+MAX_USERS = WRITE_BEHIND_CFG.get("max_users", 500)
+MAX_FILES = WRITE_BEHIND_CFG.get("max_files", 16)
+MAX_AGE_SECONDS = WRITE_BEHIND_CFG.get("max_age_seconds", 30)
+
+log = get_logger("baseline")
+
+class WriteBehind:
+    # Keeps file deltas in memory across files and writes them coalesced, so
+    # a principal seen in every file costs one read and one write per flush
+    # instead of per file. A file's done(ok) only runs after the flush that
+    # wrote its delta; the engine settles the ledger and the SQS message
+    # there, so a crash before the flush leaves both in flight and the file
+    # is redelivered. One flusher thread writes whenever max_users
+    # principals or max_files files are pending, or the oldest pending file
+    # has waited max_age_seconds.
+    #
+    #   apply(delta, failed) -> ok    writes a delta; adds usernames it could
+    #                                 not write to `failed`
+    def __init__(self, apply, max_users=MAX_USERS, max_files=MAX_FILES, max_age_seconds=MAX_AGE_SECONDS):
+        self.apply = apply
+        self.max_users = max(max_users, 1)
+        self.max_files = max(max_files, 1)
+        self.max_age_seconds = max_age_seconds
+
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._delta = new_delta()
+        self._files = []
+        self._oldest = None
+        self._pid = None
+
+        self.flushes = 0
+        self.files_flushed = 0
+        self.users_flushed = 0
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        threading.Thread(target=self._run, name="write-behind", daemon=True).start()
+
+    def add(self, delta, done):
+        self._ensure_started()
+        with self._cond:
+            merge_delta(self._delta, delta)
+            self._files.append((frozenset(delta), done))
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            metrics.set_gauge("write_behind_users", len(self._delta))
+            metrics.set_gauge("write_behind_files", len(self._files))
+            self._cond.notify_all()
+
+    def pending(self):
+        with self._cond:
+            return len(self._files)
+
+    def _due_locked(self):
+        if not self._files:
+            return False
+        return (
+            len(self._delta) >= self.max_users
+            or len(self._files) >= self.max_files
+            or time.monotonic() - self._oldest >= self.max_age_seconds
+        )
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._due_locked():
+                    timeout = None
+                    if self._oldest is not None:
+                        timeout = max(self._oldest + self.max_age_seconds - time.monotonic(), 0)
+                    self._cond.wait(timeout)
+            self.flush()
+
+    def flush(self):
+        # Writes everything pending, then settles the files it covered, in
+        # the order they were added. A file whose principals include one
+        # that could not be written is settled with ok=False (redelivered).
+        with self._flush_lock:
+            with self._cond:
+                delta, files = self._delta, self._files
+                self._delta, self._files, self._oldest = new_delta(), [], None
+                metrics.set_gauge("write_behind_users", 0)
+                metrics.set_gauge("write_behind_files", 0)
+            if not files:
+                return True
+
+            failed = set()
+            try:
+                ok = self.apply(delta, failed)
+            except Exception as e:
+                log.error("Write-behind flush of %d users failed: %s", len(delta), e)
+                ok = False
+            for users, done in files:
+                try:
+                    done(ok and not (users & failed))
+                except Exception as e:
+                    log.error("Write-behind completion failed: %s", e)
+
+            self.flushes += 1
+            self.files_flushed += len(files)
+            self.users_flushed += len(delta)
+            metrics.inc("write_behind_flushes")
+            log.info("Flushed baseline write-behind: files=%d, users=%d, failed_users=%d, ok=%s",
+                     len(files), len(delta), len(failed), ok)
+            return ok and not failed
+
+    def stats(self):
+        return {
+            "flushes": self.flushes, "files": self.files_flushed, "users": self.users_flushed,
+            "pending_files": self.pending()
+        }
@@ -0,0 +1,215 @@
+import argparse
+import gzip
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+# Synthetic CloudTrail logs for benchmarks. Every principal has a profile
+# (home IPs, regions, user agents, working hours, usual actions); most
+# events are drawn from it, the rest are off-profile so the detection rules
+# have something to find. Principals and actions are picked with Zipf
+# weights, so a few principals and a few API calls dominate like in real
+# accounts.
+
+ACCOUNT_ID = "111111111111"
+OTHER_ACCOUNT_ID = "222222222222"
+
+DEFAULT_IDENTITY_MIX = {"IAMUser": 0.45, "AssumedRole": 0.40, "AWSService": 0.12, "Root": 0.03}
+
+# (eventSource, eventName), most common first.
+EVENT_CATALOG = [
+    ("s3.amazonaws.com", "GetObject"),
+    ("sts.amazonaws.com", "GetCallerIdentity"),
+    ("ec2.amazonaws.com", "DescribeInstances"),
+    ("s3.amazonaws.com", "ListBuckets"),
+    ("s3.amazonaws.com", "PutObject"),
+    ("sts.amazonaws.com", "AssumeRole"),
+    ("logs.amazonaws.com", "DescribeLogGroups"),
+    ("iam.amazonaws.com", "ListUsers"),
+    ("iam.amazonaws.com", "GetRole"),
+    ("kms.amazonaws.com", "Decrypt"),
+    ("lambda.amazonaws.com", "ListFunctions"),
+    ("cloudwatch.amazonaws.com", "GetMetricData"),
+    ("ec2.amazonaws.com", "RunInstances"),
+    ("dynamodb.amazonaws.com", "GetItem"),
+    ("iam.amazonaws.com", "CreateAccessKey"),
+    ("iam.amazonaws.com", "AttachRolePolicy"),
+    ("iam.amazonaws.com", "PutUserPolicy"),
+    ("s3.amazonaws.com", "PutBucketPolicy"),
+    ("s3.amazonaws.com", "PutBucketAcl"),
+    ("iam.amazonaws.com", "UpdateAssumeRolePolicy")
+]
+
+REGIONS = ["us-east-1", "us-east-2", "us-west-2", "eu-west-1", "ap-southeast-2"]
+USER_AGENTS = [
+    "aws-cli/2.15.30 Python/3.11.8 Linux/5.10",
+    "Boto3/1.34.109 md/Botocore#1.34.109 ua/2.0 os/linux#5.10",
+    "aws-sdk-go-v2/1.25.2 os/linux lang/go#1.22",
+    "terraform-provider-aws/5.40.0",
+    "aws-sdk-java/2.25.6 Linux/5.10 OpenJDK_64-Bit_Server_VM"
+]
+SERVICE_PRINCIPALS = ["lambda.amazonaws.com", "ecs-tasks.amazonaws.com", "cloudtrail.amazonaws.com",
+                      "config.amazonaws.com", "autoscaling.amazonaws.com"]
+
+def zipf_weights(n, skew):
+    return [1.0 / ((i + 1) ** skew) for i in range(n)]
+
+class Principal:
+    def __init__(self, index, identity_type, rnd, actions):
+        self.index = index
+        self.identity_type = identity_type
+        self.name = {
+            "IAMUser": f"user{index}",
+            "AssumedRole": f"role{index}",
+            "AWSService": SERVICE_PRINCIPALS[index % len(SERVICE_PRINCIPALS)],
+            "Root": "root"
+        }[identity_type]
+        self.ips = [f"10.{index % 250}.{rnd.randrange(256)}.{rnd.randrange(1, 255)}" for _ in range(rnd.randint(1, 3))]
+        self.regions = rnd.sample(REGIONS, rnd.randint(1, 2))
+        self.user_agents = rnd.sample(USER_AGENTS, rnd.randint(1, 2))
+        start = rnd.randrange(0, 14)
+        self.hours = list(range(start, start + rnd.randint(6, 10)))
+        self.actions = actions
+        self.roles = [f"arn:aws:iam::{ACCOUNT_ID}:role/deploy{index % 5}"]
+
+    def identity(self):
+        if self.identity_type == "IAMUser":
+            return {"type": "IAMUser", "userName": self.name, "principalId": f"AIDA{self.index:012d}",
+                    "arn": f"arn:aws:iam::{ACCOUNT_ID}:user/{self.name}", "accountId": ACCOUNT_ID}
+        if self.identity_type == "AssumedRole":
+            return {"type": "AssumedRole", "principalId": f"AROA{self.index:012d}:session",
+                    "arn": f"arn:aws:sts::{ACCOUNT_ID}:assumed-role/{self.name}/session", "accountId": ACCOUNT_ID,
+                    "sessionContext": {"sessionIssuer": {"type": "Role", "userName": self.name,
+                                                         "arn": f"arn:aws:iam::{ACCOUNT_ID}:role/{self.name}"}}}
+        if self.identity_type == "AWSService":
+            return {"type": "AWSService", "invokedBy": self.name, "principalId": self.name}
+        return {"type": "Root", "principalId": ACCOUNT_ID, "arn": f"arn:aws:iam::{ACCOUNT_ID}:root",
+                "accountId": ACCOUNT_ID}
+
+    def baseline_item(self):
+        # The trusted baseline this principal would converge to, for seeding
+        # the detection engine's table.
+        return {
+            "username": self.name,
+            "first_seen": "2020-01-01T00:00:00Z",
+            "known_ips": list(self.ips),
+            "user_agents": list(self.user_agents),
+            "regions": list(self.regions),
+            "services": sorted({src for src, _ in self.actions}),
+            "actions": sorted({f"{src.replace('.amazonaws.com', '')}:{name}" for src, name in self.actions}),
+            "assumed_roles": list(self.roles),
+            "work_hours_utc_ns": set(h % 24 for h in self.hours),
+            "candidates": {},
+            "baseline_version": 1
+        }
+
+class Generator:
+    def __init__(self, principals=100, identity_mix=None, skew=1.1, access_denied_rate=0.03,
+                 anomaly_rate=0.02, seed=7):
+        self.rnd = random.Random(seed)
+        self.access_denied_rate = access_denied_rate
+        self.anomaly_rate = anomaly_rate
+        mix = identity_mix or DEFAULT_IDENTITY_MIX
+        types = list(mix)
+        type_weights = [mix[t] for t in types]
+
+        self.event_weights = zipf_weights(len(EVENT_CATALOG), skew)
+        self.principals = []
+        for i in range(principals):
+            identity_type = self.rnd.choices(types, type_weights)[0]
+            k = self.rnd.randint(3, 8)
+            actions = self._distinct_events(k)
+            self.principals.append(Principal(i, identity_type, self.rnd, actions))
+        self.principal_weights = zipf_weights(principals, skew)
+        self.start = datetime(2024, 5, 1)
+
+    def _distinct_events(self, k):
+        chosen = set()
+        while len(chosen) < k:
+            chosen.add(self.rnd.choices(EVENT_CATALOG, self.event_weights)[0])
+        return sorted(chosen)
+
+    def record(self, when):
+        rnd = self.rnd
+        p = rnd.choices(self.principals, self.principal_weights)[0]
+        off = rnd.random() < self.anomaly_rate
+
+        source, name = rnd.choices(EVENT_CATALOG, self.event_weights)[0] if off else rnd.choice(p.actions)
+        hour = rnd.randrange(24) if off else rnd.choice(p.hours) % 24
+        event_time = when.replace(hour=hour, minute=rnd.randrange(60), second=rnd.randrange(60))
+        record = {
+            "eventVersion": "1.08",
+            "userIdentity": p.identity(),
+            "eventTime": event_time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "eventSource": source,
+            "eventName": name,
+            "awsRegion": rnd.choice(REGIONS) if off else rnd.choice(p.regions),
+            "sourceIPAddress": (f"203.0.113.{rnd.randrange(256)}" if off else rnd.choice(p.ips))
+                               if p.identity_type != "AWSService" else p.name,
+            "userAgent": (rnd.choice(USER_AGENTS) if off else rnd.choice(p.user_agents))
+                         if p.identity_type != "AWSService" else p.name,
+            "requestParameters": None,
+            "eventID": f"{rnd.getrandbits(64):016x}",
+            "eventType": "AwsApiCall",
+            "recipientAccountId": ACCOUNT_ID
+        }
+        if name == "AssumeRole":
+            account = OTHER_ACCOUNT_ID if off else ACCOUNT_ID
+            record["requestParameters"] = {"roleArn": f"arn:aws:iam::{account}:role/deploy{p.index % 5}",
+                                           "roleSessionName": "session"}
+        elif source == "s3.amazonaws.com":
+            record["requestParameters"] = {"bucketName": f"bucket-{p.index % 7}"}
+        if rnd.random() < self.access_denied_rate:
+            record["errorCode"] = "AccessDenied"
+            record["errorMessage"] = "User is not authorized to perform this operation"
+        return record
+
+    def records(self, count, day=0):
+        when = self.start + timedelta(days=day)
+        return [self.record(when) for _ in range(count)]
+
+    def log_file(self, count, day=0):
+        return encode_log_file(self.records(count, day))
+
+    def baseline_items(self):
+        seen = {}
+        for p in self.principals:
+            seen.setdefault(p.name, p.baseline_item())
+        return list(seen.values())
+
+def encode_log_file(records):
+    return gzip.compress(json.dumps({"Records": records}).encode("utf-8"))
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic CloudTrail .json.gz files")
+    parser.add_argument("out_dir")
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--records-per-file", type=int, default=1000)
+    parser.add_argument("--principals", type=int, default=100)
+    parser.add_argument("--identity-mix", type=parse_mix, default=None,
+                        help="e.g. IAMUser=0.5,AssumedRole=0.4,AWSService=0.08,Root=0.02")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for principals and events")
+    parser.add_argument("--access-denied-rate", type=float, default=0.03)
+    parser.add_argument("--anomaly-rate", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    gen = Generator(args.principals, args.identity_mix, args.skew, args.access_denied_rate, args.anomaly_rate, args.seed)
+    os.makedirs(args.out_dir, exist_ok=True)
+    for i in range(args.files):
+        day = gen.start + timedelta(days=i)
+        path = os.path.join(args.out_dir, f"{ACCOUNT_ID}_CloudTrail_us-east-1_{day:%Y%m%d}T0000Z_{i:06d}.json.gz")
+        with open(path, "wb") as f:
+            f.write(gen.log_file(args.records_per_file, day=i))
+    print(json.dumps({"files": args.files, "records": args.files * args.records_per_file, "out_dir": args.out_dir}))
+
+if __name__ == "__main__":
+    main()
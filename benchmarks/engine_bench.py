@@ -0,0 +1,187 @@
+import argparse
+import json
+import logging
+import math
+import os
+import resource
+import sys
+import tempfile
+import time
+
+# Runs one engine's process_log_file over synthetic files against the
+# in-memory stand-ins and prints one JSON result line. Each engine is run in
+# its own process (see suite.py): both ship a top-level `utils` package, and
+# peak RSS is only meaningful per process.
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+ENGINE_DIRS = {
+    "baseline": os.path.join(ROOT, "baseline_engine"),
+    "detection": os.path.join(ROOT, "detection_engine")
+}
+LOG_BUCKET = "bench-logs"
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    # Nearest-rank.
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)]
+
+def load_engine(name):
+    engine_dir = ENGINE_DIRS[name]
+    os.chdir(engine_dir)
+    sys.path.insert(0, engine_dir)
+    if name == "baseline":
+        import baseline_engine as engine
+    else:
+        import detection_engine as engine
+    return engine
+
+def open_bench_store(backend, ddb, table):
+    from utils.baseline_store import DynamoStore, SqliteStore, MemoryStore
+    if backend == "sqlite":
+        path = os.path.join(tempfile.mkdtemp(prefix="trailblazer-bench-"), "baselines.db")
+        return SqliteStore(path)
+    if backend == "memory":
+        return MemoryStore()
+    return DynamoStore(ddb, table)
+
+def install_stubs(name, engine, s3, ddb, backend="dynamodb", combined=False):
+    from utils import alert_writer, metrics
+
+    table_name = engine.TABLE_NAME
+    ddb.create_table(table_name, "username")
+    engine.s3 = s3
+    if name == "baseline":
+        engine.ddb = ddb
+        engine.table = metrics.TimedTable(ddb.Table(table_name), "baseline_read", "candidate_write")
+        engine.baseline_store = open_bench_store(backend, ddb, engine.table)
+    else:
+        engine.dynamodb = ddb
+        engine.COMBINED = combined
+        table = ddb.Table(table_name)
+        if combined:
+            table = metrics.TimedTable(table, "delta_read", "candidate_write")
+        engine.baseline_source = engine.baseline_store = open_bench_store(backend, ddb, table)
+
+    sink = alert_writer.alert_buffer.sink
+    if hasattr(sink, "_client"):
+        sink._client = s3
+        sink._pid = os.getpid()
+    return alert_writer.alert_buffer, getattr(sink, "bucket", None)
+
+def run(args):
+    sys.path.insert(0, BENCH_DIR)
+    from cloudtrail_gen import Generator
+    from stubs import FakeDynamoDB, FakeS3
+
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+
+    engine = load_engine(args.engine)
+    logging.getLogger("trailblazer").setLevel(getattr(logging, args.log_level))
+
+    s3, ddb = FakeS3(), FakeDynamoDB()
+    alert_buffer, alert_bucket = install_stubs(args.engine, engine, s3, ddb, args.store, args.combined)
+
+    if args.engine == "baseline":
+        engine.AGGREGATE_PER_FILE = args.baseline_mode == "aggregate"
+        engine.ATOMIC_CANDIDATES = args.baseline_mode == "atomic"
+
+    gen = Generator(args.principals, args.identity_mix, args.skew, args.access_denied_rate,
+                    args.anomaly_rate, args.seed)
+    if args.engine == "detection":
+        items = gen.baseline_items()
+        covered = items[:int(len(items) * args.baseline_coverage)]
+        if args.store == "dynamodb":
+            ddb.Table(engine.TABLE_NAME).seed(covered)
+        else:
+            engine.baseline_store.put_many(covered)
+
+    total_files = args.warmup + args.files
+    keys = []
+    for i in range(total_files):
+        key = f"AWSLogs/bench/{i:06d}.json.gz"
+        s3.objects[(LOG_BUCKET, key)] = gen.log_file(args.records_per_file, day=i)
+        keys.append(key)
+
+    for key in keys[:args.warmup]:
+        engine.process_log_file(LOG_BUCKET, key)
+
+    from utils import metrics
+    s3.calls.clear()
+    ddb.calls.clear()
+    stages_before = metrics.snapshot()
+    puts_before = s3.puts_to(alert_bucket)
+    alerts_before = alert_buffer.added
+
+    latencies = []
+    failures = 0
+    started = time.perf_counter()
+    for key in keys[args.warmup:]:
+        t0 = time.perf_counter()
+        if not engine.process_log_file(LOG_BUCKET, key):
+            failures += 1
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+
+    records = args.files * args.records_per_file
+    alerts = alert_buffer.added - alerts_before
+    alert_puts = s3.puts_to(alert_bucket) - puts_before
+    ddb_calls = sum(ddb.calls.values())
+    result = {
+        "engine": args.engine,
+        "mode": args.baseline_mode if args.engine == "baseline" else ("combined" if args.combined else "detection"),
+        "store": args.store,
+        "files": args.files,
+        "records": records,
+        "seconds": round(elapsed, 4),
+        "records_per_sec": round(records / elapsed, 1) if elapsed else 0.0,
+        "file_latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p99": round(percentile(latencies, 99) * 1000, 3),
+            "max": round(max(latencies) * 1000, 3) if latencies else 0.0
+        },
+        "dynamodb_calls": dict(sorted(ddb.calls.items())),
+        "dynamodb_calls_per_record": round(ddb_calls / records, 4) if records else 0.0,
+        "alerts": alerts,
+        "alert_puts": alert_puts,
+        "s3_puts_per_alert": round(alert_puts / alerts, 4) if alerts else 0.0,
+        "failed_files": failures,
+        "stage_seconds": {k: round(v, 4) for k, v in sorted(metrics.since(stages_before).items())},
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+    real_stdout.write(json.dumps(result) + "\n")
+    real_stdout.flush()
+
+def add_workload_args(parser):
+    from cloudtrail_gen import parse_mix
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--records-per-file", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=1, help="files processed before measuring")
+    parser.add_argument("--principals", type=int, default=200)
+    parser.add_argument("--identity-mix", type=parse_mix, default=None,
+                        help="e.g. IAMUser=0.5,AssumedRole=0.4,AWSService=0.08,Root=0.02")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for principals and events")
+    parser.add_argument("--access-denied-rate", type=float, default=0.03)
+    parser.add_argument("--anomaly-rate", type=float, default=0.02)
+    parser.add_argument("--baseline-coverage", type=float, default=0.9,
+                        help="detection: fraction of principals with a seeded baseline")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--log-level", default="WARNING")
+
+def main():
+    sys.path.insert(0, BENCH_DIR)
+    parser = argparse.ArgumentParser(description="Benchmark one engine against in-memory AWS stand-ins")
+    parser.add_argument("--engine", choices=sorted(ENGINE_DIRS), required=True)
+    parser.add_argument("--baseline-mode", choices=["aggregate", "atomic", "legacy"], default="aggregate")
+    parser.add_argument("--store", choices=["dynamodb", "sqlite", "memory"], default="dynamodb",
+                        help="baseline store backend; dynamodb uses the in-memory table stand-in")
+    parser.add_argument("--combined", action="store_true",
+                        help="detection: also apply each file's baseline delta (combined mode)")
+    add_workload_args(parser)
+    run(parser.parse_args())
+
+if __name__ == "__main__":
+    main()
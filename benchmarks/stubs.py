@@ -0,0 +1,411 @@
+import copy
+import io
+import re
+from collections import Counter
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+# In-memory stand-ins for the S3 client and DynamoDB resource the engines
+# use, so benchmarks measure engine work rather than network or moto. Every
+# call is counted per operation. Items are deep-copied in and out and
+# numbers become Decimal, like boto3's serializer; update and condition
+# expressions are evaluated for the subset of the grammar the engines use
+# (SET/ADD/REMOVE, if_not_exists, list_append, attribute_(not_)exists,
+# contains, comparisons, AND/OR/NOT).
+
+def _client_error(code, message, operation, **extra):
+    return ClientError({"Error": {"Code": code, "Message": message}, **extra}, operation)
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        self.calls = Counter()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.calls["PutObject"] += 1
+        self.objects[(Bucket, Key)] = Body if isinstance(Body, bytes) else Body.encode("utf-8")
+        return {}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self.calls["GetObject"] += 1
+        try:
+            data = self.objects[(Bucket, Key)]
+        except KeyError:
+            raise _client_error("NoSuchKey", "The specified key does not exist.", "GetObject")
+        return {"Body": io.BytesIO(data), "ContentLength": len(data)}
+
+    def puts_to(self, bucket):
+        return sum(1 for b, _ in self.objects if b == bucket)
+
+def _to_dynamo(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, float):
+        raise TypeError("Float types are not supported. Use Decimal types instead.")
+    if isinstance(value, int):
+        return Decimal(value)
+    if isinstance(value, dict):
+        return {k: _to_dynamo(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_dynamo(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return {_to_dynamo(v) for v in value}
+    return value
+
+_MISSING = object()
+
+_TOKEN = re.compile(r"\s*(?:(<>|<=|>=|[=<>(),.+-])|([#:]?[A-Za-z_][A-Za-z0-9_]*))")
+
+def _tokenize(expr):
+    tokens = []
+    pos = 0
+    expr = expr.strip()
+    while pos < len(expr):
+        m = _TOKEN.match(expr, pos)
+        if not m:
+            raise _client_error("ValidationException", f"Invalid expression near: {expr[pos:pos + 20]!r}", "Expression")
+        tokens.append(m.group(1) or m.group(2))
+        pos = m.end()
+        while pos < len(expr) and expr[pos].isspace():
+            pos += 1
+    return tokens
+
+class _Parser:
+    def __init__(self, expr, names, values):
+        self.tokens = _tokenize(expr)
+        self.i = 0
+        self.names = names or {}
+        self.values = values or {}
+
+    def peek(self):
+        return self.tokens[self.i] if self.i < len(self.tokens) else None
+
+    def take(self, expected=None):
+        tok = self.peek()
+        if tok is None or (expected is not None and tok.upper() != expected):
+            raise _client_error("ValidationException", f"Expected {expected}, got {tok}", "Expression")
+        self.i += 1
+        return tok
+
+    def name(self, tok):
+        if tok.startswith("#"):
+            if tok not in self.names:
+                raise _client_error("ValidationException", f"Undefined attribute name {tok}", "Expression")
+            return self.names[tok]
+        return tok
+
+    def path(self):
+        parts = [self.name(self.take())]
+        while self.peek() == ".":
+            self.take()
+            parts.append(self.name(self.take()))
+        return tuple(parts)
+
+    def operand(self):
+        tok = self.peek()
+        if tok.startswith(":"):
+            self.take()
+            if tok not in self.values:
+                raise _client_error("ValidationException", f"Undefined attribute value {tok}", "Expression")
+            return ("value", _to_dynamo(self.values[tok]))
+        if self.i + 1 < len(self.tokens) and self.tokens[self.i + 1] == "(":
+            fn = self.take().lower()
+            self.take("(")
+            args = [self.operand()]
+            while self.peek() == ",":
+                self.take()
+                args.append(self.operand())
+            self.take(")")
+            return ("call", fn, args)
+        return ("path", self.path())
+
+    # update := (SET a, b | REMOVE p, q | ADD p v, ...)+
+    def update(self):
+        actions = []
+        while self.peek() is not None:
+            section = self.take().upper()
+            while True:
+                if section == "SET":
+                    target = self.path()
+                    self.take("=")
+                    left = self.operand()
+                    if self.peek() in ("+", "-"):
+                        op = self.take()
+                        left = ("arith", op, left, self.operand())
+                    actions.append(("SET", target, left))
+                elif section == "REMOVE":
+                    actions.append(("REMOVE", self.path(), None))
+                elif section in ("ADD", "DELETE"):
+                    target = self.path()
+                    actions.append((section, target, self.operand()))
+                else:
+                    raise _client_error("ValidationException", f"Unknown update section {section}", "UpdateItem")
+                if self.peek() != ",":
+                    break
+                self.take()
+        return actions
+
+    # cond := and (OR and)* ; and := not (AND not)* ; not := NOT not | primary
+    def condition(self):
+        node = self._and()
+        while self.peek() and self.peek().upper() == "OR":
+            self.take()
+            node = ("or", node, self._and())
+        return node
+
+    def _and(self):
+        node = self._not()
+        while self.peek() and self.peek().upper() == "AND":
+            self.take()
+            node = ("and", node, self._not())
+        return node
+
+    def _not(self):
+        if self.peek() and self.peek().upper() == "NOT":
+            self.take()
+            return ("not", self._not())
+        if self.peek() == "(":
+            self.take()
+            node = self.condition()
+            self.take(")")
+            return node
+        left = self.operand()
+        if left[0] == "call":
+            return left
+        op = self.take()
+        return ("cmp", op, left, self.operand())
+
+def _get(item, path):
+    node = item
+    for part in path:
+        if not isinstance(node, dict) or part not in node:
+            return _MISSING
+        node = node[part]
+    return node
+
+def _parent(item, path, operation):
+    node = item
+    for part in path[:-1]:
+        node = node.get(part) if isinstance(node, dict) else None
+        if not isinstance(node, dict):
+            raise _client_error(
+                "ValidationException",
+                "The document path provided in the update expression is invalid for update",
+                operation
+            )
+    return node
+
+def _eval(item, node):
+    kind = node[0]
+    if kind == "value":
+        return node[1]
+    if kind == "path":
+        return _get(item, node[1])
+    if kind == "arith":
+        _, op, left, right = node
+        a, b = _eval(item, left), _eval(item, right)
+        return a + b if op == "+" else a - b
+    if kind == "call":
+        fn, args = node[1], node[2]
+        if fn == "if_not_exists":
+            value = _eval(item, args[0])
+            return _eval(item, args[1]) if value is _MISSING else value
+        if fn == "list_append":
+            return list(_eval(item, args[0])) + list(_eval(item, args[1]))
+        if fn == "attribute_exists":
+            return _eval(item, args[0]) is not _MISSING
+        if fn == "attribute_not_exists":
+            return _eval(item, args[0]) is _MISSING
+        if fn == "contains":
+            container = _eval(item, args[0])
+            value = _eval(item, args[1])
+            return container is not _MISSING and value in container
+        if fn == "begins_with":
+            value = _eval(item, args[0])
+            return isinstance(value, str) and value.startswith(_eval(item, args[1]))
+        raise _client_error("ValidationException", f"Unsupported function {fn}", "Expression")
+    if kind == "not":
+        return not _eval(item, node[1])
+    if kind == "and":
+        return _eval(item, node[1]) and _eval(item, node[2])
+    if kind == "or":
+        return _eval(item, node[1]) or _eval(item, node[2])
+    if kind == "cmp":
+        _, op, left, right = node
+        a, b = _eval(item, left), _eval(item, right)
+        if a is _MISSING or b is _MISSING:
+            return op == "<>"
+        return {"=": a == b, "<>": a != b, "<": a < b, "<=": a <= b, ">": a > b, ">=": a >= b}[op]
+    raise ValueError(kind)
+
+def _project(item, paths):
+    out = {}
+    for path in paths:
+        value = _get(item, path)
+        if value is _MISSING:
+            continue
+        node = out
+        for part in path[:-1]:
+            node = node.setdefault(part, {})
+        node[path[-1]] = copy.deepcopy(value)
+    return out
+
+def _projection_paths(expression, names):
+    paths = []
+    for part in expression.split(","):
+        paths.append(tuple(names.get(p.strip(), p.strip()) for p in part.split(".")))
+    return paths
+
+class FakeBatchWriter:
+    def __init__(self, table, flush_amount=25):
+        self.table = table
+        self.flush_amount = flush_amount
+        self.buffer = []
+
+    def put_item(self, Item):
+        self.buffer.append(("put", Item))
+        if len(self.buffer) >= self.flush_amount:
+            self._flush()
+
+    def delete_item(self, Key):
+        self.buffer.append(("delete", Key))
+        if len(self.buffer) >= self.flush_amount:
+            self._flush()
+
+    def _flush(self):
+        if not self.buffer:
+            return
+        self.table.calls["BatchWriteItem"] += 1
+        for op, payload in self.buffer:
+            if op == "put":
+                self.table._store(payload)
+            else:
+                self.table.items.pop(self.table._key(payload), None)
+        self.buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._flush()
+        return False
+
+class FakeTable:
+    def __init__(self, name, hash_key, calls):
+        self.name = self.table_name = name
+        self.hash_key = hash_key
+        self.items = {}
+        self.calls = calls
+
+    def _key(self, key):
+        return key[self.hash_key]
+
+    def _store(self, item):
+        self.items[self._key(item)] = _to_dynamo(copy.deepcopy(item))
+
+    def _check(self, item, kwargs, operation):
+        cond = kwargs.get("ConditionExpression")
+        if not cond:
+            return
+        tree = _Parser(cond, kwargs.get("ExpressionAttributeNames"), kwargs.get("ExpressionAttributeValues")).condition()
+        if not _eval(item or {}, tree):
+            extra = {}
+            if kwargs.get("ReturnValuesOnConditionCheckFailure") == "ALL_OLD" and item:
+                extra["Item"] = copy.deepcopy(item)
+            raise _client_error("ConditionalCheckFailedException", "The conditional request failed", operation, **extra)
+
+    def seed(self, items):
+        for item in items:
+            self._store(item)
+
+    def get_item(self, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        self.calls["GetItem"] += 1
+        item = self.items.get(self._key(Key))
+        if item is None:
+            return {}
+        if ProjectionExpression:
+            return {"Item": _project(item, _projection_paths(ProjectionExpression, ExpressionAttributeNames or {}))}
+        return {"Item": copy.deepcopy(item)}
+
+    def put_item(self, Item, **kwargs):
+        self.calls["PutItem"] += 1
+        self._check(self.items.get(self._key(Item)), kwargs, "PutItem")
+        self._store(Item)
+        return {}
+
+    def delete_item(self, Key, **kwargs):
+        self.calls["DeleteItem"] += 1
+        self._check(self.items.get(self._key(Key)), kwargs, "DeleteItem")
+        self.items.pop(self._key(Key), None)
+        return {}
+
+    def update_item(self, Key, UpdateExpression, **kwargs):
+        self.calls["UpdateItem"] += 1
+        k = self._key(Key)
+        current = self.items.get(k)
+        self._check(current, kwargs, "UpdateItem")
+
+        item = copy.deepcopy(current) if current is not None else _to_dynamo(dict(Key))
+        parser = _Parser(UpdateExpression, kwargs.get("ExpressionAttributeNames"), kwargs.get("ExpressionAttributeValues"))
+        actions = parser.update()
+        # Operands see the item as it was before the update.
+        before = copy.deepcopy(item)
+        touched = []
+        for action, path, operand in actions:
+            parent = _parent(item, path, "UpdateItem")
+            leaf = path[-1]
+            if action == "SET":
+                parent[leaf] = copy.deepcopy(_eval(before, operand))
+            elif action == "REMOVE":
+                parent.pop(leaf, None)
+            elif action == "ADD":
+                value = _eval(before, operand)
+                existing = parent.get(leaf)
+                if isinstance(value, set):
+                    parent[leaf] = set(existing or ()) | value
+                else:
+                    parent[leaf] = (existing or Decimal(0)) + value
+            elif action == "DELETE":
+                existing = parent.get(leaf)
+                if existing is not None:
+                    parent[leaf] = set(existing) - _eval(before, operand)
+            touched.append(path)
+        self.items[k] = item
+
+        if kwargs.get("ReturnValues") == "UPDATED_NEW":
+            return {"Attributes": _project(item, [p for p in touched])}
+        if kwargs.get("ReturnValues") == "ALL_NEW":
+            return {"Attributes": copy.deepcopy(item)}
+        return {}
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return FakeBatchWriter(self)
+
+class FakeDynamoDB:
+    # Stands in for boto3.resource("dynamodb").
+    def __init__(self):
+        self.calls = Counter()
+        self.tables = {}
+
+    def create_table(self, name, hash_key):
+        self.tables[name] = FakeTable(name, hash_key, self.calls)
+        return self.tables[name]
+
+    def Table(self, name):
+        return self.tables[name]
+
+    def batch_get_item(self, RequestItems):
+        self.calls["BatchGetItem"] += 1
+        responses = {}
+        for name, request in RequestItems.items():
+            table = self.tables[name]
+            names = request.get("ExpressionAttributeNames") or {}
+            paths = _projection_paths(request["ProjectionExpression"], names) if request.get("ProjectionExpression") else None
+            found = []
+            for key in request["Keys"][:100]:
+                item = table.items.get(table._key(key))
+                if item is not None:
+                    found.append(_project(item, paths) if paths else copy.deepcopy(item))
+            responses[name] = found
+        return {"Responses": responses, "UnprocessedKeys": {}}
@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from engine_bench import BENCH_DIR, ROOT, add_workload_args
+
+# End-to-end throughput suite. Each scenario runs engine_bench.py in a fresh
+# process with the same synthetic workload; the combined JSON can be saved
+# per commit and compared with --compare.
+#
+#   python benchmarks/suite.py --output bench-$(git rev-parse --short HEAD).json
+#   python benchmarks/suite.py --compare bench-abc1234.json
+
+SCENARIOS = {
+    "detection": ["--engine", "detection"],
+    "baseline-aggregate": ["--engine", "baseline", "--baseline-mode", "aggregate"],
+    "baseline-atomic": ["--engine", "baseline", "--baseline-mode", "atomic"],
+    "baseline-legacy": ["--engine", "baseline", "--baseline-mode", "legacy"],
+    "detection-sqlite": ["--engine", "detection", "--store", "sqlite"],
+    "baseline-sqlite": ["--engine", "baseline", "--baseline-mode", "aggregate", "--store", "sqlite"],
+    "combined": ["--engine", "detection", "--combined"]
+}
+DEFAULT_SCENARIOS = ["detection", "baseline-aggregate", "baseline-atomic"]
+
+# Metrics compared by --compare, and whether higher is better.
+COMPARED = [
+    ("records_per_sec", True),
+    ("file_latency_ms.p50", False),
+    ("file_latency_ms.p99", False),
+    ("dynamodb_calls_per_record", False),
+    ("s3_puts_per_alert", False),
+    ("peak_rss_kb", False)
+]
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+def _metric(result, path):
+    value = result
+    for part in path.split("."):
+        value = value.get(part, {}) if isinstance(value, dict) else {}
+    return value if isinstance(value, (int, float)) else None
+
+def workload_argv(args):
+    argv = [
+        "--files", str(args.files), "--records-per-file", str(args.records_per_file),
+        "--warmup", str(args.warmup), "--principals", str(args.principals),
+        "--skew", str(args.skew), "--access-denied-rate", str(args.access_denied_rate),
+        "--anomaly-rate", str(args.anomaly_rate), "--baseline-coverage", str(args.baseline_coverage),
+        "--seed", str(args.seed), "--log-level", args.log_level
+    ]
+    if args.identity_mix:
+        argv += ["--identity-mix", ",".join(f"{k}={v}" for k, v in args.identity_mix.items())]
+    return argv
+
+def run_scenario(name, args):
+    cmd = [sys.executable, os.path.join(BENCH_DIR, "engine_bench.py")] + SCENARIOS[name] + workload_argv(args)
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{name} failed:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def compare(current, previous):
+    lines = []
+    old_by_name = previous.get("scenarios", {})
+    for name, result in current["scenarios"].items():
+        old = old_by_name.get(name)
+        if not old:
+            continue
+        for metric, higher_is_better in COMPARED:
+            a, b = _metric(old, metric), _metric(result, metric)
+            if a is None or b is None:
+                continue
+            change = ((b - a) / a * 100.0) if a else 0.0
+            better = change > 0 if higher_is_better else change < 0
+            mark = "" if abs(change) < 2 else (" better" if better else " WORSE")
+            lines.append(f"{name:20s} {metric:28s} {a:>12} -> {b:>12} ({change:+.1f}%){mark}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the engine benchmark suite")
+    parser.add_argument("--scenarios", default=",".join(DEFAULT_SCENARIOS),
+                        help=f"comma-separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    parser.add_argument("--compare", help="JSON result of an earlier run to compare against")
+    add_workload_args(parser)
+    args = parser.parse_args()
+
+    started = time.time()
+    scenarios = {}
+    for name in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+        scenarios[name] = run_scenario(name, args)
+
+    result = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(started)),
+        "workload": {k: v for k, v in vars(args).items() if k not in ("scenarios", "output", "compare")},
+        "scenarios": scenarios
+    }
+    text = json.dumps(result, indent=2, sort_keys=True)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(result, json.load(f)), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
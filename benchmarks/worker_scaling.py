@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ENGINE_DIR = os.path.join(BENCH_DIR, "..", "detection_engine")
+
+def main():
+    parser = argparse.ArgumentParser(description="Detection worker-pool throughput by worker count")
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--workers", default=None, help="comma-separated worker counts (default: 1,2,4,.. up to cores)")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    if args.workers:
+        counts = [int(w) for w in args.workers.split(",")]
+    else:
+        counts = [1]
+        while counts[-1] * 2 <= cores:
+            counts.append(counts[-1] * 2)
+
+    sys.path.insert(0, BENCH_DIR)
+    from cloudtrail_gen import Generator
+    from stubs import FakeS3
+
+    gen = Generator(principals=args.users)
+    baselines = {item["username"]: item for item in gen.baseline_items()}
+
+    os.chdir(ENGINE_DIR)
+    sys.path.insert(0, ENGINE_DIR)
+    out = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+
+    import detection_engine as de
+    from utils import alert_writer
+    from utils.worker_pool import ShardedWorkerPool
+
+    # In-memory stand-ins: no DynamoDB reads, and alerts go through the real
+    # buffer to a fake S3. The sink's client getter is replaced rather than
+    # its cached client, so forked workers keep the stub.
+    de.baseline_cache.fetch_many = lambda usernames: {u: baselines[u] for u in usernames if u in baselines}
+    s3 = FakeS3()
+    sink = alert_writer.alert_buffer.sink
+    if hasattr(sink, "_client"):
+        sink._s3 = lambda: s3
+
+    records = gen.records(args.records)
+    items = []
+    for i, record in enumerate(records):
+        username, actor_type = de.classify_identity(record["userIdentity"])
+        if not username:
+            continue
+        items.append((i, record, username, actor_type))
+
+    results = []
+    for workers in counts:
+        start = time.perf_counter()
+        if workers == 1:
+            de.evaluate_shard(items)
+        else:
+            pool = ShardedWorkerPool(workers, de.evaluate_shard, part_size=de.WORKER_PART_SIZE)
+            job_id = pool.start_job()
+            for item in items:
+                pool.submit(job_id, item[2], item)
+            pool.finish_job(job_id)
+            _, errors = pool.wait(job_id)
+            pool.close()
+            if errors:
+                raise RuntimeError(errors)
+        elapsed = time.perf_counter() - start
+        results.append({
+            "workers": workers,
+            "records": len(items),
+            "seconds": round(elapsed, 3),
+            "records_per_sec": round(len(items) / elapsed, 1)
+        })
+
+    out.write(json.dumps({"cores": cores, "results": results}, indent=2) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,29 @@
 import boto3
 import json
-import gzip
-from datetime import datetime
+import logging
+import time
 
 from utils.config_loader import load_config
-from utils.suppression import is_suppressed
-from utils.alert_writer import write_alert
+from utils.suppression import SUPPRESSED_ACTOR_TYPES, is_suppressed, suppressed_field, suppression_fields, suppression_stats
+from utils.alert_writer import write_alert, flush_alerts, alert_buffer, AlertAggregator
 from utils.burn_in import is_in_burn_in_period
 from utils.identity import classify_identity, should_suppress_actor  
-from utils.hours import get_baselined_hours_ns
+from utils.baseline_cache import BaselineCache
+from utils.baseline_view import BaselineView
+from utils.baseline_store import (
+    open_store, DynamoStore, SqliteStore, ReplicaSync, REPLICA_ENABLED, REPLICA_PATH
+)
+from utils.cloudtrail_reader import open_records, format_stats
+from utils.observations import extract_observations
+from utils.delta import new_delta, add_observation, merge_delta, apply_delta
+from utils.worker_pool import ShardedWorkerPool
+from utils.log import get_logger, log_summary
+from utils.ledger import ledger, DONE, BUSY
+from utils import metrics
+from utils.sqs_consumer import SqsConsumer
+from utils.pipeline import FilePipeline, TaskGroup, ENABLED as PIPELINE_ENABLED
 
-from detection_rules.assume_role import detect_assume_role
-from detection_rules.privilege_escalation import detect_privilege_escalation
-from detection_rules.s3_exposure import detect_s3_exposure
-from detection_rules.blocked_actions import detect_blocked_action
-from detection_rules.user_behavior import detect_user_behavior_anomaly
-from detection_rules.unseen_action import detect_unseen_action
+from detection_rules.registry import RecordView, load_rules, evaluate_rules
 
 config = load_config()
 REGION = config["aws"]["region"]
@@ -23,153 +31,556 @@ DEFAULT_BUCKET = config["s3"]["log_bucket"]
 TABLE_NAME = config["dynamodb"]["baseline_table"]
 QUEUE_URL = config["sqs"]["detection_queue_url"]
 
-SUPPRESSED_ACTOR_TYPES = set(
-    config.get("detection", {}).get("suppressed_actor_types", ["service", "anonymous"])
-)
+PREFETCH_BATCH_RECORDS = config.get("detection", {}).get("prefetch_batch_records", 5000)
+WORKERS = config.get("detection", {}).get("workers", 1)
+WORKER_PART_SIZE = config.get("detection", {}).get("worker_part_size", 500)
+
+# Combined mode: this engine also builds the baseline, from the same fetch
+# and parse, so the baseline engine and its queue are not needed.
+COMBINED = (config.get("combined", {}) or {}).get("enabled", False)
+PROM_THRESH = config["dynamodb"]["promotion"]
 
 dynamodb = boto3.resource("dynamodb", region_name=REGION)
 s3 = boto3.client("s3", region_name=REGION)
 sqs = boto3.client("sqs", region_name=REGION)
-table = dynamodb.Table(TABLE_NAME)
+
+load_rules()
+
+log = get_logger("detection")
+
+_identity_timer = metrics.stage_timer("identity")
+_off_hours_timer = metrics.stage_timer("rule.off_hours")
+
+CACHE_CFG = config.get("detection", {}).get("baseline_cache", {}) or {}
+VERSION_ATTR = CACHE_CFG.get("version_attribute")
+
+def _open_baseline_store():
+    # Returns (source, reads): with the replica enabled, reads go to a local
+    # SQLite copy that main() keeps in step with the DynamoDB table. Combined
+    # mode writes its deltas to the source.
+    table = dynamodb.Table(TABLE_NAME)
+    if COMBINED:
+        table = metrics.TimedTable(table, "delta_read", "candidate_write")
+    source = open_store(dynamodb, table, version_attr=VERSION_ATTR)
+    if REPLICA_ENABLED and isinstance(source, DynamoStore):
+        return source, SqliteStore(REPLICA_PATH, version_attr=VERSION_ATTR)
+    return source, source
+
+baseline_source, baseline_store = _open_baseline_store()
+
+def _fetch_baseline(username):
+    return baseline_store.get(username)
+
+def _fetch_baseline_version(username):
+    return baseline_store.get_version(username)
+
+def _fetch_baselines(usernames):
+    return baseline_store.get_many(usernames)
+
+def _fetch_baseline_versions(usernames):
+    return baseline_store.get_versions(usernames)
+
+baseline_cache = BaselineCache(
+    fetch=_fetch_baseline,
+    max_entries=CACHE_CFG.get("max_entries", 2048),
+    max_bytes=CACHE_CFG.get("max_bytes", 64 * 1024 * 1024),
+    ttl_seconds=CACHE_CFG.get("ttl_seconds", 60) if CACHE_CFG.get("enabled", True) else 0,
+    version_attr=VERSION_ATTR,
+    fetch_version=_fetch_baseline_version if VERSION_ATTR else None,
+    fetch_many=_fetch_baselines,
+    fetch_versions_many=_fetch_baseline_versions if VERSION_ATTR else None,
+    build=BaselineView
+)
+
+def _is_unknown_actor(username, actor_type):
+    return actor_type == "unknown" or not username or username == "unknown"
+
+def prefetch_baselines(actors, known=None):
+    usernames = {
+        username for username, actor_type in actors
+        if not should_suppress_actor(actor_type, SUPPRESSED_ACTOR_TYPES)
+        and not _is_unknown_actor(username, actor_type)
+        and username not in (known or {})
+    }
+    if not usernames:
+        return {}
+    with metrics.timed("baseline_read"):
+        baselines = baseline_cache.get_many(sorted(usernames))
+    new_actors = sum(1 for view in baselines.values() if view is None)
+    log.info("Prefetched baselines for %d actors (%d without baseline)", len(baselines), new_actors)
+    return baselines
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# Record fields that suppression rules may target, by RecordView attribute.
+SUPPRESSION_FIELDS = {
+    "sourceIPAddress": "source_ip",
+    "awsRegion": "region",
+    "eventSource": "event_source",
+    "eventName": "event_name",
+    "action": "action_key"
+}
+
+def _suppressed_by_rule(username, view):
+    for field in suppression_fields():
+        attr = SUPPRESSION_FIELDS.get(field)
+        if attr:
+            name = suppressed_field(username, field, getattr(view, attr))
+            if name:
+                return name
+    return None
+
+def evaluate_record(i, record, username, actor_type, baselines, emit=None):
+    emit = emit or write_alert
+    log.debug("Processing record %d: id=%s, type=%s", i + 1, username, actor_type)
+
+    if should_suppress_actor(actor_type, SUPPRESSED_ACTOR_TYPES):
+        log.debug("Skipping suppressed actor type: %s (%s)", actor_type, username)
+        return
+
+    if _is_unknown_actor(username, actor_type):
+        if log.isEnabledFor(logging.DEBUG):
+            try:
+                log.debug("Raw userIdentity for unknown: %s", json.dumps(record.get("userIdentity", {})))
+            except Exception:
+                log.debug("Raw userIdentity for unknown: <unserializable>")
+        log.info("Unknown actor identity, skipping detection")
+        return
+
+    user_agent = record.get("userAgent", "unknown")
+    source_ip  = record.get("sourceIPAddress", "unknown")
+
+    if is_suppressed(username, user_agent):
+        log.debug("Skipping suppressed %s/%s", username, user_agent)
+        return
+
+    view = RecordView(record)
+    rule_name = _suppressed_by_rule(username, view)
+    if rule_name:
+        log.debug("Skipping %s, suppressed by rule %s", username, rule_name)
+        return
+
+    baseline = baselines.get(username)
+    # Windowed rules count every principal's events, new or in burn-in.
+    evaluate_rules(view, baseline, emit, username, gated=False)
+
+    if baseline is None:
+        log.info("New actor detected (no baseline): %s", username)
+        emit(
+            alert_type="New User Activity",
+            metadata={
+                "severity": "info",
+                "category": "iam",
+                "actor_type": actor_type,
+                "timestamp": record.get("eventTime")
+            },
+            details={
+                "user": username,
+                "event": record.get("eventName"),
+                "source_ip": source_ip,
+                "user_agent": user_agent
+            }
+        )
+        return
+
+    if is_in_burn_in_period(baseline):
+        log.debug("%s is in burn-in period, skipping detection", username)
+        return
+
+    evt_hour = view.event_hour
+    if evt_hour is not None:
+        started = time.perf_counter()
+        try:
+            trusted_hours = baseline.trusted_hours
+
+            if trusted_hours and (evt_hour not in trusted_hours):
+                if not baseline.is_candidate("work_hours_utc", view.hour_key):
+                    emit(
+                        alert_type="Off-hours Activity",
+                        metadata={
+                            "severity": "medium",
+                            "category": "behavior",
+                            "actor_type": actor_type,
+                            "timestamp": view.event_time,
+                        },
+                        details={
+                            "user": username,
+                            "event": view.event_name,
+                            "event_hour_utc": evt_hour,
+                            "trusted_hours_utc": sorted(trusted_hours),
+                            "source_ip": view.source_ip,
+                            "user_agent": view.user_agent,
+                        }
+                    )
+        except Exception:
+            pass
+        _off_hours_timer.seconds += time.perf_counter() - started
+        _off_hours_timer.calls += 1
+
+    evaluate_rules(view, baseline, emit, username)
+
+def observe_record(delta, record, username, actor_type):
+    # The baseline engine's view of the record: same actors skipped, same
+    # observations taken.
+    if should_suppress_actor(actor_type, SUPPRESSED_ACTOR_TYPES) or _is_unknown_actor(username, actor_type):
+        return
+    for field_key, value in extract_observations(record, username):
+        add_observation(delta, username, field_key, value)
+
+def _evaluate_batches(batches, baselines, counts, emit=None, delta=None):
+    # Records are streamed and evaluated in batches; each batch's new
+    # actors are prefetched before any rule runs on it, so memory stays
+    # bounded while DynamoDB reads stay per distinct user per file.
+    for batch in batches:
+        with metrics.timed("identity"):
+            actors = [classify_identity(record.get("userIdentity", {})) for record in batch]
+        baselines.update(prefetch_baselines(actors, known=baselines))
+
+        for j, (record, (username, actor_type)) in enumerate(zip(batch, actors)):
+            evaluate_record(counts["records"] + j, record, username, actor_type, baselines, emit)
+            if delta is not None:
+                observe_record(delta, record, username, actor_type)
+        counts["records"] += len(batch)
+
+def apply_file_delta(delta):
+    # Combined mode ordering: an object is evaluated against the baseline as
+    # it stood before the object, and its delta is applied afterwards, before
+    # the ledger marks it complete. Its principals' cached views are dropped
+    # so the next object is evaluated against the updated baseline. False
+    # if any principal's delta could not be written; the object is then
+    # released for redelivery rather than completed.
+    failed = set()
+    promoted = apply_delta(delta, baseline_source, PROM_THRESH, write_alert, failed)
+    for username in delta:
+        baseline_cache.invalidate(username)
+    log.info("Applied baseline delta: users=%d, promoted=%d, failed_users=%d", len(delta), promoted, len(failed))
+    return not failed
+
+def _log_file_stats(bucket, key, stats):
+    log.debug("Streamed %s/%s: %s", bucket, key, format_stats(stats))
+    log.info("Baseline cache stats: %s", json.dumps(baseline_cache.stats()))
+    log.info("Suppression hits: %s", json.dumps(suppression_stats()))
+
+def _report_file(bucket, key, stages, records, users, alerts, elapsed, ok):
+    metrics.observe_file(stages, records, elapsed, alerts, ok)
+    log_summary(
+        "detection", bucket=bucket, key=key, records=records, users=users,
+        alerts=alerts, elapsed_s=round(elapsed, 3), ok=ok
+    )
 
 def process_log_file(bucket, key):
+    started = time.monotonic()
+    snap = metrics.snapshot()
+    alerts_before = alert_buffer.added
+    stats = {}
+    baselines = {}
+    counts = {"records": 0}
+    aggregator = AlertAggregator()
+    delta = new_delta() if COMBINED else None
+    read_ok = True
     try:
-        print(f"[INFO] Processing S3 object: {bucket}/{key}", flush=True)
-        obj = s3.get_object(Bucket=bucket, Key=key)
-        body = obj["Body"].read()
-        print(f"[DEBUG] Retrieved object body ({len(body)} bytes)", flush=True)
+        log.info("Processing S3 object: %s/%s", bucket, key)
+        records = _batched(open_records(s3, bucket, key, stats), PREFETCH_BATCH_RECORDS)
+        _evaluate_batches(records, baselines, counts, aggregator.write_alert, delta)
+        _log_file_stats(bucket, key, stats)
+    except Exception as e:
+        log.error("Failed to process log file %s: %s", key, e)
+        # As in the baseline engine, a truncated file applies no delta and
+        # is released for redelivery.
+        delta = None
+        read_ok = False
+    aggregator.flush()
+    if delta and not apply_file_delta(delta):
+        read_ok = False
+    metrics.add_reader_stats(stats)
 
-        data = gzip.decompress(body).decode("utf-8")
-        log_data = json.loads(data)
-        print(f"[DEBUG] Parsed {len(log_data.get('Records', []))} records from log", flush=True)
+    # Alerts for a file are flushed as one batch; False means some batch
+    # could not be written and the message must not be acknowledged.
+    with metrics.timed("alert_flush"):
+        ok = flush_alerts() and read_ok
+    _report_file(
+        bucket, key, metrics.since(snap), counts["records"], len(baselines),
+        alert_buffer.added - alerts_before, time.monotonic() - started, ok
+    )
+    return ok
 
-        for i, record in enumerate(log_data.get("Records", [])):
-            print(f"[DEBUG] Processing record {i+1}", flush=True)
+def init_worker(shard):
+    # Each worker gets its own clients; boto3 sessions are not fork-safe.
+    global dynamodb, baseline_source, baseline_store
+    dynamodb = boto3.resource("dynamodb", region_name=REGION)
+    if baseline_store is baseline_source:
+        baseline_source, baseline_store = _open_baseline_store()
+    log.info("Detection worker %d ready", shard)
 
-            identity = record.get("userIdentity", {})
-            username, actor_type = classify_identity(identity)
-            print(f"[DEBUG] Actor resolved: id={username}, type={actor_type}", flush=True)
+def evaluate_shard(items):
+    snap = metrics.snapshot()
+    alerts_before = alert_buffer.added
+    actors = [(username, actor_type) for _, _, username, actor_type in items]
+    baselines = prefetch_baselines(actors)
+    # Records are sharded by user, so a part holds all of its users'
+    # records from this stretch of the file.
+    aggregator = AlertAggregator()
+    delta = new_delta() if COMBINED else None
+    for i, record, username, actor_type in items:
+        evaluate_record(i, record, username, actor_type, baselines, aggregator.write_alert)
+        if delta is not None:
+            observe_record(delta, record, username, actor_type)
+    aggregator.flush()
+    with metrics.timed("alert_flush"):
+        if not flush_alerts():
+            raise RuntimeError("alert flush failed")
+    # Stage times are reported back; the metrics endpoint lives in the parent.
+    # The part's delta is applied by the parent once the whole file is in.
+    return {
+        "records": len(items), "users": len(baselines), "alerts": alert_buffer.added - alerts_before,
+        "stages": metrics.since(snap), "delta": delta
+    }
 
-            if should_suppress_actor(actor_type, SUPPRESSED_ACTOR_TYPES):
-                print(f"[SKIP] Suppressed actor type: {actor_type} ({username})", flush=True)
+def dispatch_log_file(pool, bucket, key, truncated):
+    job_id = pool.start_job()
+    try:
+        log.info("Dispatching S3 object: %s/%s", bucket, key)
+        stats = {}
+        for i, record in enumerate(open_records(s3, bucket, key, stats)):
+            t0 = time.perf_counter()
+            username, actor_type = classify_identity(record.get("userIdentity", {}))
+            _identity_timer.seconds += time.perf_counter() - t0
+            _identity_timer.calls += 1
+            # Records that are skipped anyway are not worth shipping to a worker.
+            if should_suppress_actor(actor_type, SUPPRESSED_ACTOR_TYPES) or _is_unknown_actor(username, actor_type):
+                evaluate_record(i, record, username, actor_type, {})
                 continue
+            pool.submit(job_id, username, (i, record, username, actor_type))
+        log.debug("Streamed %s/%s: %s", bucket, key, format_stats(stats))
+    except Exception as e:
+        log.error("Failed to dispatch log file %s: %s", key, e)
+        truncated.append(job_id)
+    metrics.add_reader_stats(stats)
+    pool.finish_job(job_id)
+    return job_id
 
-            if actor_type == "unknown" or not username or username == "unknown":
-                try:
-                    print(f"[DEBUG] Raw userIdentity for unknown: {json.dumps(identity)}", flush=True)
-                except Exception:
-                    print("[DEBUG] Raw userIdentity for unknown: <unserializable>", flush=True)
-                print(f"[SKIP] Unknown actor identity — skipping detection", flush=True)
-                continue
+def _message_objects(msg):
+    body = json.loads(msg["Body"])
+    msg_data = json.loads(body["Message"])
 
-            user_agent = record.get("userAgent", "unknown")
-            source_ip  = record.get("sourceIPAddress", "unknown")
-            print(f"[DEBUG] User: {username}, Agent: {user_agent}", flush=True)
+    objects = []
+    for record in msg_data.get("Records", []):
+        bucket = record["s3"]["bucket"]["name"]
+        key = record["s3"]["object"]["key"]
+        etag = record["s3"]["object"].get("eTag")
+        log.debug("Extracted bucket/key: %s/%s", bucket, key)
+        objects.append((bucket, key, etag))
+    return objects
 
-            if is_suppressed(username, user_agent):
-                print(f"[SKIP] Suppressed {username}/{user_agent}", flush=True)
-                continue
+def _claim(bucket, key, etag):
+    # True when this consumer should process the object now; False when it
+    # was already processed (skip it) or None when another consumer holds it
+    # (leave the message for redelivery).
+    status = ledger.claim(bucket, key, etag)
+    if status == DONE:
+        log.info("Skipping already processed object: %s/%s", bucket, key)
+        return False
+    if status == BUSY:
+        log.info("Object is being processed elsewhere: %s/%s", bucket, key)
+        return None
+    return True
 
-            baseline_resp = table.get_item(Key={"username": username})
-            baseline = baseline_resp.get("Item", {})
-
-            if not baseline:
-                print(f"[INFO] New actor detected (no baseline): {username}", flush=True)
-                write_alert(
-                    alert_type="New User Activity",
-                    metadata={
-                        "severity": "info",
-                        "category": "iam",
-                        "actor_type": actor_type,
-                        "timestamp": record.get("eventTime")
-                    },
-                    details={
-                        "user": username,
-                        "event": record.get("eventName"),
-                        "source_ip": source_ip,
-                        "user_agent": user_agent
-                    }
-                )
-                continue
+def _settle(bucket, key, etag, ok):
+    if ok:
+        ledger.complete(bucket, key, etag)
+    else:
+        ledger.release(bucket, key, etag)
 
-            if is_in_burn_in_period(baseline):
-                print(f"[SUPPRESS] {username} is in burn-in period — skipping detection", flush=True)
-                continue
+def handle_log_file(bucket, key, etag):
+    claimed = _claim(bucket, key, etag)
+    if not claimed:
+        return claimed is False
+    ok = process_log_file(bucket, key)
+    _settle(bucket, key, etag, ok)
+    return ok
 
-            evt_ts = record.get("eventTime")
-            if evt_ts:
-                try:
-                    evt_hour = datetime.fromisoformat(evt_ts.replace("Z", "+00:00")).hour
-                    trusted_hours = get_baselined_hours_ns(baseline)
-
-                    if trusted_hours and (evt_hour not in trusted_hours):
-                        candidates = (baseline.get("candidates") or {}).get("work_hours_utc", {})
-                        hour_key = str(evt_hour).zfill(2)
-                        if hour_key not in candidates:
-                            write_alert(
-                                alert_type="Off-hours Activity",
-                                metadata={
-                                    "severity": "medium",
-                                    "category": "behavior",
-                                    "actor_type": actor_type,
-                                    "timestamp": evt_ts,
-                                },
-                                details={
-                                    "user": username,
-                                    "event": record.get("eventName"),
-                                    "event_hour_utc": evt_hour,
-                                    "trusted_hours_utc": sorted(trusted_hours),
-                                    "source_ip": record.get("sourceIPAddress", "unknown"),
-                                    "user_agent": record.get("userAgent", "unknown"),
-                                }
-                            )
-                except Exception:
-                    pass
-
-            detect_assume_role(record, baseline, write_alert, username)
-            detect_privilege_escalation(record, baseline, write_alert, username)
-            detect_s3_exposure(record, baseline, write_alert, username)
-            detect_blocked_action(record, baseline, write_alert, username)
-            detect_user_behavior_anomaly(record, baseline, write_alert, username)
-            detect_unseen_action(record, baseline, write_alert, username)
+# Pipeline hooks (see utils/pipeline.py): the same per-file steps as
+# handle_log_file, split across the pipeline's threads.
+
+def _fetch_object(bucket, key):
+    return s3.get_object(Bucket=bucket, Key=key)["Body"]
+
+def _claim_task(task):
+    return _claim(task.bucket, task.key, task.etag)
 
+def _evaluate_task(task, batches):
+    snap = metrics.snapshot()
+    alerts_since = alert_buffer.added
+    baselines = {}
+    counts = {"records": 0}
+    aggregator = AlertAggregator()
+    delta = new_delta() if COMBINED else None
+    read_ok = True
+    try:
+        log.info("Processing S3 object: %s/%s", task.bucket, task.key)
+        _evaluate_batches(batches, baselines, counts, aggregator.write_alert, delta)
+        _log_file_stats(task.bucket, task.key, task.stats)
     except Exception as e:
-        print(f"[ERROR] Failed to process log file {key}: {e}", flush=True)
+        log.error("Failed to process log file %s: %s", task.key, e)
+        delta = None
+        read_ok = False
+    aggregator.flush()
+    if delta:
+        # On the evaluator thread rather than the sink, so the next file is
+        # not evaluated until this one's delta is in.
+        read_ok = apply_file_delta(delta)
+    return {
+        "records": counts["records"], "users": len(baselines), "read_ok": read_ok,
+        "alerts": (alerts_since, alert_buffer.added), "stages": metrics.since(snap, exclude=metrics.READER_STAGES)
+    }
 
-def main():
-    print("[BOOT] Detection engine started. Polling SQS...", flush=True)
-    while True:
+def _finish_task(task, result):
+    if result is None:
+        ledger.release(task.bucket, task.key, task.etag)
+        return False
+    metrics.add_reader_stats(task.stats)
+    since, until = result["alerts"]
+    with metrics.timed("alert_flush"):
+        ok = alert_buffer.wait_until(since, until) and result["read_ok"]
+    _settle(task.bucket, task.key, task.etag, ok)
+    stages = {**result["stages"], **metrics.reader_stages(task.stats)}
+    _report_file(
+        task.bucket, task.key, stages, result["records"], result["users"],
+        until - since, time.monotonic() - task.started, ok
+    )
+    return ok
+
+def _settle_message(consumer, msg, ok):
+    if ok:
+        consumer.ack(msg)
+        return
+    log.error("Not all objects completed, leaving message for redelivery")
+    consumer.release(msg)
+
+def _collect_jobs(pool, pending, consumer):
+    for msg, jobs, claims, redeliver, truncated, started, stages in pending:
         try:
-            print("[DEBUG] Polling SQS queue...", flush=True)
-            resp = sqs.receive_message(
-                QueueUrl=QUEUE_URL,
-                MaxNumberOfMessages=10,
-                WaitTimeSeconds=20
+            totals = {"records": 0, "users": 0, "alerts": 0}
+            failed = []
+            for job_id in jobs:
+                results, errors = pool.wait(job_id)
+                delta = new_delta()
+                # Shards never share a user, so per-shard user counts add up.
+                for r in results:
+                    for k in totals:
+                        totals[k] += r.get(k, 0)
+                    if r.get("delta"):
+                        merge_delta(delta, r["delta"])
+                    worker_stages = r.get("stages", {})
+                    metrics.merge_times(worker_stages)
+                    for stage, seconds in worker_stages.items():
+                        stages[stage] = stages.get(stage, 0.0) + seconds
+                failed.extend(errors)
+                # One delta per file, only for files read and evaluated in
+                # full; workers may still hold cached views from before it.
+                if delta and not errors and job_id not in truncated and not apply_file_delta(delta):
+                    failed.append("baseline delta write failed")
+
+            with metrics.timed("alert_flush"):
+                if not flush_alerts():
+                    failed.append("alert flush failed")
+            elapsed = time.monotonic() - started
+            metrics.observe_file(stages, totals["records"], elapsed, totals["alerts"], not failed)
+            log_summary(
+                "detection", objects=len(jobs), workers=pool.workers, **totals,
+                elapsed_s=round(elapsed, 3), ok=not failed
             )
-            messages = resp.get("Messages", [])
-            print(f"[DEBUG] Retrieved {len(messages)} messages", flush=True)
+            if failed:
+                log.error("Worker failures, leaving message for redelivery: %s", failed)
+                for obj in claims:
+                    ledger.release(*obj)
+                consumer.release(msg)
+                continue
+            for obj in claims:
+                ledger.complete(*obj)
+            if redeliver:
+                # Another consumer still holds one of this message's objects;
+                # come back after a visibility timeout instead of right away.
+                log.info("Leaving message for redelivery until all objects complete")
+                consumer.release(msg, delay=consumer.visibility_timeout)
+                continue
+            consumer.ack(msg)
+        except Exception as e:
+            log.error("Failed to process message: %s", e)
+            consumer.release(msg)
 
+def main():
+    log.info("Detection engine started. Polling SQS...")
+    if COMBINED:
+        log.info("Combined mode: applying baseline deltas from this engine")
+    metrics.start_http_server()
+    if baseline_store is not baseline_source:
+        ReplicaSync(baseline_source, baseline_store).start()
+    pool = None
+    pipeline = None
+    if WORKERS > 1:
+        pool = ShardedWorkerPool(WORKERS, evaluate_shard, init=init_worker, part_size=WORKER_PART_SIZE)
+        log.info("Started %d sharded detection workers", WORKERS)
+    elif PIPELINE_ENABLED:
+        pipeline = FilePipeline(_fetch_object, _claim_task, _evaluate_task, _finish_task)
+
+    # The consumer keeps receiving (and extending in-flight messages) in the
+    # background, so the next batch is ready as soon as this one is done.
+    consumer = SqsConsumer(sqs, QUEUE_URL)
+    try:
+        while True:
+            messages = consumer.get_batch()
+            log.debug("Retrieved %d messages", len(messages))
+
+            # With workers, every file in the batch is dispatched before any
+            # result is awaited, so one slow file does not stall the others.
+            pending = []
             for msg in messages:
                 try:
-                    body = json.loads(msg["Body"])
-                    msg_data = json.loads(body["Message"])
-
-                    for record in msg_data.get("Records", []):
-                        bucket = record["s3"]["bucket"]["name"]
-                        key = record["s3"]["object"]["key"]
-                        print(f"[DEBUG] Extracted bucket/key: {bucket}/{key}", flush=True)
-                        process_log_file(bucket, key)
-
-                    print(f"[DEBUG] Deleting message from SQS", flush=True)
-                    sqs.delete_message(
-                        QueueUrl=QUEUE_URL,
-                        ReceiptHandle=msg["ReceiptHandle"]
-                    )
+                    metrics.observe_queue_lag(msg)
+                    objects = _message_objects(msg)
+                    if pool:
+                        started = time.monotonic()
+                        snap = metrics.snapshot()
+                        claims = []
+                        redeliver = False
+                        truncated = []
+                        for obj in objects:
+                            claimed = _claim(*obj)
+                            if claimed:
+                                claims.append(obj)
+                            elif claimed is None:
+                                redeliver = True
+                        jobs = [dispatch_log_file(pool, b, k, truncated) for b, k, _ in claims]
+                        pending.append((msg, jobs, claims, redeliver, truncated, started, metrics.since(snap)))
+                        continue
+
+                    if pipeline:
+                        # Settled from the pipeline's sink thread once every
+                        # object of the message is done.
+                        group = TaskGroup(len(objects), lambda ok, msg=msg: _settle_message(consumer, msg, ok))
+                        for obj in objects:
+                            pipeline.submit(*obj, group.task_done)
+                        continue
+
+                    results = [handle_log_file(*obj) for obj in objects]
+                    _settle_message(consumer, msg, all(results))
                 except Exception as e:
-                    print(f"[ERROR] Failed to process message: {e}", flush=True)
+                    log.error("Failed to process message: %s", e)
+                    consumer.release(msg)
 
-        except Exception as e:
-            print(f"[ERROR] SQS polling failed: {e}", flush=True)
+            if pool:
+                _collect_jobs(pool, pending, consumer)
+    finally:
+        consumer.close()
 
 if __name__ == "__main__":
     main()
@@ -1,25 +1,24 @@
-def detect_assume_role(record, baseline, write_alert, username):
-    event_name = record.get("eventName")
-    if event_name != "AssumeRole":
-        return
+from detection_rules.registry import rule
+from utils.log import get_logger
 
-    identity = record.get("userIdentity", {})
-    source_ip = record.get("sourceIPAddress", "unknown")
-    region = record.get("awsRegion", "unknown")
-    user_agent = record.get("userAgent", "unknown")
-    event_time = record.get("eventTime")
-    role_arn = record.get("requestParameters", {}).get("roleArn", "")
-    principal_arn = identity.get("arn", "")
+log = get_logger("rules")
 
-    alerts = []
+@rule(event_names=["AssumeRole"])
+def detect_assume_role(view, baseline, write_alert, username):
+    source_ip = view.source_ip
+    region = view.region
+    user_agent = view.user_agent
+    event_time = view.event_time
+    role_arn = view.request_parameters.get("roleArn", "")
+    principal_arn = view.identity.get("arn", "")
 
-    candidates = baseline.get("candidates", {})
+    alerts = []
 
-    def is_candidate(field, value):
-        return value in candidates.get(field, {})
+    is_ip_untrusted = not baseline.is_known("known_ips", source_ip)
+    is_agent_untrusted = not baseline.is_known("user_agents", user_agent)
 
     # Unknown IP
-    if source_ip not in baseline.get("known_ips", []) and not is_candidate("known_ips", source_ip):
+    if is_ip_untrusted:
         alerts.append({
             "alert_type": "AssumeRole from Unknown IP",
             "severity": "high",
@@ -27,7 +26,7 @@ def detect_assume_role(record, baseline, write_alert, username):
         })
 
     # Unknown Agent
-    if user_agent not in baseline.get("user_agents", []) and not is_candidate("user_agents", user_agent):
+    if is_agent_untrusted:
         alerts.append({
             "alert_type": "AssumeRole from Unknown Agent",
             "severity": "medium",
@@ -35,7 +34,7 @@ def detect_assume_role(record, baseline, write_alert, username):
         })
 
     # Unknown RoleArn
-    if role_arn and role_arn not in baseline.get("assumed_roles", []) and not is_candidate("assumed_roles", role_arn):
+    if role_arn and not baseline.is_known("assumed_roles", role_arn):
         alerts.append({
             "alert_type": "New Assumed Role",
             "severity": "medium",
@@ -48,8 +47,6 @@ def detect_assume_role(record, baseline, write_alert, username):
         user_account = principal_arn.split(":")[4]
 
         is_cross_account = role_account != user_account
-        is_ip_untrusted = source_ip not in baseline.get("known_ips", []) and not is_candidate("known_ips", source_ip)
-        is_agent_untrusted = user_agent not in baseline.get("user_agents", []) and not is_candidate("user_agents", user_agent)
 
         if is_cross_account and (is_ip_untrusted or is_agent_untrusted):
             alerts.append({
@@ -62,10 +59,10 @@ def detect_assume_role(record, baseline, write_alert, username):
             })
 
     except Exception as e:
-        print(f"[ERROR] Failed to parse account IDs for AssumeRole check: {e}", flush=True)
+        log.error("Failed to parse account IDs for AssumeRole check: %s", e)
 
     for alert in alerts:
-        print(f"[ALERT] {alert['alert_type']} - {alert['reason']}", flush=True)
+        log.info("%s - %s", alert["alert_type"], alert["reason"])
         write_alert(
             alert_type=alert["alert_type"],
             metadata={
@@ -83,4 +80,3 @@ def detect_assume_role(record, baseline, write_alert, username):
                 "region": region
             }
         )
-
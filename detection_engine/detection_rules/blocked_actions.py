@@ -1,40 +1,31 @@
-def detect_blocked_action(record, baseline, write_alert, username):
-    error_code = record.get("errorCode")
-    if error_code != "AccessDenied":
-        return
+from detection_rules.registry import rule
+from utils.suppression import is_blocked_action_suppressed
+from utils.windowed_state import SlidingWindowCounter, burst_config
+from utils.log import get_logger
+
+log = get_logger("rules")
+
+DENIAL_CODES = [
+    "AccessDenied",
+    "AccessDeniedException",
+    "UnauthorizedOperation",
+    "Client.UnauthorizedOperation"
+]
 
-    source_ip = record.get("sourceIPAddress", "unknown")
-    region = record.get("awsRegion", "unknown")
-    event_time = record.get("eventTime")
-    service = record.get("eventSource", "unknown").replace(".amazonaws.com", "")
-    event_name = record.get("eventName", "unknown")
-    action_key = f"{service}:{event_name}"
-
-    # Suppression list for noisy AccessDenied events
-    SUPPRESSED_BLOCKED_EVENTS = [
-        "ec2:Describe*", "ec2:Get*", "ec2:List*",
-        "s3:Get*", "s3:List*", "s3:Head*",
-        "iam:List*", "iam:Get*",
-        "cloudwatch:Get*", "cloudwatch:List*",
-        "logs:Get*", "logs:Describe*", "logs:List*",
-        "cloudtrail:Get*", "cloudtrail:List*",
-        "config:List*", "config:Get*",
-        "sts:GetCallerIdentity"
-    ]
-
-    def is_suppressed_blocked_event(action_key):
-        for suppressed in SUPPRESSED_BLOCKED_EVENTS:
-            if suppressed.endswith("*"):
-                if action_key.startswith(suppressed[:-1]):
-                    return True
-            elif action_key == suppressed:
-                return True
-        return False
-
-    if is_suppressed_blocked_event(action_key):
+@rule(error_codes=["AccessDenied"])
+def detect_blocked_action(view, baseline, write_alert, username):
+    error_code = view.error_code
+    source_ip = view.source_ip
+    region = view.region
+    event_time = view.event_time
+    service = view.service
+    event_name = view.event_name
+    action_key = view.action_key
+
+    if is_blocked_action_suppressed(action_key, username):
         return
 
-    print(f"[ALERT] Blocked action detected: {action_key} by {username}", flush=True)
+    log.info("Blocked action detected: %s by %s", action_key, username)
 
     write_alert(
         alert_type="Blocked Action",
@@ -55,3 +46,36 @@ def detect_blocked_action(record, baseline, write_alert, username):
         }
     )
 
+BURST_CFG = burst_config("access_denied", window_seconds=120, threshold=50)
+denials = SlidingWindowCounter(BURST_CFG["window_seconds"], name="access_denied")
+
+# Suppressed actions still count: a sweep of denied Describe calls is
+# enumeration even when each one alone is noise.
+@rule(error_codes=DENIAL_CODES, gated=False)
+def detect_access_denied_burst(view, baseline, write_alert, username):
+    if view.event_ts is None:
+        return
+    total = denials.hit(username, view.event_ts, BURST_CFG["threshold"])
+    if not total:
+        return
+
+    log.info("Access denied burst: %d denials by %s", total, username)
+
+    write_alert(
+        alert_type="Access Denied Burst",
+        metadata={
+            "severity": "medium",
+            "category": "iam",
+            "actor_type": "human",
+            "timestamp": view.event_time
+        },
+        details={
+            "user": username,
+            "events_in_window": total,
+            "window_seconds": BURST_CFG["window_seconds"],
+            "last_action_key": view.action_key,
+            "source_ip": view.source_ip,
+            "region": view.region,
+            "error_code": view.error_code
+        }
+    )
@@ -1,37 +1,35 @@
-def detect_privilege_escalation(record, baseline, write_alert, username):
-    event_name = record.get("eventName")
-    event_time_str = record.get("eventTime")
-    source_ip = record.get("sourceIPAddress", "unknown")
-    user_agent = record.get("userAgent", "unknown")
-    service = record.get("eventSource", "unknown").replace(".amazonaws.com", "")
-    action_key = f"{service}:{event_name}"
-
-    suspicious_actions = {
-        "iam:AttachUserPolicy",
-        "iam:AttachGroupPolicy",
-        "iam:AttachRolePolicy",
-        "iam:PutUserPolicy",
-        "iam:PutGroupPolicy",
-        "iam:PutRolePolicy",
-        "iam:CreateAccessKey",
-        "iam:CreatePolicy",
-        "iam:UpdateAssumeRolePolicy"
-    }
-
-    if action_key not in suspicious_actions:
-        return
+from detection_rules.registry import rule
+from utils.windowed_state import SlidingWindowCounter, burst_config
+from utils.log import get_logger
+
+log = get_logger("rules")
 
-    candidates = baseline.get("candidates", {})
+SUSPICIOUS_ACTIONS = {
+    "AttachUserPolicy",
+    "AttachGroupPolicy",
+    "AttachRolePolicy",
+    "PutUserPolicy",
+    "PutGroupPolicy",
+    "PutRolePolicy",
+    "CreateAccessKey",
+    "CreatePolicy",
+    "UpdateAssumeRolePolicy"
+}
 
-    def is_candidate(field, value):
-        return value in candidates.get(field, {})
+@rule(event_sources=["iam.amazonaws.com"], event_names=SUSPICIOUS_ACTIONS)
+def detect_privilege_escalation(view, baseline, write_alert, username):
+    event_name = view.event_name
+    event_time_str = view.event_time
+    source_ip = view.source_ip
+    user_agent = view.user_agent
+    action_key = view.action_key
 
-    is_ip_untrusted = source_ip not in baseline.get("known_ips", []) and not is_candidate("known_ips", source_ip)
-    is_agent_untrusted = user_agent not in baseline.get("user_agents", []) and not is_candidate("user_agents", user_agent)
-    is_action_unusual = action_key not in baseline.get("actions", []) and not is_candidate("actions", action_key)
+    is_ip_untrusted = not baseline.is_known("known_ips", source_ip)
+    is_agent_untrusted = not baseline.is_known("user_agents", user_agent)
+    is_action_unusual = not baseline.is_known("actions", action_key)
 
     if is_ip_untrusted or is_agent_untrusted or is_action_unusual:
-        print(f"[ALERT] Suspicious privilege escalation by {username}: {action_key}", flush=True)
+        log.info("Suspicious privilege escalation by %s: %s", username, action_key)
         write_alert(
             alert_type="Suspicious Privilege Escalation",
             metadata={
@@ -52,3 +50,34 @@ def detect_privilege_escalation(record, baseline, write_alert, username):
             }
         )
 
+BURST_CFG = burst_config("privilege_escalation", window_seconds=300, threshold=10)
+escalations = SlidingWindowCounter(BURST_CFG["window_seconds"], name="privilege_escalation")
+
+# Counts every attempt, trusted or not: ten policy attachments in a few
+# minutes from a known laptop is still worth a look.
+@rule(event_sources=["iam.amazonaws.com"], event_names=SUSPICIOUS_ACTIONS, gated=False)
+def detect_privilege_escalation_burst(view, baseline, write_alert, username):
+    if view.event_ts is None:
+        return
+    total = escalations.hit(username, view.event_ts, BURST_CFG["threshold"])
+    if not total:
+        return
+
+    log.info("Privilege escalation burst: %d calls by %s", total, username)
+    write_alert(
+        alert_type="Privilege Escalation Burst",
+        metadata={
+            "severity": "high",
+            "category": "iam",
+            "actor_type": "human",
+            "timestamp": view.event_time
+        },
+        details={
+            "user": username,
+            "events_in_window": total,
+            "window_seconds": BURST_CFG["window_seconds"],
+            "last_action_key": view.action_key,
+            "source_ip": view.source_ip,
+            "error_code": view.error_code
+        }
+    )
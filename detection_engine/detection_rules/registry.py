@@ -0,0 +1,139 @@
+import importlib
+import time
+from datetime import datetime
+
+from utils import metrics
+
+_perf_counter = time.perf_counter
+
+# Imported in this order; rules run in registration order for every record.
+RULE_MODULES = [
+    "detection_rules.assume_role",
+    "detection_rules.privilege_escalation",
+    "detection_rules.s3_exposure",
+    "detection_rules.blocked_actions",
+    "detection_rules.user_behavior",
+    "detection_rules.unseen_action"
+]
+
+class RecordView:
+    # Everything the rules derive from a raw CloudTrail record, computed once.
+    __slots__ = (
+        "record", "identity", "event_name", "event_source", "service", "action_key",
+        "error_code", "source_ip", "user_agent", "region", "event_time",
+        "event_hour", "event_ts", "hour_key", "hour_error", "request_parameters"
+    )
+
+    def __init__(self, record):
+        self.record = record
+        self.identity = record.get("userIdentity", {}) or {}
+        self.event_name = record.get("eventName")
+        self.event_source = record.get("eventSource", "unknown")
+        self.service = self.event_source.replace(".amazonaws.com", "")
+        self.action_key = f"{self.service}:{self.event_name}"
+        self.error_code = record.get("errorCode")
+        self.source_ip = record.get("sourceIPAddress", "unknown")
+        self.user_agent = record.get("userAgent", "unknown")
+        self.region = record.get("awsRegion", "unknown")
+        self.event_time = record.get("eventTime")
+        self.request_parameters = record.get("requestParameters") or {}
+
+        self.event_hour = None
+        self.event_ts = None
+        self.hour_key = None
+        self.hour_error = None
+        try:
+            parsed = datetime.fromisoformat((self.event_time or "").replace("Z", "+00:00"))
+            self.event_hour = parsed.hour
+            self.event_ts = parsed.timestamp()
+            self.hour_key = str(self.event_hour).zfill(2)
+        except Exception as e:
+            self.hour_error = e
+
+class RuleSpec:
+    __slots__ = ("fn", "timer", "order", "event_names", "event_sources", "error_codes", "gated")
+
+    def __init__(self, fn, order, event_names, event_sources, error_codes, gated=True):
+        self.fn = fn
+        self.timer = metrics.stage_timer(f"rule.{fn.__module__.rsplit('.', 1)[-1]}")
+        self.order = order
+        self.event_names = event_names
+        self.event_sources = event_sources
+        self.error_codes = error_codes
+        self.gated = gated
+
+    def matches(self, view):
+        return (
+            (self.event_names is None or view.event_name in self.event_names)
+            and (self.event_sources is None or view.event_source in self.event_sources)
+            and (self.error_codes is None or view.error_code in self.error_codes)
+        )
+
+_RULES = []
+_BY_EVENT_NAME = {}
+_BY_ERROR_CODE = {}
+_BY_EVENT_SOURCE = {}
+_CATCH_ALL = []
+_DISPATCH = {}
+
+def rule(event_names=None, event_sources=None, error_codes=None, gated=True):
+    # gated=False rules run for every principal, before the baseline checks
+    # (no baseline yet, burn-in); they are called with baseline=None when the
+    # principal has none.
+    def register(fn):
+        spec = RuleSpec(
+            fn,
+            len(_RULES),
+            frozenset(event_names) if event_names else None,
+            frozenset(event_sources) if event_sources else None,
+            frozenset(error_codes) if error_codes else None,
+            gated
+        )
+        _RULES.append(spec)
+
+        # Index each rule under its most selective declared filter.
+        if spec.event_names:
+            for name in spec.event_names:
+                _BY_EVENT_NAME.setdefault(name, []).append(spec)
+        elif spec.error_codes:
+            for code in spec.error_codes:
+                _BY_ERROR_CODE.setdefault(code, []).append(spec)
+        elif spec.event_sources:
+            for source in spec.event_sources:
+                _BY_EVENT_SOURCE.setdefault(source, []).append(spec)
+        else:
+            _CATCH_ALL.append(spec)
+
+        _DISPATCH.clear()
+        return fn
+    return register
+
+def load_rules():
+    for module in RULE_MODULES:
+        importlib.import_module(module)
+    return [spec.fn for spec in _RULES]
+
+def rules_for(view, gated=True):
+    key = (view.event_name, view.event_source, view.error_code, gated)
+    specs = _DISPATCH.get(key)
+    if specs is None:
+        found = (
+            _BY_EVENT_NAME.get(view.event_name, [])
+            + _BY_ERROR_CODE.get(view.error_code, [])
+            + _BY_EVENT_SOURCE.get(view.event_source, [])
+            + _CATCH_ALL
+        )
+        specs = sorted((s for s in found if s.gated == gated and s.matches(view)), key=lambda s: s.order)
+        _DISPATCH[key] = specs
+    return specs
+
+def evaluate_rules(view, baseline, write_alert, username, gated=True):
+    if not metrics.RULE_TIMING:
+        for spec in rules_for(view, gated):
+            spec.fn(view, baseline, write_alert, username)
+        return
+    for spec in rules_for(view, gated):
+        started = _perf_counter()
+        spec.fn(view, baseline, write_alert, username)
+        spec.timer.seconds += _perf_counter() - started
+        spec.timer.calls += 1
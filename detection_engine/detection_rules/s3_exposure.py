@@ -1,32 +1,29 @@
-def detect_s3_exposure(record, baseline, write_alert, username):
-    event_name = record.get("eventName")
-    source_ip = record.get("sourceIPAddress", "unknown")
-    user_agent = record.get("userAgent", "unknown")
-    region = record.get("awsRegion", "unknown")
-    event_time = record.get("eventTime")
-    service = record.get("eventSource", "unknown").replace(".amazonaws.com", "")
-    action_key = f"{service}:{event_name}"
+from detection_rules.registry import rule
+from utils.log import get_logger
 
-    risky_events = {
-        "s3:PutBucketPolicy",
-        "s3:PutBucketAcl",
-        "s3:PutObjectAcl"
-    }
+log = get_logger("rules")
 
-    if action_key not in risky_events:
-        return
+RISKY_EVENTS = {
+    "PutBucketPolicy",
+    "PutBucketAcl",
+    "PutObjectAcl"
+}
 
-    candidates = baseline.get("candidates", {})
+@rule(event_sources=["s3.amazonaws.com"], event_names=RISKY_EVENTS)
+def detect_s3_exposure(view, baseline, write_alert, username):
+    event_name = view.event_name
+    source_ip = view.source_ip
+    user_agent = view.user_agent
+    region = view.region
+    event_time = view.event_time
+    action_key = view.action_key
 
-    def is_candidate(field, value):
-        return value in candidates.get(field, {})
-
-    is_ip_untrusted = source_ip not in baseline.get("known_ips", []) and not is_candidate("known_ips", source_ip)
-    is_agent_untrusted = user_agent not in baseline.get("user_agents", []) and not is_candidate("user_agents", user_agent)
-    is_action_unusual = action_key not in baseline.get("actions", []) and not is_candidate("actions", action_key)
+    is_ip_untrusted = not baseline.is_known("known_ips", source_ip)
+    is_agent_untrusted = not baseline.is_known("user_agents", user_agent)
+    is_action_unusual = not baseline.is_known("actions", action_key)
 
     if is_ip_untrusted or is_agent_untrusted or is_action_unusual:
-        print(f"[ALERT] Suspicious S3 exposure: {action_key} by {username}", flush=True)
+        log.info("Suspicious S3 exposure: %s by %s", action_key, username)
         write_alert(
             alert_type="Suspicious S3 Exposure",
             metadata={
@@ -47,4 +44,3 @@ def detect_s3_exposure(record, baseline, write_alert, username):
                 "action_baselined": not is_action_unusual
             }
         )
-
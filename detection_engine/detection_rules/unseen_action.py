@@ -1,30 +1,27 @@
-def detect_unseen_action(record, baseline, write_alert, username):
-    event_name = record.get("eventName")
-    service = record.get("eventSource", "unknown").replace(".amazonaws.com", "")
-    service_action = f"{service}:{event_name}"
+from detection_rules.registry import rule
+from utils.log import get_logger
 
-    trusted_actions = baseline.get("actions", [])
-    candidates = baseline.get("candidates", {})
+log = get_logger("rules")
 
-    def is_candidate(field, value):
-        return value in candidates.get(field, {})
+@rule()
+def detect_unseen_action(view, baseline, write_alert, username):
+    service_action = view.action_key
 
-    if service_action not in trusted_actions and not is_candidate("actions", service_action):
-        print(f"[ALERT] Unseen API action by {username}: {service_action}", flush=True)
+    if not baseline.is_known("actions", service_action):
+        log.info("Unseen API action by %s: %s", username, service_action)
         write_alert(
             alert_type="Unseen API Action",
             metadata={
                 "severity": "low",
                 "category": "iam",
                 "actor_type": "human",
-                "timestamp": record.get("eventTime")
+                "timestamp": view.event_time
             },
             details={
                 "user": username,
                 "action": service_action,
-                "ip": record.get("sourceIPAddress", "unknown"),
-                "region": record.get("awsRegion", "unknown"),
-                "user_agent": record.get("userAgent", "unknown")
+                "ip": view.source_ip,
+                "region": view.region,
+                "user_agent": view.user_agent
             }
         )
-
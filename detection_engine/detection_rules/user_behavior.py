@@ -1,64 +1,45 @@
-from datetime import datetime
-from decimal import Decimal
+from detection_rules.registry import rule
+from utils.log import get_logger
 
-def _trusted_hours_from_ns(baseline_item):
-    out = set()
-    ns = baseline_item.get("work_hours_utc_ns")
-    if not ns:
-        return out
+log = get_logger("rules")
 
-    if isinstance(ns, set):
-        for h in ns:
-            out.add(int(h) if not isinstance(h, Decimal) else int(h))
-    elif isinstance(ns, list):
-        for h in ns:
-            out.add(int(h) if not isinstance(h, Decimal) else int(h))
-    return out
-
-
-def detect_user_behavior_anomaly(record, baseline, write_alert, username):
-    event_name  = record.get("eventName", "unknown")
-    timestamp   = record.get("eventTime", "")
-    source_ip   = record.get("sourceIPAddress", "unknown")
-    user_agent  = record.get("userAgent", "unknown")
-    region      = record.get("awsRegion", "unknown")
-    service     = record.get("eventSource", "unknown")
+@rule()
+def detect_user_behavior_anomaly(view, baseline, write_alert, username):
+    event_name  = view.event_name if view.event_name is not None else "unknown"
+    timestamp   = view.event_time if view.event_time is not None else ""
+    source_ip   = view.source_ip
+    user_agent  = view.user_agent
+    region      = view.region
+    service     = view.event_source
 
     anomalies = []
-    candidates = baseline.get("candidates", {}) or {}
-
-    def is_candidate(field, value):
-        return value in (candidates.get(field, {}) or {})
 
-    event_hour = None
-    hour_key = None
-    try:
-        event_hour = datetime.fromisoformat(timestamp.replace("Z", "+00:00")).hour
-        hour_key = str(event_hour).zfill(2)
-    except Exception as e:
-        print(f"[WARN] Failed to parse hour from timestamp: {e}", flush=True)
+    event_hour = view.event_hour
+    hour_key = view.hour_key
+    if view.hour_error is not None:
+        log.warning("Failed to parse hour from timestamp: %s", view.hour_error)
 
-    if source_ip and source_ip not in (baseline.get("known_ips", []) or []) and not is_candidate("known_ips", source_ip):
+    if source_ip and not baseline.is_known("known_ips", source_ip):
         anomalies.append(("sourceIPAddress", source_ip))
 
-    if user_agent and user_agent not in (baseline.get("user_agents", []) or []) and not is_candidate("user_agents", user_agent):
+    if user_agent and not baseline.is_known("user_agents", user_agent):
         anomalies.append(("userAgent", user_agent))
 
-    if region and region not in (baseline.get("regions", []) or []) and not is_candidate("regions", region):
+    if region and not baseline.is_known("regions", region):
         anomalies.append(("awsRegion", region))
 
-    if service and service not in (baseline.get("services", []) or []) and not is_candidate("services", service):
+    if service and not baseline.is_known("services", service):
         anomalies.append(("eventSource", service))
 
     if event_hour is not None:
-        trusted_hours = _trusted_hours_from_ns(baseline)
+        trusted_hours = baseline.trusted_hours
         if trusted_hours:
-            hour_is_candidate = hour_key in (candidates.get("work_hours_utc", {}) or {})
+            hour_is_candidate = baseline.is_candidate("work_hours_utc", hour_key)
             if (event_hour not in trusted_hours) and not hour_is_candidate:
                 anomalies.append(("work_hours_utc", hour_key))
 
     if anomalies:
-        print(f"[ALERT] User behavior anomaly detected for {username}: {anomalies}", flush=True)
+        log.info("User behavior anomaly detected for %s: %s", username, anomalies)
         write_alert(
             alert_type="User Behavior Anomaly",
             metadata={
@@ -0,0 +1,9 @@
+import os
+import sys
+
+ENGINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Engine modules load config.yaml from the working directory when imported;
+# run as `python -m pytest tests` from the engine directory.
+os.chdir(ENGINE_DIR)
+sys.path.insert(0, ENGINE_DIR)
@@ -0,0 +1,127 @@
+from utils import baseline_cache
+from utils.baseline_cache import BaselineCache
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def make_cache(monkeypatch, items, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(baseline_cache.time, "monotonic", clock)
+    fetches = []
+
+    def fetch(username):
+        fetches.append(username)
+        return items.get(username)
+
+    return BaselineCache(fetch, **kwargs), fetches, clock
+
+def test_hit_within_ttl(monkeypatch):
+    cache, fetches, clock = make_cache(monkeypatch, {"alice": {"username": "alice"}}, ttl_seconds=60)
+    assert cache.get("alice") == {"username": "alice"}
+    clock.now += 59
+    assert cache.get("alice") == {"username": "alice"}
+    assert fetches == ["alice"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_expired_entry_is_refetched(monkeypatch):
+    items = {"alice": {"username": "alice", "n": 1}}
+    cache, fetches, clock = make_cache(monkeypatch, items, ttl_seconds=60)
+    cache.get("alice")
+    items["alice"] = {"username": "alice", "n": 2}
+    clock.now += 61
+    assert cache.get("alice")["n"] == 2
+    assert fetches == ["alice", "alice"]
+    assert cache.invalidated == 1
+
+def test_missing_principal_is_not_cached(monkeypatch):
+    cache, fetches, _ = make_cache(monkeypatch, {})
+    assert cache.get("ghost") is None
+    assert cache.get("ghost") is None
+    assert fetches == ["ghost", "ghost"]
+    assert cache.stats()["entries"] == 0
+
+def test_expired_entry_revalidated_by_version(monkeypatch):
+    items = {"alice": {"username": "alice", "v": 3}}
+    versions = {"alice": 3}
+    cache, fetches, clock = make_cache(
+        monkeypatch, items, ttl_seconds=60, version_attr="v", fetch_version=versions.get
+    )
+    cache.get("alice")
+    clock.now += 61
+    assert cache.get("alice") == {"username": "alice", "v": 3}
+    assert fetches == ["alice"]
+    assert cache.revalidated == 1
+
+    versions["alice"] = 4
+    items["alice"] = {"username": "alice", "v": 4}
+    clock.now += 61
+    assert cache.get("alice")["v"] == 4
+    assert fetches == ["alice", "alice"]
+
+def test_lru_eviction_by_entries(monkeypatch):
+    items = {u: {"username": u} for u in "abc"}
+    cache, fetches, _ = make_cache(monkeypatch, items, max_entries=2)
+    cache.get("a")
+    cache.get("b")
+    cache.get("a")
+    cache.get("c")
+    assert cache.evictions == 1
+    cache.get("a")
+    cache.get("b")
+    assert fetches == ["a", "b", "c", "b"]
+
+def test_eviction_by_bytes(monkeypatch):
+    items = {u: {"username": u, "pad": "x" * 100} for u in "abc"}
+    size = baseline_cache._item_size(items["a"])
+    cache, _, _ = make_cache(monkeypatch, items, max_bytes=2 * size)
+    for u in "abc":
+        cache.get(u)
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] == 2 * size
+
+def test_oversized_item_is_returned_but_not_cached(monkeypatch):
+    items = {"big": {"username": "big", "pad": "x" * 1000}}
+    cache, fetches, _ = make_cache(monkeypatch, items, max_bytes=100)
+    assert cache.get("big") == items["big"]
+    cache.get("big")
+    assert fetches == ["big", "big"]
+
+def test_invalidate_drops_entry(monkeypatch):
+    cache, fetches, _ = make_cache(monkeypatch, {"alice": {"username": "alice"}})
+    cache.get("alice")
+    cache.invalidate("alice")
+    cache.invalidate("alice")
+    cache.get("alice")
+    assert fetches == ["alice", "alice"]
+    assert cache.invalidated == 1
+
+def test_get_many_mixes_hits_revalidation_and_fetches(monkeypatch):
+    items = {u: {"username": u, "v": 1} for u in ("a", "b", "c")}
+    versions = {"a": 1, "b": 2}
+    many_calls = []
+
+    def fetch_many(usernames):
+        many_calls.append(sorted(usernames))
+        return {u: items.get(u) for u in usernames}
+
+    cache, _, clock = make_cache(
+        monkeypatch, items, ttl_seconds=60, version_attr="v",
+        fetch_many=fetch_many, fetch_versions_many=lambda us: {u: versions.get(u) for u in us}
+    )
+    cache.get_many(["a", "b"])
+    clock.now += 61
+    items["b"] = {"username": "b", "v": 2}
+    found = cache.get_many(["a", "b", "c", "d"])
+    assert found == {"a": {"username": "a", "v": 1}, "b": {"username": "b", "v": 2},
+                     "c": {"username": "c", "v": 1}, "d": None}
+    assert many_calls == [["a", "b"], ["b", "c", "d"]]
+    assert cache.revalidated == 1
+
+def test_build_is_cached(monkeypatch):
+    cache, _, _ = make_cache(monkeypatch, {"alice": {"username": "alice"}}, build=lambda item: ("built", item["username"]))
+    assert cache.get("alice") == ("built", "alice")
+    assert cache.get("alice") == ("built", "alice")
@@ -0,0 +1,91 @@
+import pytest
+
+from utils.suppression import ActionMatcher, CidrMatcher, SubstringMatcher, SuppressionEngine
+
+def test_action_matcher_prefix_and_exact():
+    m = ActionMatcher()
+    m.add("ec2:Describe*", "describe")
+    m.add("sts:GetCallerIdentity", "whoami")
+    assert m.match("ec2:DescribeInstances") == "describe"
+    assert m.match("ec2:Describe") == "describe"
+    assert m.match("sts:GetCallerIdentity") == "whoami"
+    assert m.match("sts:GetCallerIdentityX") is None
+    assert m.match("sts:GetCaller") is None
+    assert m.match("ec2:RunInstances") is None
+
+def test_action_matcher_catch_all_and_inner_globs():
+    m = ActionMatcher()
+    m.add("s3:*Bucket?olicy", "policy")
+    assert m.match("s3:PutBucketPolicy") == "policy"
+    assert m.match("s3:GetBucketpolicy") == "policy"
+    assert m.match("s3:PutObject") is None
+    m.add("*", "all")
+    assert m.match("anything:AtAll") == "all"
+
+def test_action_matcher_first_pattern_wins():
+    m = ActionMatcher()
+    m.add("iam:Get*", "first")
+    m.add("iam:Get*", "second")
+    assert m.match("iam:GetUser") == "first"
+
+def test_substring_matcher_attributes_hit():
+    m = SubstringMatcher()
+    assert m.match("aws-cli/2") is None
+    m.add("Console", "console")
+    m.add("a.b", "dotted")
+    assert m.match("AWS Internal Console/1") == "console"
+    assert m.match("xa.bx") == "dotted"
+    assert m.match("xaxbx") is None
+    assert m.match(None) is None
+
+def test_cidr_matcher():
+    m = CidrMatcher()
+    m.add("10.1.0.0/16", "corp")
+    m.add("2001:db8::/32", "v6")
+    assert m.match("10.1.200.3") == "corp"
+    assert m.match("10.2.0.1") is None
+    assert m.match("2001:db8::1") == "v6"
+    assert m.match("ec2.amazonaws.com") is None
+
+def make_engine(rules=(), **settings):
+    return SuppressionEngine({"rules": list(rules), **settings})
+
+def test_identity_suppression():
+    engine = make_engine(usernames=["unknown"], user_agents=["Console"])
+    assert engine.match_identity("unknown", "aws-cli/2") == "username:unknown"
+    assert engine.match_identity("alice", "AWS Console") == "user_agent:Console"
+    assert engine.match_identity("alice", "aws-cli/2") is None
+    assert engine.hits == {"username:unknown": 1, "user_agent:Console": 1}
+
+def test_blocked_action_defaults():
+    engine = make_engine()
+    assert engine.match_blocked_action("alice", "ec2:DescribeVolumes") == "blocked_action:ec2:Describe*"
+    assert engine.match_blocked_action("alice", "iam:CreateUser") is None
+
+def test_rules_scoped_to_users_and_global():
+    engine = make_engine([
+        {"name": "ci-egress", "user": "ci-bot", "field": "sourceIPAddress", "cidrs": ["192.0.2.0/24"]},
+        {"name": "lab-region", "field": "awsRegion", "values": ["ap-south-1"]},
+        {"name": "terraform", "users": ["alice", "bob"], "field": "userAgent", "substrings": ["Terraform"]},
+        {"name": "read-only", "field": "action", "actions": ["s3:Get*"]}
+    ])
+    assert engine.match_field("ci-bot", "sourceIPAddress", "192.0.2.9") == "ci-egress"
+    assert engine.match_field("alice", "sourceIPAddress", "192.0.2.9") is None
+    assert engine.match_field("anyone", "awsRegion", "ap-south-1") == "lab-region"
+    assert engine.match_identity("bob", "Terraform/1.5") == "terraform"
+    assert engine.match_identity("carol", "Terraform/1.5") is None
+    assert engine.match_field("carol", "action", "s3:GetObject") == "read-only"
+    assert engine.match_field("carol", "action", None) is None
+    assert engine.rule_fields == ("action", "awsRegion", "sourceIPAddress", "userAgent")
+
+def test_blocked_action_rule():
+    engine = make_engine(
+        [{"name": "scanner", "user": "scanner", "field": "blocked_action", "actions": ["ec2:Run*"]}],
+        blocked_actions=[]
+    )
+    assert engine.match_blocked_action("scanner", "ec2:RunInstances") == "scanner"
+    assert engine.match_blocked_action("alice", "ec2:RunInstances") is None
+
+def test_rule_without_field_is_rejected():
+    with pytest.raises(ValueError):
+        make_engine([{"name": "broken", "values": ["x"]}])
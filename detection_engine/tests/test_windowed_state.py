@@ -0,0 +1,64 @@
+from utils import windowed_state
+from utils.windowed_state import SlidingWindowCounter, burst_config
+
+def make_counter(**kwargs):
+    # 60 s window in six 10 s buckets.
+    return SlidingWindowCounter(60, buckets=6, **kwargs)
+
+def test_counts_within_window():
+    counter = make_counter()
+    assert counter.add("alice", 1000) == 1
+    assert counter.add("alice", 1030) == 2
+    assert counter.add("alice", 1055, n=3) == 5
+    assert counter.count("alice") == 5
+    assert counter.count("bob") == 0
+
+def test_old_buckets_expire():
+    counter = make_counter()
+    counter.add("alice", 1000)
+    counter.add("alice", 1030)
+    assert counter.add("alice", 1065) == 2
+    assert counter.add("alice", 1200) == 1
+
+def test_late_events_count_where_they_happened():
+    counter = make_counter()
+    counter.add("alice", 1100)
+    # Inside the window ending at the latest event.
+    assert counter.add("alice", 1060) == 2
+    # Older than the window: ignored, count unchanged.
+    assert counter.add("alice", 1000) == 2
+    assert counter.count("alice") == 2
+
+def test_hit_fires_once_per_window():
+    counter = make_counter()
+    assert counter.hit("alice", 1000, 3) == 0
+    assert counter.hit("alice", 1001, 3) == 0
+    assert counter.hit("alice", 1002, 3) == 3
+    assert counter.hit("alice", 1003, 3) == 0
+    assert counter.hit("alice", 1030, 3) == 0
+    # A window later the key may fire again; 1030 still counts.
+    assert counter.hit("alice", 1070, 3) == 0
+    assert counter.hit("alice", 1071, 3) == 3
+
+def test_keys_are_independent():
+    counter = make_counter()
+    counter.add("alice", 1000)
+    counter.add("alice", 1000)
+    assert counter.hit("bob", 1000, 2) == 0
+    assert counter.count("alice") == 2
+
+def test_least_recently_updated_key_evicted():
+    counter = make_counter(max_keys=2)
+    counter.add("alice", 1000)
+    counter.add("bob", 1000)
+    counter.add("alice", 1001)
+    counter.add("carol", 1002)
+    assert len(counter) == 2
+    assert counter.count("bob") == 0
+    assert counter.count("alice") == 2
+    assert counter.stats() == {"name": "window", "keys": 2, "evictions": 1}
+
+def test_burst_config_overrides_defaults(monkeypatch):
+    monkeypatch.setattr(windowed_state, "BURSTS_CFG", {"denied_burst": {"threshold": 50}})
+    assert burst_config("denied_burst", threshold=20, window_seconds=300) == {"threshold": 50, "window_seconds": 300}
+    assert burst_config("other", threshold=20) == {"threshold": 20}
@@ -0,0 +1,344 @@
+import re
+import time
+from datetime import datetime
+from decimal import Decimal  
+
+from botocore.exceptions import ClientError
+
+from utils.log import get_logger
+from utils.trusted_networks import IP_FIELD, CIDR_FIELD, ip_trusted, network_index
+
+log = get_logger("baseline")
+
+def normalize_user(identity):
+    if not identity:
+        return "unknown"
+
+    if identity.get("userName"):
+        return identity["userName"]
+
+    if identity.get("type") == "AssumedRole":
+        session_issuer = identity.get("sessionContext", {}).get("sessionIssuer", {})
+        name = session_issuer.get("userName") or session_issuer.get("arn")
+        if name and ":" not in name:
+            return name
+
+    arn = identity.get("arn") or identity.get("principalId", "unknown")
+    return re.split(r"[:/]+", arn)[-1] if arn else "unknown"
+
+# Bumped on every write so readers (the detection engine's baseline cache) can
+# tell whether a cached copy of an item is stale.
+VERSION_ATTR = "baseline_version"
+# Epoch seconds of the last write, so a replica can copy only what changed.
+UPDATED_ATTR = "updated_at"
+# {field: {value: epoch seconds}} of when each trusted value was last
+# observed, restamped at most once per SEEN_RESOLUTION so steady traffic
+# does not turn into writes. Compaction ages trusted values out by it.
+SEEN_ATTR = "trusted_seen"
+SEEN_RESOLUTION = 24 * 3600
+
+def _now_ts():
+    return int(time.time())
+
+def _days_to_seconds(days):
+    return days * 24 * 3600
+
+def _trusted_hours_set(item: dict) -> set[int]:
+    out = set()
+    ns = item.get("work_hours_utc_ns")
+    if not ns:
+        return out
+
+    if isinstance(ns, dict) and "NS" in ns:
+        it = ns["NS"]
+    elif isinstance(ns, set):
+        it = ns
+    elif isinstance(ns, list):
+        it = ns
+    else:
+        it = []
+
+    for h in it:
+        try:
+            out.add(int(h) if not isinstance(h, Decimal) else int(h))
+        except Exception:
+            pass
+    return out
+
+def is_trusted(item: dict, field_key: str, value: str, networks=None) -> bool:
+    if field_key == "work_hours_utc":
+        try:
+            return int(value) in _trusted_hours_set(item)
+        except Exception:
+            return False
+    if value in (item.get(field_key) or []):
+        return True
+    if field_key == IP_FIELD:
+        # networks: prebuilt network_index() of the item's known_cidrs.
+        if networks is None and item.get(CIDR_FIELD):
+            networks = network_index(item[CIDR_FIELD])
+        return ip_trusted(value, networks)
+    return False
+
+def clear_candidate(username: str, field_key: str, value: str, table):
+    try:
+        table.update_item(
+            Key={"username": username},
+            UpdateExpression="REMOVE candidates.#f.#v",
+            ExpressionAttributeNames={"#f": field_key, "#v": value}
+        )
+    except Exception:
+        pass
+
+def record_candidate(username, field_key, value, table, thresholds):
+    now_ts = _now_ts()
+    now_hr = datetime.utcfromtimestamp(now_ts).isoformat() + "Z"
+    ttl    = now_ts + _days_to_seconds(thresholds["max_age_days"] * 2)
+
+    item = table.get_item(Key={"username": username}).get("Item", {})
+    if is_trusted(item, field_key, value):
+        return
+
+    try:
+        table.update_item(
+            Key={"username": username},
+            UpdateExpression="SET candidates = if_not_exists(candidates, :empty_map)",
+            ExpressionAttributeValues={":empty_map": {}}
+        )
+
+        table.update_item(
+            Key={"username": username},
+            UpdateExpression="SET candidates.#f = if_not_exists(candidates.#f, :empty_map)",
+            ExpressionAttributeNames={"#f": field_key},
+            ExpressionAttributeValues={":empty_map": {}}
+        )
+
+        table.update_item(
+            Key={"username": username},
+            UpdateExpression="SET candidates.#f.#v = if_not_exists(candidates.#f.#v, :empty_map)",
+            ExpressionAttributeNames={"#f": field_key, "#v": value},
+            ExpressionAttributeValues={":empty_map": {}}
+        )
+
+        update_expr = (
+            "SET candidates.#f.#v.#last_seen = :now_ts, "
+            "candidates.#f.#v.#ttl = :ttl, "
+            "candidates.#f.#v.#first_seen = if_not_exists(candidates.#f.#v.#first_seen, :now_ts), "
+            "candidates.#f.#v.#first_seen_hr = if_not_exists(candidates.#f.#v.#first_seen_hr, :now_hr) "
+            "ADD candidates.#f.#v.#count :inc"
+        )
+
+        table.update_item(
+            Key={"username": username},
+            UpdateExpression=update_expr,
+            ExpressionAttributeNames={
+                "#f": field_key,
+                "#v": value,
+                "#ttl": "ttl",
+                "#count": "count",
+                "#first_seen": "first_seen",
+                "#first_seen_hr": "first_seen_hr",
+                "#last_seen": "last_seen"
+            },
+            ExpressionAttributeValues={
+                ":now_ts": now_ts,
+                ":now_hr": now_hr,
+                ":ttl": ttl,
+                ":inc": 1
+            }
+        )
+
+    except Exception as e:
+        log.error("Failed to record candidate %s=%s for %s: %s", field_key, value, username, e)
+
+def should_promote_candidate(item, field_key, value, thresholds):
+    # Already trusted? don't promote again
+    if is_trusted(item, field_key, value):
+        return False
+
+    c = item.get("candidates", {}).get(field_key, {}).get(value)
+    if not c:
+        return False
+
+    count = c.get("count", 0)
+    age   = _now_ts() - c.get("first_seen", 0)
+    return count >= thresholds["min_count"] and age <= _days_to_seconds(thresholds["max_age_days"])
+
+def promote_candidate(username, field_key, value, table):
+    resp = table.get_item(Key={"username": username})
+    item = resp.get("Item", {})
+    current_ss = item.get(field_key, [])
+
+    if value not in current_ss:
+        new_ss = current_ss + [value]
+        table.update_item(
+            Key={"username": username},
+            UpdateExpression="SET #f = :new_ss",
+            ExpressionAttributeNames={"#f": field_key},
+            ExpressionAttributeValues={":new_ss": new_ss}
+        )
+
+    clear_candidate(username, field_key, value, table)
+
+    log.info("Promoted value '%s' for user '%s' under field '%s'", value, username, field_key)
+
+def _trusted_attr(field_key):
+    return "work_hours_utc_ns" if field_key == "work_hours_utc" else field_key
+
+def _trusted_operand(field_key, value):
+    return int(value) if field_key == "work_hours_utc" else value
+
+def _error_code(e):
+    return e.response.get("Error", {}).get("Code", "")
+
+def _is_promotable(candidate, thresholds, now_ts):
+    count = candidate.get("count", 0)
+    age   = now_ts - candidate.get("first_seen", now_ts)
+    return count >= thresholds["min_count"] and age <= _days_to_seconds(thresholds["max_age_days"])
+
+def record_candidate_atomic(username, field_key, value, table, thresholds, retry=True):
+    # One conditional write per observation: the condition skips values that
+    # are already trusted, and UPDATED_NEW returns the count/first_seen needed
+    # to decide promotion without reading the item back. The nested
+    # candidates maps are only created (by a fallback write) the first time a
+    # value, field or user is seen.
+    now_ts = _now_ts()
+    now_hr = datetime.utcfromtimestamp(now_ts).isoformat() + "Z"
+    ttl    = now_ts + _days_to_seconds(thresholds["max_age_days"] * 2)
+
+    entry = {"count": 1, "first_seen": now_ts, "first_seen_hr": now_hr, "last_seen": now_ts, "ttl": ttl}
+    trusted_cond = "(attribute_not_exists(#t) OR NOT contains(#t, :val))"
+    base_names = {"#t": _trusted_attr(field_key), "#ver": VERSION_ATTR, "#upd": UPDATED_ATTR}
+    base_values = {":val": _trusted_operand(field_key, value), ":inc": 1, ":now_ts": now_ts}
+
+    attempts = [
+        (
+            "SET candidates.#f.#v.#last_seen = :now_ts, "
+            "candidates.#f.#v.#ttl = :ttl, "
+            "candidates.#f.#v.#first_seen = if_not_exists(candidates.#f.#v.#first_seen, :now_ts), "
+            "candidates.#f.#v.#first_seen_hr = if_not_exists(candidates.#f.#v.#first_seen_hr, :now_hr), "
+            "#upd = :now_ts "
+            "ADD candidates.#f.#v.#count :inc, #ver :inc",
+            trusted_cond,
+            {
+                "#f": field_key,
+                "#v": value,
+                "#ttl": "ttl",
+                "#count": "count",
+                "#first_seen": "first_seen",
+                "#first_seen_hr": "first_seen_hr",
+                "#last_seen": "last_seen"
+            },
+            {":now_hr": now_hr, ":ttl": ttl}
+        ),
+        (
+            "SET candidates.#f.#v = :entry, #upd = :now_ts ADD #ver :inc",
+            f"attribute_not_exists(candidates.#f.#v) AND {trusted_cond}",
+            {"#f": field_key, "#v": value},
+            {":entry": entry}
+        ),
+        (
+            "SET candidates.#f = :field_map, #upd = :now_ts ADD #ver :inc",
+            f"attribute_not_exists(candidates.#f) AND {trusted_cond}",
+            {"#f": field_key},
+            {":field_map": {value: entry}}
+        ),
+        (
+            "SET candidates = :cand_map, #upd = :now_ts ADD #ver :inc",
+            f"attribute_not_exists(candidates) AND {trusted_cond}",
+            {},
+            {":cand_map": {field_key: {value: entry}}}
+        )
+    ]
+
+    for level, (update_expr, condition, names, values) in enumerate(attempts):
+        try:
+            resp = table.update_item(
+                Key={"username": username},
+                UpdateExpression=update_expr,
+                ConditionExpression=condition,
+                ExpressionAttributeNames={**base_names, **names},
+                ExpressionAttributeValues={**base_values, **values},
+                ReturnValues="UPDATED_NEW"
+            )
+        except ClientError as e:
+            code = _error_code(e)
+            if code == "ValidationException" and level < len(attempts) - 1:
+                continue
+            if code == "ConditionalCheckFailedException":
+                # Either the value is trusted, or another writer created the
+                # parent map first; in the latter case the nested path now works.
+                if level > 0 and retry:
+                    return record_candidate_atomic(username, field_key, value, table, thresholds, retry=False)
+                return False
+            log.error("Failed to record candidate %s=%s for %s: %s", field_key, value, username, e)
+            return False
+
+        if level == 0:
+            candidate = resp.get("Attributes", {}).get("candidates", {}).get(field_key, {}).get(value, {})
+        else:
+            candidate = entry
+        return _is_promotable(candidate, thresholds, now_ts)
+
+    return False
+
+def record_candidate_sharded(username, field_key, value, store, thresholds):
+    # record_candidate_atomic for the sharded layout; the store does the
+    # conditional write on the value's bucket.
+    now_ts = _now_ts()
+    entry = {
+        "count": 1, "first_seen": now_ts,
+        "first_seen_hr": datetime.utcfromtimestamp(now_ts).isoformat() + "Z",
+        "last_seen": now_ts, "ttl": now_ts + _days_to_seconds(thresholds["max_age_days"] * 2)
+    }
+    candidate = store.observe_candidate(username, field_key, value, entry)
+    return candidate is not None and _is_promotable(candidate, thresholds, now_ts)
+
+def promote_candidate_atomic(username, field_key, value, table):
+    # Append (or set-add for hours) and drop the candidate in the same write.
+    names = {"#f": field_key, "#v": value, "#ver": VERSION_ATTR, "#upd": UPDATED_ATTR}
+    if field_key == "work_hours_utc":
+        kwargs = {
+            "UpdateExpression": "SET #upd = :now ADD work_hours_utc_ns :vals, #ver :one REMOVE candidates.#f.#v",
+            "ExpressionAttributeValues": {":vals": set([int(value)]), ":one": 1, ":now": _now_ts()}
+        }
+    else:
+        kwargs = {
+            "UpdateExpression": (
+                "SET #f = list_append(if_not_exists(#f, :empty_list), :vals), #upd = :now "
+                "ADD #ver :one REMOVE candidates.#f.#v"
+            ),
+            "ConditionExpression": "attribute_not_exists(#f) OR NOT contains(#f, :val)",
+            "ExpressionAttributeValues": {
+                ":vals": [value], ":empty_list": [], ":val": value, ":one": 1, ":now": _now_ts()
+            }
+        }
+
+    try:
+        table.update_item(Key={"username": username}, ExpressionAttributeNames=names, **kwargs)
+    except ClientError as e:
+        if _error_code(e) != "ConditionalCheckFailedException":
+            log.error("Failed to promote %s=%s for %s: %s", field_key, value, username, e)
+            return False
+        clear_candidate(username, field_key, value, table)
+        return False
+
+    log.info("Promoted value '%s' for user '%s' under field '%s'", value, username, field_key)
+    return True
+
+def alert_promotion(username, field_key, value, write_alert):
+    write_alert(
+        alert_type="Baseline Promotion",
+        metadata={
+            "severity": "info",
+            "category": "baseline",
+            "actor_type": "system",
+            "timestamp": datetime.utcnow().isoformat() + "Z"
+        },
+        details={
+            "user": username,
+            "field": field_key,
+            "value": value
+        }
+    )
+
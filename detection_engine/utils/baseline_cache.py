@@ -0,0 +1,166 @@
+import json
+import time
+from collections import OrderedDict
+
+def _item_size(item):
+    try:
+        return len(json.dumps(item, default=str))
+    except Exception:
+        return 0
+
+def _version_of(item, version_attr):
+    if not version_attr or not item:
+        return None
+    return item.get(version_attr)
+
+def _identity(item):
+    return item
+
+class BaselineCache:
+    # Caches build(item) for each raw DynamoDB item; lookups for principals
+    # without a baseline return None.
+    def __init__(self, fetch, max_entries=2048, max_bytes=64 * 1024 * 1024,
+                 ttl_seconds=60, version_attr=None, fetch_version=None,
+                 fetch_many=None, fetch_versions_many=None, build=_identity):
+        self.fetch = fetch
+        self.build = build
+        self.fetch_version = fetch_version
+        self.fetch_many = fetch_many
+        self.fetch_versions_many = fetch_versions_many
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.version_attr = version_attr
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.invalidated = 0
+        self.evictions = 0
+
+    def get(self, username):
+        entry = self._entries.get(username)
+        now = time.monotonic()
+
+        if entry:
+            item, size, expires_at, version = entry
+            if now < expires_at:
+                self.hits += 1
+                self._entries.move_to_end(username)
+                return item
+
+            # Expired: if the builder stamps a version, a cheap projected read
+            # tells us whether the cached copy is still current.
+            if self.version_attr and self.fetch_version and version is not None:
+                try:
+                    current = self.fetch_version(username)
+                except Exception:
+                    current = None
+                if current is not None and current == version:
+                    self.hits += 1
+                    self.revalidated += 1
+                    self._entries[username] = (item, size, now + self.ttl_seconds, version)
+                    self._entries.move_to_end(username)
+                    return item
+            self.invalidated += 1
+            self._drop(username)
+
+        self.misses += 1
+        item = self.fetch(username)
+        if not item:
+            return None
+        return self.put(username, item)
+
+    def get_many(self, usernames):
+        found = {}
+        stale = {}
+        missing = []
+        now = time.monotonic()
+
+        for username in usernames:
+            entry = self._entries.get(username)
+            if entry and now < entry[2]:
+                self.hits += 1
+                self._entries.move_to_end(username)
+                found[username] = entry[0]
+            elif entry and self.version_attr and self.fetch_versions_many and entry[3] is not None:
+                stale[username] = entry
+            else:
+                if entry:
+                    self.invalidated += 1
+                    self._drop(username)
+                missing.append(username)
+
+        if stale:
+            try:
+                versions = self.fetch_versions_many(list(stale))
+            except Exception:
+                versions = {}
+            for username, (item, size, _, version) in stale.items():
+                current = versions.get(username)
+                if current is not None and current == version:
+                    self.hits += 1
+                    self.revalidated += 1
+                    self._entries[username] = (item, size, now + self.ttl_seconds, version)
+                    self._entries.move_to_end(username)
+                    found[username] = item
+                else:
+                    self.invalidated += 1
+                    self._drop(username)
+                    missing.append(username)
+
+        if missing:
+            self.misses += len(missing)
+            if self.fetch_many:
+                fetched = self.fetch_many(missing)
+            else:
+                fetched = {username: self.fetch(username) for username in missing}
+            for username in missing:
+                item = fetched.get(username)
+                found[username] = self.put(username, item) if item else None
+
+        return found
+
+    def put(self, username, item):
+        self._drop(username)
+        value = self.build(item)
+        size = _item_size(item)
+        if size > self.max_bytes:
+            return value
+
+        expires_at = time.monotonic() + self.ttl_seconds
+        self._entries[username] = (value, size, expires_at, _version_of(item, self.version_attr))
+        self._bytes += size
+
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, old_size, _, _) = self._entries.popitem(last=False)
+            self._bytes -= old_size
+            self.evictions += 1
+        return value
+
+    def invalidate(self, username):
+        if self._drop(username):
+            self.invalidated += 1
+
+    def _drop(self, username):
+        entry = self._entries.pop(username, None)
+        if entry:
+            self._bytes -= entry[1]
+            return True
+        return False
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "revalidated": self.revalidated,
+            "invalidated": self.invalidated,
+            "evictions": self.evictions
+        }
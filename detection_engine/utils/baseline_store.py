@@ -0,0 +1,776 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+
+from utils.config_loader import load_config
+from utils.batch_get import batch_get_items
+from utils.log import get_logger
+
+cfg = load_config()
+STORE_CFG = cfg.get("baseline_store", {}) or {}
+BACKEND = STORE_CFG.get("backend", "dynamodb")
+LAYOUT = STORE_CFG.get("layout", "single")
+READ_CONCURRENCY = STORE_CFG.get("read_concurrency", 8)
+# Buckets per field in the sharded layout; fields not listed get one.
+SHARD_BUCKETS = {"known_ips": 16, "user_agents": 16, "actions": 16, **(STORE_CFG.get("shard_buckets") or {})}
+SQLITE_PATH = STORE_CFG.get("sqlite_path", "baselines.db")
+REPLICA_CFG = STORE_CFG.get("replica", {}) or {}
+REPLICA_ENABLED = REPLICA_CFG.get("enabled", False)
+REPLICA_PATH = REPLICA_CFG.get("path", "baseline-replica.db")
+SYNC_SECONDS = REPLICA_CFG.get("sync_interval_seconds", 30)
+# Writers stamp updated_at from their own clock; an incremental sync looks
+# this far back past its cursor so skew between hosts cannot hide a write.
+SYNC_OVERLAP_SECONDS = REPLICA_CFG.get("overlap_seconds", 120)
+
+VERSION_ATTR = "baseline_version"
+UPDATED_ATTR = "updated_at"
+SEEN_ATTR = "trusted_seen"
+
+TRUSTED_FIELDS = ("known_ips", "user_agents", "regions", "services", "actions", "assumed_roles", "known_cidrs")
+HOURS_FIELD = "work_hours_utc"
+HOURS_ATTR = "work_hours_utc_ns"
+SHARD_KEY = "shard"
+META_SHARD = "meta"
+MAX_CLAUSES_PER_UPDATE = 50
+
+# SQLite caps bound parameters per statement (999 on older builds).
+SQLITE_CHUNK = 500
+
+log = get_logger("baseline_store")
+
+class BaselineStore:
+    # Where baseline items live. Items are plain dicts in the DynamoDB item
+    # shape (one per username); callers never see backend-specific types
+    # beyond the Decimals DynamoDB returns.
+    #
+    #   get(username) -> item or {}
+    #   get_many(usernames) -> {username: item}, missing users left out
+    #   get_versions(usernames) -> {username: version}
+    #   get_version(username) -> version or None
+    #   put_many(items)                    replace whole items
+    #   transform(usernames, fn)           fn(username, item) -> new item or
+    #                                      None (unchanged); read-modify-write
+    #                                      of the group, atomic where the
+    #                                      backend allows it
+    native_updates = False
+    sharded = False
+
+    def __init__(self, version_attr=VERSION_ATTR):
+        self.version_attr = version_attr
+
+    def get(self, username):
+        return self.get_many([username]).get(username, {})
+
+    def get_versions(self, usernames):
+        return {u: item.get(self.version_attr) for u, item in self.get_many(usernames).items()}
+
+    def get_version(self, username):
+        return self.get_versions([username]).get(username)
+
+    def close(self):
+        pass
+
+class DynamoStore(BaselineStore):
+    # The table itself. native_updates tells the delta and per-record paths
+    # they can use update expressions (concurrent-writer safe) on .table.
+    native_updates = True
+
+    def __init__(self, dynamodb, table, version_attr=VERSION_ATTR):
+        super().__init__(version_attr)
+        self.dynamodb = dynamodb
+        self.table = table
+        self.table_name = table.name
+
+    def get(self, username):
+        return self.table.get_item(Key={"username": username}).get("Item", {})
+
+    def get_many(self, usernames):
+        keys = [{"username": u} for u in usernames]
+        return {item["username"]: item for item in batch_get_items(self.dynamodb, self.table_name, keys)}
+
+    def get_versions(self, usernames):
+        keys = [{"username": u} for u in usernames]
+        items = batch_get_items(
+            self.dynamodb, self.table_name, keys,
+            projection="username, #v",
+            attribute_names={"#v": self.version_attr}
+        )
+        return {item["username"]: item.get(self.version_attr) for item in items}
+
+    def get_version(self, username):
+        resp = self.table.get_item(
+            Key={"username": username},
+            ProjectionExpression="#v",
+            ExpressionAttributeNames={"#v": self.version_attr}
+        )
+        return resp.get("Item", {}).get(self.version_attr)
+
+    def put_many(self, items):
+        with self.table.batch_writer() as writer:
+            for item in items:
+                writer.put_item(Item=item)
+
+    def transform(self, usernames, fn):
+        # Whole-item rewrite; only used where a single writer owns the
+        # table (backfill). The engines use update expressions instead.
+        existing = self.get_many(usernames)
+        changed = []
+        for username in usernames:
+            item = fn(username, existing.get(username, {}))
+            if item is not None:
+                changed.append(item)
+        self.put_many(changed)
+
+    def changes_since(self, since):
+        # Items written at or after `since` (epoch seconds), for replicas.
+        # A scan reads the whole table either way; the filter only keeps
+        # unchanged items off the wire. since=0 copies everything, including
+        # items written before updated_at was stamped.
+        kwargs = {}
+        if since:
+            kwargs["FilterExpression"] = Attr(UPDATED_ATTR).gte(int(since))
+        while True:
+            resp = self.table.scan(**kwargs)
+            yield from resp.get("Items", [])
+            if "LastEvaluatedKey" not in resp:
+                return
+            kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+def shard_for(field_key, value):
+    # crc32 rather than hash(): bucket choice must agree across processes.
+    buckets = SHARD_BUCKETS.get(field_key, 1)
+    n = zlib.crc32(str(value).encode("utf-8")) % buckets if buckets > 1 else 0
+    return f"{field_key}#{n:02d}"
+
+def _shard_field(shard):
+    return shard.rsplit("#", 1)[0]
+
+def _trusted_operand(field_key, value):
+    return int(value) if field_key == HOURS_FIELD else value
+
+def assemble(username, shards):
+    # Item collection (meta + field shards) -> the single-item shape.
+    if not shards:
+        return {}
+    item = {"username": username, **{field: [] for field in TRUSTED_FIELDS}}
+    candidates = {}
+    stamps = {}
+    hours = set()
+    for shard in shards:
+        name = shard.get(SHARD_KEY)
+        if name == META_SHARD:
+            item.update((k, v) for k, v in shard.items() if k != SHARD_KEY)
+            continue
+        field = _shard_field(name)
+        values = shard.get("values") or ()
+        if field == HOURS_FIELD:
+            hours.update(values)
+        else:
+            item.setdefault(field, []).extend(values)
+        if shard.get("candidates"):
+            candidates.setdefault(field, {}).update(shard["candidates"])
+        if shard.get("seen"):
+            stamps.setdefault(field, {}).update(shard["seen"])
+    for field in TRUSTED_FIELDS:
+        item[field] = sorted(item[field])
+    item["candidates"] = candidates
+    if hours:
+        item[HOURS_ATTR] = hours
+    if stamps:
+        item[SEEN_ATTR] = stamps
+    return item
+
+def split(item):
+    # Inverse of assemble(), for whole-item writes (backfill).
+    username = item["username"]
+    now = int(item.get(UPDATED_ATTR) or time.time())
+    skip = set(TRUSTED_FIELDS) | {HOURS_ATTR, "candidates", SEEN_ATTR}
+    meta = {k: v for k, v in item.items() if k not in skip}
+    meta.update({SHARD_KEY: META_SHARD, UPDATED_ATTR: now})
+
+    shards = {}
+
+    def shard(field_key, value):
+        name = shard_for(field_key, value)
+        if name not in shards:
+            shards[name] = {"username": username, SHARD_KEY: name, "candidates": {}, UPDATED_ATTR: now}
+        return shards[name]
+
+    for field_key in TRUSTED_FIELDS:
+        for value in item.get(field_key) or ():
+            shard(field_key, value).setdefault("values", set()).add(value)
+    for hour in item.get(HOURS_ATTR) or ():
+        shard(HOURS_FIELD, int(hour)).setdefault("values", set()).add(int(hour))
+    for field_key, values in (item.get("candidates") or {}).items():
+        if isinstance(values, dict):
+            for value, cand in values.items():
+                shard(field_key, value)["candidates"][value] = cand
+    for field_key, values in (item.get(SEEN_ATTR) or {}).items():
+        for value, ts in values.items():
+            shard(field_key, value).setdefault("seen", {})[value] = ts
+    return [meta] + list(shards.values())
+
+def _error_code(e):
+    return e.response.get("Error", {}).get("Code", "")
+
+class ShardedDynamoStore(DynamoStore):
+    # For principals with thousands of trusted values. The table has a sort
+    # key `shard`: one "meta" item per user (first_seen, version,
+    # updated_at) and one item per field bucket, "<field>#NN", holding that
+    # bucket's trusted values as a DynamoDB set, its candidates as a map and
+    # the values' trusted_seen stamps as a map, "seen".
+    # A value always lands in the same bucket, so every write touches one
+    # small item whatever the principal's size, promotions are set ADDs that
+    # never rewrite existing values, and no item nears the 400 KB limit.
+    # Reads Query the user's item collection and assemble() it back into the
+    # single-item shape; get_many runs those queries concurrently.
+    #
+    # The meta version is only bumped when something a reader can see
+    # changes (a new candidate value or a promotion), not on count updates.
+    sharded = True
+
+    def __init__(self, dynamodb, table, version_attr=VERSION_ATTR, read_concurrency=READ_CONCURRENCY):
+        super().__init__(dynamodb, table, version_attr)
+        self.read_concurrency = max(read_concurrency, 1)
+        self._executor = None
+        self._pid = None
+
+    def _meta_key(self, username):
+        return {"username": username, SHARD_KEY: META_SHARD}
+
+    def _collection(self, username):
+        shards = []
+        kwargs = {"KeyConditionExpression": Key("username").eq(username)}
+        while True:
+            resp = self.table.query(**kwargs)
+            shards.extend(resp.get("Items", []))
+            if "LastEvaluatedKey" not in resp:
+                return shards
+            kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+    def _collection_threadsafe(self, username):
+        # Through the resource's client: unlike resources, clients may be
+        # shared between threads, and this one still converts to and from
+        # Python types.
+        client = self.dynamodb.meta.client
+        shards = []
+        kwargs = {
+            "TableName": self.table_name,
+            "KeyConditionExpression": "username = :u",
+            "ExpressionAttributeValues": {":u": username}
+        }
+        while True:
+            resp = client.query(**kwargs)
+            shards.extend(resp.get("Items", []))
+            if "LastEvaluatedKey" not in resp:
+                return shards
+            kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+    def _pool(self):
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(self.read_concurrency, thread_name_prefix="baseline-read")
+            self._pid = os.getpid()
+        return self._executor
+
+    def get(self, username):
+        return assemble(username, self._collection(username))
+
+    def get_many(self, usernames):
+        usernames = list(usernames)
+        if len(usernames) == 1:
+            item = self.get(usernames[0])
+            return {usernames[0]: item} if item else {}
+        collections = self._pool().map(self._collection_threadsafe, usernames)
+        return {u: assemble(u, shards) for u, shards in zip(usernames, collections) if shards}
+
+    def get_versions(self, usernames):
+        items = batch_get_items(
+            self.dynamodb, self.table_name, [self._meta_key(u) for u in usernames],
+            projection="username, #v",
+            attribute_names={"#v": self.version_attr}
+        )
+        return {item["username"]: item.get(self.version_attr) for item in items}
+
+    def get_version(self, username):
+        resp = self.table.get_item(
+            Key=self._meta_key(username),
+            ProjectionExpression="#v",
+            ExpressionAttributeNames={"#v": self.version_attr}
+        )
+        return resp.get("Item", {}).get(self.version_attr)
+
+    def put_many(self, items):
+        with self.table.batch_writer(overwrite_by_pkeys=["username", SHARD_KEY]) as writer:
+            for item in items:
+                for shard in split(item):
+                    writer.put_item(Item=shard)
+
+    def changes_since(self, since):
+        # Changed shards name the users to re-read; each is re-assembled
+        # from its whole collection.
+        kwargs = {"ProjectionExpression": "username"}
+        if since:
+            kwargs["FilterExpression"] = Attr(UPDATED_ATTR).gte(int(since))
+        usernames = set()
+        while True:
+            resp = self.table.scan(**kwargs)
+            usernames.update(item["username"] for item in resp.get("Items", []))
+            if "LastEvaluatedKey" not in resp:
+                break
+            kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+        usernames = sorted(usernames)
+        for i in range(0, len(usernames), 100):
+            yield from self.get_many(usernames[i:i + 100]).values()
+
+    def ensure_user(self, username):
+        # True if this call created the user's meta item.
+        try:
+            self.table.put_item(
+                Item={
+                    **self._meta_key(username),
+                    "first_seen": datetime.utcnow().isoformat() + "Z",
+                    VERSION_ATTR: 1,
+                    UPDATED_ATTR: int(time.time())
+                },
+                ConditionExpression="attribute_not_exists(username)"
+            )
+            return True
+        except ClientError as e:
+            if _error_code(e) != "ConditionalCheckFailedException":
+                raise
+            return False
+
+    def touch(self, username, now=None):
+        now = now or int(time.time())
+        self.table.update_item(
+            Key=self._meta_key(username),
+            UpdateExpression="SET #upd = :now, first_seen = if_not_exists(first_seen, :fs) ADD #ver :one",
+            ExpressionAttributeNames={"#upd": UPDATED_ATTR, "#ver": VERSION_ATTR},
+            ExpressionAttributeValues={
+                ":now": now, ":one": 1,
+                ":fs": datetime.utcfromtimestamp(now).isoformat() + "Z"
+            }
+        )
+
+    def _update_shard(self, username, shard, clauses, now):
+        sections = {"SET": ["#upd = :now"]}
+        names = {"#upd": UPDATED_ATTR}
+        values = {":now": now}
+        for action, expr, c_names, c_values in clauses:
+            sections.setdefault(action, []).append(expr)
+            names.update(c_names)
+            values.update(c_values)
+        kwargs = {
+            "Key": {"username": username, SHARD_KEY: shard},
+            "UpdateExpression": " ".join(f"{action} {', '.join(exprs)}" for action, exprs in sections.items()),
+            "ExpressionAttributeNames": names,
+            "ExpressionAttributeValues": values
+        }
+        try:
+            self.table.update_item(**kwargs)
+        except ClientError as e:
+            if _error_code(e) != "ValidationException":
+                raise
+            # New shard (or one without a candidates map yet): create the
+            # map, then the nested paths resolve.
+            self._ensure_candidates(username, shard)
+            self.table.update_item(**kwargs)
+
+    def _ensure_candidates(self, username, shard):
+        self.table.update_item(
+            Key={"username": username, SHARD_KEY: shard},
+            UpdateExpression="SET candidates = if_not_exists(candidates, :empty), #seen = if_not_exists(#seen, :empty)",
+            ExpressionAttributeNames={"#seen": "seen"},
+            ExpressionAttributeValues={":empty": {}}
+        )
+
+    def write_resolved(self, username, item, candidates, promoted, removed=None, seen=None):
+        # Writes resolve_user_delta() output: each candidate entry is SET in
+        # its bucket's map; promoted values are ADDed to the bucket's set and
+        # dropped from the map. removed values (covered by a new known_cidrs
+        # prefix) are DELETEd from their bucket's set and maps; seen stamps
+        # are SET in the bucket's seen map.
+        removed = removed or {}
+        now = int(time.time())
+        changes = {}
+
+        def change(field_key, value):
+            return changes.setdefault(shard_for(field_key, value), ({}, [], [], {}))
+
+        for field_key, values in candidates.items():
+            for value, cand in values.items():
+                change(field_key, value)[0][value] = cand
+        for field_key, values in promoted.items():
+            for value in values:
+                change(field_key, value)[1].append(value)
+        for field_key, values in removed.items():
+            for value in values:
+                change(field_key, value)[2].append(value)
+        for field_key, values in (seen or {}).items():
+            for value, ts in values.items():
+                change(field_key, value)[3][value] = ts
+
+        for shard, (cands, promoted_values, dropped, stamps) in changes.items():
+            field_key = _shard_field(shard)
+            added = [v for v in promoted_values if v not in dropped]
+            clauses = []
+            if added:
+                clauses.append((
+                    "ADD", "#vals :vals",
+                    {"#vals": "values"}, {":vals": set(_trusted_operand(field_key, v) for v in added)}
+                ))
+            for n, value in enumerate(set(promoted_values) | set(dropped)):
+                clauses.append(("REMOVE", f"candidates.#r{n}", {f"#r{n}": value}, {}))
+            for n, (value, cand) in enumerate(cands.items()):
+                clauses.append(("SET", f"candidates.#c{n} = :c{n}", {f"#c{n}": value}, {f":c{n}": cand}))
+            for n, (value, ts) in enumerate(stamps.items()):
+                clauses.append(("SET", f"#seen.#s{n} = :s{n}", {"#seen": "seen", f"#s{n}": value}, {f":s{n}": ts}))
+            for n, value in enumerate(dropped):
+                clauses.append(("REMOVE", f"#seen.#d{n}", {"#seen": "seen", f"#d{n}": value}, {}))
+            for i in range(0, len(clauses), MAX_CLAUSES_PER_UPDATE):
+                self._update_shard(username, shard, clauses[i:i + MAX_CLAUSES_PER_UPDATE], now)
+            if dropped:
+                # Separate update: ADD and DELETE may not share a path.
+                self._update_shard(username, shard, [(
+                    "DELETE", "#vals :drop",
+                    {"#vals": "values"}, {":drop": set(_trusted_operand(field_key, v) for v in dropped)}
+                )], now)
+
+        if changes or not item:
+            self.touch(username, now)
+
+    def observe_candidate(self, username, field_key, value, entry, retry=True):
+        # Per-record counterpart of write_resolved(): one conditional write
+        # on the value's bucket. Returns the candidate entry after the write,
+        # or None if the value is already trusted (or the write failed).
+        key = {"username": username, SHARD_KEY: shard_for(field_key, value)}
+        trusted_cond = "(attribute_not_exists(#vals) OR NOT contains(#vals, :val))"
+        base_names = {"#vals": "values", "#upd": UPDATED_ATTR}
+        base_values = {":val": _trusted_operand(field_key, value), ":now": entry["last_seen"]}
+        attempts = [
+            (
+                "SET candidates.#v.last_seen = :now, candidates.#v.#ttl = :ttl, "
+                "candidates.#v.first_seen = if_not_exists(candidates.#v.first_seen, :now), "
+                "candidates.#v.first_seen_hr = if_not_exists(candidates.#v.first_seen_hr, :now_hr), "
+                "#upd = :now ADD candidates.#v.#count :inc",
+                trusted_cond,
+                {"#v": value, "#ttl": "ttl", "#count": "count"},
+                {":ttl": entry["ttl"], ":now_hr": entry["first_seen_hr"], ":inc": 1}
+            ),
+            (
+                "SET candidates.#v = :entry, #upd = :now",
+                f"attribute_not_exists(candidates.#v) AND {trusted_cond}",
+                {"#v": value}, {":entry": entry}
+            ),
+            (
+                "SET candidates = :cand_map, #upd = :now",
+                f"attribute_not_exists(candidates) AND {trusted_cond}",
+                {}, {":cand_map": {value: entry}}
+            )
+        ]
+        for level, (update_expr, condition, names, values) in enumerate(attempts):
+            try:
+                resp = self.table.update_item(
+                    Key=key,
+                    UpdateExpression=update_expr,
+                    ConditionExpression=condition,
+                    ExpressionAttributeNames={**base_names, **names},
+                    ExpressionAttributeValues={**base_values, **values},
+                    ReturnValues="UPDATED_NEW"
+                )
+            except ClientError as e:
+                code = _error_code(e)
+                if code == "ValidationException" and level < len(attempts) - 1:
+                    continue
+                if code == "ConditionalCheckFailedException":
+                    # Trusted, or another writer created the map first.
+                    if level > 0 and retry:
+                        return self.observe_candidate(username, field_key, value, entry, retry=False)
+                    return None
+                log.error("Failed to record candidate %s=%s for %s: %s", field_key, value, username, e)
+                return None
+
+            if level == 0:
+                return resp.get("Attributes", {}).get("candidates", {}).get(value, {})
+            # A new candidate value is visible to readers.
+            self.touch(username, entry["last_seen"])
+            return entry
+        return None
+
+    def promote(self, username, field_key, value):
+        # Set-add and candidate removal in one write on the value's bucket.
+        key = {"username": username, SHARD_KEY: shard_for(field_key, value)}
+        operand = _trusted_operand(field_key, value)
+        try:
+            self.table.update_item(
+                Key=key,
+                UpdateExpression="SET #upd = :now ADD #vals :vals REMOVE candidates.#v",
+                ConditionExpression="attribute_not_exists(#vals) OR NOT contains(#vals, :val)",
+                ExpressionAttributeNames={"#vals": "values", "#v": value, "#upd": UPDATED_ATTR},
+                ExpressionAttributeValues={":vals": {operand}, ":val": operand, ":now": int(time.time())}
+            )
+        except ClientError as e:
+            if _error_code(e) != "ConditionalCheckFailedException":
+                log.error("Failed to promote %s=%s for %s: %s", field_key, value, username, e)
+                return False
+            # Already trusted; drop the stale candidate.
+            try:
+                self.table.update_item(
+                    Key=key, UpdateExpression="REMOVE candidates.#v", ExpressionAttributeNames={"#v": value}
+                )
+            except Exception:
+                pass
+            return False
+        self.touch(username)
+        return True
+
+def _encode(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return {"$set": sorted(value, key=str)}
+    raise TypeError(f"Cannot store {type(value).__name__} in a baseline item")
+
+def _decode(obj):
+    if len(obj) == 1 and "$set" in obj:
+        return set(obj["$set"])
+    return obj
+
+def _dumps(item):
+    return json.dumps(item, default=_encode, separators=(",", ":"))
+
+def _loads(text):
+    return json.loads(text, object_hook=_decode)
+
+class SqliteStore(BaselineStore):
+    # One row per user with the item as JSON, in WAL mode so the detection
+    # engine (and its forked workers) can read while a writer commits.
+    # Numbers come back as int/float and string sets as set, which every
+    # reader of baseline items already accepts. Connections are per thread
+    # and per process.
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS baselines ("
+        " username TEXT PRIMARY KEY,"
+        " item TEXT NOT NULL,"
+        " version INTEGER,"
+        " updated_at INTEGER NOT NULL DEFAULT 0"
+        ") WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS baselines_version ON baselines (username, version)",
+        "CREATE INDEX IF NOT EXISTS baselines_updated_at ON baselines (updated_at)",
+        "CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+    )
+
+    def __init__(self, path=SQLITE_PATH, version_attr=VERSION_ATTR):
+        super().__init__(version_attr)
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        conn = self._conn()
+        with conn:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+
+    def _conn(self):
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            local.conn = conn
+            local.pid = os.getpid()
+        return local.conn
+
+    def _select(self, columns, usernames):
+        conn = self._conn()
+        usernames = list(usernames)
+        for i in range(0, len(usernames), SQLITE_CHUNK):
+            chunk = usernames[i:i + SQLITE_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            yield from conn.execute(f"SELECT {columns} FROM baselines WHERE username IN ({marks})", chunk)
+
+    def get(self, username):
+        row = self._conn().execute("SELECT item FROM baselines WHERE username = ?", (username,)).fetchone()
+        return _loads(row[0]) if row else {}
+
+    def get_many(self, usernames):
+        return {username: _loads(item) for username, item in self._select("username, item", usernames)}
+
+    def get_versions(self, usernames):
+        return {username: version for username, version in self._select("username, version", usernames)}
+
+    def get_version(self, username):
+        row = self._conn().execute("SELECT version FROM baselines WHERE username = ?", (username,)).fetchone()
+        return row[0] if row else None
+
+    def _row(self, item):
+        version = item.get(self.version_attr)
+        return (
+            item["username"], _dumps(item),
+            int(version) if version is not None else None,
+            int(item.get(UPDATED_ATTR) or time.time())
+        )
+
+    def _upsert(self, conn, items):
+        conn.executemany(
+            "INSERT INTO baselines (username, item, version, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (username) DO UPDATE SET item = excluded.item, "
+            "version = excluded.version, updated_at = excluded.updated_at",
+            [self._row(item) for item in items]
+        )
+
+    def put_many(self, items):
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._upsert(conn, items)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def transform(self, usernames, fn):
+        # BEGIN IMMEDIATE takes the write lock up front, so the reads below
+        # cannot be invalidated by another process before the commit.
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing = self.get_many(usernames)
+                changed = []
+                for username in usernames:
+                    item = fn(username, existing.get(username, {}))
+                    if item is not None:
+                        changed.append(item)
+                self._upsert(conn, changed)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def meta(self, key, default=None):
+        row = self._conn().execute("SELECT value FROM store_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self._write_lock:
+            self._conn().execute(
+                "INSERT INTO store_meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (key, str(value))
+            )
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM baselines").fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+            self._local.pid = None
+
+class MemoryStore(BaselineStore):
+    # For local runs and benchmarks; items are copied in and out so callers
+    # can't mutate stored state by accident.
+    def __init__(self, items=(), version_attr=VERSION_ATTR):
+        super().__init__(version_attr)
+        self._items = {}
+        self._lock = threading.Lock()
+        self.put_many(items)
+
+    def get_many(self, usernames):
+        with self._lock:
+            return {u: copy.deepcopy(self._items[u]) for u in usernames if u in self._items}
+
+    def get_versions(self, usernames):
+        with self._lock:
+            return {u: self._items[u].get(self.version_attr) for u in usernames if u in self._items}
+
+    def put_many(self, items):
+        with self._lock:
+            for item in items:
+                self._items[item["username"]] = copy.deepcopy(item)
+
+    def transform(self, usernames, fn):
+        with self._lock:
+            for username in usernames:
+                item = fn(username, copy.deepcopy(self._items.get(username, {})))
+                if item is not None:
+                    self._items[username] = copy.deepcopy(item)
+
+class ReplicaSync:
+    # Keeps a SqliteStore in step with a DynamoStore so reads are local
+    # lookups. sync() copies everything changed since the stored cursor;
+    # the first run (or a fresh file) copies the whole table. Deleted items
+    # are not propagated.
+    CURSOR_KEY = "replica_cursor"
+
+    def __init__(self, source, replica, interval=SYNC_SECONDS, overlap=SYNC_OVERLAP_SECONDS):
+        self.source = source
+        self.replica = replica
+        self.interval = interval
+        self.overlap = overlap
+        self.synced_at = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def sync(self):
+        cursor = int(float(self.replica.meta(self.CURSOR_KEY, 0)))
+        since = max(cursor - self.overlap, 0) if cursor else 0
+        started = time.time()
+        batch = []
+        copied = 0
+        for item in self.source.changes_since(since):
+            batch.append(item)
+            if len(batch) >= SQLITE_CHUNK:
+                self.replica.put_many(batch)
+                copied += len(batch)
+                batch = []
+        if batch:
+            self.replica.put_many(batch)
+            copied += len(batch)
+        self.replica.set_meta(self.CURSOR_KEY, int(started))
+        self.synced_at = time.monotonic()
+        log.info("Baseline replica synced: %d items (%s)", copied, "incremental" if since else "full")
+        return copied
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.sync()
+            except Exception as e:
+                log.error("Baseline replica sync failed: %s", e)
+
+    def start(self):
+        # The first sync runs in the caller: until it completes the replica
+        # may not know every user, and every actor would look new.
+        self.sync()
+        self._thread = threading.Thread(target=self._run, name="baseline-replica", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+def open_store(dynamodb, table, backend=BACKEND, path=SQLITE_PATH, version_attr=VERSION_ATTR, layout=LAYOUT):
+    if backend == "dynamodb":
+        if layout == "sharded":
+            return ShardedDynamoStore(dynamodb, table, version_attr)
+        if layout != "single":
+            raise ValueError(f"Unknown baseline_store layout: {layout}")
+        return DynamoStore(dynamodb, table, version_attr)
+    if backend == "sqlite":
+        return SqliteStore(path, version_attr)
+    if backend == "memory":
+        return MemoryStore(version_attr=version_attr)
+    raise ValueError(f"Unknown baseline_store backend: {backend}")
@@ -0,0 +1,41 @@
+from utils.hours import get_baselined_hours_ns
+from utils.trusted_networks import IP_FIELD, CIDR_FIELD, ip_trusted, network_index
+
+TRUSTED_FIELDS = ("known_ips", "user_agents", "regions", "services", "actions", "assumed_roles")
+
+_EMPTY = frozenset()
+
+class BaselineView:
+    # Read-only, hash-based form of a baseline item, built once per load so
+    # membership checks cost the same regardless of how many values a
+    # principal has accumulated.
+    __slots__ = ("username", "first_seen", "version", "trusted", "candidates", "trusted_hours", "networks")
+
+    def __init__(self, item, version_attr="baseline_version"):
+        self.username = item.get("username")
+        self.first_seen = item.get("first_seen")
+        self.version = item.get(version_attr)
+        self.trusted = {field: frozenset(item.get(field) or ()) for field in TRUSTED_FIELDS}
+
+        candidates = item.get("candidates") or {}
+        self.candidates = {
+            field: frozenset(values) if isinstance(values, dict) else _EMPTY
+            for field, values in candidates.items()
+        }
+        self.trusted_hours = frozenset(get_baselined_hours_ns(item))
+        # Addresses also match the principal's aggregated prefixes and the
+        # configured trusted networks, one trie walk per lookup.
+        self.networks = network_index(item.get(CIDR_FIELD)) if item.get(CIDR_FIELD) else None
+
+    def is_trusted(self, field, value):
+        if value in self.trusted.get(field, _EMPTY):
+            return True
+        return field == IP_FIELD and ip_trusted(value, self.networks)
+
+    def is_candidate(self, field, value):
+        return value in self.candidates.get(field, _EMPTY)
+
+    def is_known(self, field, value):
+        if value in self.trusted.get(field, _EMPTY) or value in self.candidates.get(field, _EMPTY):
+            return True
+        return field == IP_FIELD and ip_trusted(value, self.networks)
@@ -0,0 +1,33 @@
+import random
+import time
+
+BATCH_GET_LIMIT = 100
+
+def batch_get_items(dynamodb, table_name, keys, projection=None, attribute_names=None,
+                    max_retries=8, base_delay=0.05, max_delay=2.0):
+    items = []
+    for i in range(0, len(keys), BATCH_GET_LIMIT):
+        request = {"Keys": keys[i:i + BATCH_GET_LIMIT]}
+        if projection:
+            request["ProjectionExpression"] = projection
+        if attribute_names:
+            request["ExpressionAttributeNames"] = attribute_names
+
+        pending = {table_name: request}
+        attempt = 0
+        while pending:
+            resp = dynamodb.batch_get_item(RequestItems=pending)
+            items.extend(resp.get("Responses", {}).get(table_name, []))
+
+            pending = resp.get("UnprocessedKeys") or {}
+            if not pending:
+                break
+            if attempt >= max_retries:
+                left = len(pending.get(table_name, {}).get("Keys", []))
+                raise RuntimeError(f"batch_get_item left {left} unprocessed keys after {attempt} retries")
+
+            # Exponential backoff with jitter before re-requesting throttled keys.
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            attempt += 1
+    return items
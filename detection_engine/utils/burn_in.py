@@ -1,12 +1,14 @@
 
 from datetime import datetime, timedelta, timezone
 from utils.config_loader import load_config
+from utils.log import get_logger
 
 config = load_config()
+log = get_logger("detection")
 
-def is_in_burn_in_period(baseline_item):
+def is_in_burn_in_period(baseline):
     burn_in_days = config.get("detection", {}).get("burn_in_days", 3)
-    first_seen = baseline_item.get("first_seen")
+    first_seen = baseline.first_seen
     if not first_seen:
         return False
     try:
@@ -14,6 +16,6 @@ def is_in_burn_in_period(baseline_item):
         now_utc = datetime.now(timezone.utc)
         return now_utc < first_dt + timedelta(days=burn_in_days)
     except Exception as e:
-        print(f"[ERROR] Burn-in comparison failed: {e}", flush=True)
+        log.error("Burn-in comparison failed: %s", e)
         return False
 
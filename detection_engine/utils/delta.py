@@ -0,0 +1,400 @@
+from datetime import datetime
+
+from utils.baseline import (
+    VERSION_ATTR,
+    UPDATED_ATTR,
+    SEEN_ATTR,
+    SEEN_RESOLUTION,
+    _now_ts,
+    _days_to_seconds,
+    is_trusted,
+    should_promote_candidate,
+    alert_promotion
+)
+from utils.log import get_logger
+from utils.trusted_networks import IP_FIELD, CIDR_FIELD, aggregate, ip_trusted, network_index
+
+log = get_logger("baseline")
+
+HOURS_FIELD = "work_hours_utc"
+MAX_CLAUSES_PER_UPDATE = 50
+
+BASELINE_LIST_FIELDS = [
+    "known_ips",
+    "user_agents",
+    "regions",
+    "services",
+    "actions",
+    "assumed_roles",
+    "known_cidrs"
+]
+# Trusted values with a trusted_seen stamp; prefixes are not observed as such.
+SEEN_FIELDS = [f for f in BASELINE_LIST_FIELDS if f != CIDR_FIELD]
+
+def new_delta():
+    return {}
+
+def add_observation(delta, username, field_key, value, ts=None):
+    ts = ts or _now_ts()
+    values = delta.setdefault(username, {}).setdefault(field_key, {})
+    obs = values.get(value)
+    if obs is None:
+        values[value] = {"count": 1, "first_seen": ts, "last_seen": ts}
+    else:
+        obs["count"] += 1
+        obs["first_seen"] = min(obs["first_seen"], ts)
+        obs["last_seen"] = max(obs["last_seen"], ts)
+
+def merge_delta(into, other):
+    # Folds one file's delta into another, e.g. when per-file deltas are
+    # built in parallel and combined before a single write.
+    for username, fields in other.items():
+        user = into.setdefault(username, {})
+        for field_key, values in fields.items():
+            target = user.setdefault(field_key, {})
+            for value, obs in values.items():
+                prev = target.get(value)
+                if prev is None:
+                    target[value] = dict(obs)
+                else:
+                    prev["count"] += obs["count"]
+                    prev["first_seen"] = min(prev["first_seen"], obs["first_seen"])
+                    prev["last_seen"] = max(prev["last_seen"], obs["last_seen"])
+    return into
+
+def _hr(ts):
+    return datetime.utcfromtimestamp(int(ts)).isoformat() + "Z"
+
+def _merge_candidate(prev, obs, ttl):
+    prev = prev if isinstance(prev, dict) else {}
+    first_seen = min(prev.get("first_seen", obs["first_seen"]), obs["first_seen"])
+    hr = prev.get("first_seen_hr") if first_seen == prev.get("first_seen") else None
+    return {
+        "count": prev.get("count", 0) + obs["count"],
+        "first_seen": first_seen,
+        "first_seen_hr": hr or _hr(first_seen),
+        "last_seen": max(prev.get("last_seen", obs["last_seen"]), obs["last_seen"]),
+        "ttl": ttl
+    }
+
+def resolve_user_delta(item, fields, thresholds, replay=False):
+    # Decide locally, with the same rules as should_promote_candidate, which
+    # observed values become trusted and which stay (or become) candidates.
+    # replay: the delta holds archived events stamped with their own times;
+    # as when the archive is replayed through the engine, candidates are
+    # promoted on count alone rather than aged against the clock.
+    now_ts = _now_ts()
+    ttl = now_ts + _days_to_seconds(thresholds["max_age_days"] * 2)
+    existing = item.get("candidates") if isinstance(item.get("candidates"), dict) else {}
+    networks = network_index(item.get(CIDR_FIELD))
+
+    candidates = {}
+    promoted = {}
+    for field_key, values in fields.items():
+        prev_field = existing.get(field_key) or {}
+        for value, obs in values.items():
+            if is_trusted(item, field_key, value, networks):
+                continue
+            cand = _merge_candidate(prev_field.get(value), obs, ttl)
+            if replay:
+                promote = cand["count"] >= thresholds["min_count"]
+            else:
+                probe = {"candidates": {field_key: {value: cand}}}
+                promote = should_promote_candidate(probe, field_key, value, thresholds)
+            if promote:
+                promoted.setdefault(field_key, []).append(value)
+            else:
+                candidates.setdefault(field_key, {})[value] = cand
+    return candidates, promoted
+
+def fold_networks(item, candidates, promoted):
+    # When newly promoted addresses fill a covering prefix (with the ones
+    # already trusted), the prefix is promoted into known_cidrs and the
+    # addresses it covers leave known_ips, so the list stops growing with
+    # every address of a NAT pool or VPC range. Candidates inside the new
+    # prefixes are trusted from now on and are dropped as well. Returns
+    # (candidates, promoted, removed), removed being {field: values} to take
+    # out of both the trusted list and the candidates map. Promoted addresses
+    # stay in `promoted` so their promotion is still written and alerted.
+    item = item or {}
+    new_ips = promoted.get(IP_FIELD)
+    if not new_ips:
+        return candidates, promoted, {}
+    cidrs, covered = aggregate(list(item.get(IP_FIELD) or []) + list(new_ips))
+    if not cidrs:
+        return candidates, promoted, {}
+
+    known = item.get(CIDR_FIELD) or []
+    fresh = [c for c in cidrs if c not in known]
+    removed = set(covered)
+    if fresh:
+        promoted = dict(promoted)
+        promoted[CIDR_FIELD] = fresh
+        networks = network_index(fresh)
+        existing = item.get("candidates") if isinstance(item.get("candidates"), dict) else {}
+        pending = set(existing.get(IP_FIELD) or ()) | set(candidates.get(IP_FIELD) or ())
+        removed.update(v for v in pending if ip_trusted(v, networks))
+        if candidates.get(IP_FIELD):
+            candidates = dict(candidates)
+            candidates[IP_FIELD] = {v: c for v, c in candidates[IP_FIELD].items() if v not in removed}
+    return candidates, promoted, {IP_FIELD: removed}
+
+def seen_updates(item, fields, promoted, removed):
+    # {field: {value: last_seen}} of trusted values to restamp: observed in
+    # this delta and never stamped or stamped SEEN_RESOLUTION ago, including
+    # values promoted just now. Writers drop the stamps of removed values.
+    item = item or {}
+    stamps = item.get(SEEN_ATTR) if isinstance(item.get(SEEN_ATTR), dict) else {}
+    seen = {}
+    for field_key in SEEN_FIELDS:
+        values = fields.get(field_key)
+        if not values:
+            continue
+        dropped = removed.get(field_key) or ()
+        trusted = set(item.get(field_key) or ()) | set(promoted.get(field_key) or ())
+        field_stamps = stamps.get(field_key) if isinstance(stamps.get(field_key), dict) else {}
+        for value, obs in values.items():
+            if value not in trusted or value in dropped:
+                continue
+            if obs["last_seen"] - int(field_stamps.get(value, 0)) >= SEEN_RESOLUTION:
+                seen.setdefault(field_key, {})[value] = obs["last_seen"]
+    return seen
+
+def _added(promoted, removed, field_key):
+    dropped = removed.get(field_key) or ()
+    return [v for v in promoted.get(field_key, []) if v not in dropped]
+
+def _new_item(username, candidates, promoted, removed=None, seen=None):
+    removed = removed or {}
+    item = {
+        "username": username,
+        "first_seen": datetime.utcnow().isoformat() + "Z",
+        "candidates": candidates,
+        VERSION_ATTR: 1,
+        UPDATED_ATTR: _now_ts()
+    }
+    for field_key in BASELINE_LIST_FIELDS:
+        item[field_key] = _added(promoted, removed, field_key)
+    if promoted.get(HOURS_FIELD):
+        item["work_hours_utc_ns"] = set(int(h) for h in promoted[HOURS_FIELD])
+    if seen:
+        item[SEEN_ATTR] = seen
+    return item
+
+def merged_item(username, item, candidates, promoted, removed=None, seen=None):
+    # The whole item after applying a resolved delta, for writers that put
+    # complete items (batch_writer) instead of issuing update expressions.
+    removed = removed or {}
+    if not item:
+        return _new_item(username, candidates, promoted, removed, seen)
+
+    merged = dict(item)
+    for field_key in BASELINE_LIST_FIELDS:
+        dropped = removed.get(field_key) or ()
+        current = [v for v in item.get(field_key) or [] if v not in dropped]
+        current += [v for v in _added(promoted, removed, field_key) if v not in current]
+        merged[field_key] = current
+    if promoted.get(HOURS_FIELD):
+        merged["work_hours_utc_ns"] = set(item.get("work_hours_utc_ns") or ()) | set(int(h) for h in promoted[HOURS_FIELD])
+
+    existing = item.get("candidates") if isinstance(item.get("candidates"), dict) else {}
+    cands = {f: dict(v) for f, v in existing.items() if isinstance(v, dict)}
+    for field_key, values in list(promoted.items()) + list(removed.items()):
+        for value in values:
+            cands.get(field_key, {}).pop(value, None)
+    for field_key, values in candidates.items():
+        cands.setdefault(field_key, {}).update(values)
+    merged["candidates"] = cands
+
+    existing = item.get(SEEN_ATTR) if isinstance(item.get(SEEN_ATTR), dict) else {}
+    stamps = {f: dict(v) for f, v in existing.items() if isinstance(v, dict)}
+    for field_key, values in removed.items():
+        for value in values:
+            stamps.get(field_key, {}).pop(value, None)
+    for field_key, values in (seen or {}).items():
+        stamps.setdefault(field_key, {}).update(values)
+    if stamps:
+        merged[SEEN_ATTR] = stamps
+    merged[VERSION_ATTR] = int(item.get(VERSION_ATTR, 0)) + 1
+    merged[UPDATED_ATTR] = _now_ts()
+    return merged
+
+def _seen_clauses(item, removed, seen):
+    # Same shape rules as candidates: a missing map is SET whole, nested
+    # paths are only used under maps the item already has.
+    clauses = []
+    stamps = item.get(SEEN_ATTR)
+    if not isinstance(stamps, dict):
+        if seen:
+            clauses.append(("SET", "#seen = :seen", {"#seen": SEEN_ATTR}, {":seen": seen}))
+        return clauses
+
+    for n, (field_key, values) in enumerate(seen.items()):
+        if not isinstance(stamps.get(field_key), dict):
+            clauses.append((
+                "SET", f"#seen.#sf{n} = :sf{n}",
+                {"#seen": SEEN_ATTR, f"#sf{n}": field_key}, {f":sf{n}": values}
+            ))
+            continue
+        for m, (value, ts) in enumerate(values.items()):
+            clauses.append((
+                "SET", f"#seen.#sf{n}.#sv{n}_{m} = :sv{n}_{m}",
+                {"#seen": SEEN_ATTR, f"#sf{n}": field_key, f"#sv{n}_{m}": value}, {f":sv{n}_{m}": ts}
+            ))
+    for n, (field_key, values) in enumerate(removed.items()):
+        field_stamps = stamps.get(field_key)
+        if not isinstance(field_stamps, dict):
+            continue
+        for m, value in enumerate(v for v in values if v in field_stamps):
+            clauses.append((
+                "REMOVE", f"#seen.#sr{n}.#srv{n}_{m}",
+                {"#seen": SEEN_ATTR, f"#sr{n}": field_key, f"#srv{n}_{m}": value}, {}
+            ))
+    return clauses
+
+def _update_clauses(item, candidates, promoted, removed=None, seen=None):
+    removed = removed or {}
+    clauses = _seen_clauses(item, removed, seen or {})
+    existing = item.get("candidates")
+
+    for n, (field_key, values) in enumerate(promoted.items()):
+        if field_key == HOURS_FIELD:
+            clauses.append((
+                "ADD", "work_hours_utc_ns :ph",
+                {}, {":ph": set(int(h) for h in values)}
+            ))
+        elif removed.get(field_key):
+            # Lists can only shrink by index, so the field is rewritten
+            # (smaller) from the item just read.
+            dropped = removed[field_key]
+            current = [v for v in item.get(field_key) or [] if v not in dropped]
+            current += [v for v in _added(promoted, removed, field_key) if v not in current]
+            clauses.append((
+                "SET", f"#pf{n} = :pv{n}",
+                {f"#pf{n}": field_key}, {f":pv{n}": current}
+            ))
+        else:
+            clauses.append((
+                "SET", f"#pf{n} = list_append(if_not_exists(#pf{n}, :empty_list), :pv{n})",
+                {f"#pf{n}": field_key}, {f":pv{n}": list(values), ":empty_list": []}
+            ))
+
+    if not isinstance(existing, dict):
+        if candidates:
+            clauses.append(("SET", "candidates = :cands", {}, {":cands": candidates}))
+        return clauses
+
+    for n, field_key in enumerate(set(candidates) | set(promoted) | set(removed)):
+        prev_field = existing.get(field_key)
+        new_values = candidates.get(field_key, {})
+
+        if not isinstance(prev_field, dict):
+            if new_values:
+                clauses.append((
+                    "SET", f"candidates.#cf{n} = :cf{n}",
+                    {f"#cf{n}": field_key}, {f":cf{n}": new_values}
+                ))
+            continue
+
+        for m, (value, cand) in enumerate(new_values.items()):
+            clauses.append((
+                "SET", f"candidates.#cf{n}.#cv{n}_{m} = :cv{n}_{m}",
+                {f"#cf{n}": field_key, f"#cv{n}_{m}": value}, {f":cv{n}_{m}": cand}
+            ))
+        dropped = set(promoted.get(field_key, [])) | set(removed.get(field_key, ()))
+        for m, value in enumerate(dropped):
+            if value in prev_field:
+                clauses.append((
+                    "REMOVE", f"candidates.#cf{n}.#rv{n}_{m}",
+                    {f"#cf{n}": field_key, f"#rv{n}_{m}": value}, {}
+                ))
+    return clauses
+
+def _run_update(table, username, clauses):
+    sections = {"SET": ["#upd = :now"], "ADD": ["#ver :one"]}
+    names = {"#ver": VERSION_ATTR, "#upd": UPDATED_ATTR}
+    values = {":one": 1, ":now": _now_ts()}
+    for action, expr, c_names, c_values in clauses:
+        sections.setdefault(action, []).append(expr)
+        names.update(c_names)
+        values.update(c_values)
+
+    kwargs = {
+        "Key": {"username": username},
+        "UpdateExpression": " ".join(
+            f"{action} {', '.join(exprs)}" for action, exprs in sections.items()
+        )
+    }
+    if names:
+        kwargs["ExpressionAttributeNames"] = names
+    if values:
+        kwargs["ExpressionAttributeValues"] = values
+    table.update_item(**kwargs)
+
+def _alert_promotions(username, promoted, write_alert):
+    for field_key, values in promoted.items():
+        for value in values:
+            log.info("Promoted value '%s' for user '%s' under field '%s'", value, username, field_key)
+            alert_promotion(username, field_key, value, write_alert)
+    return sum(len(v) for v in promoted.values())
+
+def apply_user_delta(username, fields, store, thresholds, write_alert):
+    item = store.get(username)
+    candidates, promoted = resolve_user_delta(item, fields, thresholds)
+    candidates, promoted, removed = fold_networks(item, candidates, promoted)
+    seen = seen_updates(item, fields, promoted, removed)
+    table = store.table
+
+    if not item:
+        log.info("New actor detected for baseline: %s", username)
+    if store.sharded:
+        store.write_resolved(username, item, candidates, promoted, removed, seen)
+    elif not item:
+        table.put_item(Item=_new_item(username, candidates, promoted, removed, seen))
+    else:
+        clauses = _update_clauses(item, candidates, promoted, removed, seen)
+        for i in range(0, len(clauses), MAX_CLAUSES_PER_UPDATE):
+            _run_update(table, username, clauses[i:i + MAX_CLAUSES_PER_UPDATE])
+
+    return _alert_promotions(username, promoted, write_alert)
+
+def merge_into_items(store, delta, thresholds, replay=False):
+    # Whole-item path for stores without update expressions: every user in
+    # the delta is resolved against its current item and rewritten in one
+    # store.transform(). Returns {username: promoted} once it has committed.
+    promotions = {}
+
+    def resolve(username, item):
+        candidates, promoted = resolve_user_delta(item, delta[username], thresholds, replay)
+        candidates, promoted, removed = fold_networks(item, candidates, promoted)
+        seen = seen_updates(item, delta[username], promoted, removed)
+        if not item:
+            log.info("New actor detected for baseline: %s", username)
+        promotions[username] = promoted
+        return merged_item(username, item, candidates, promoted, removed, seen)
+
+    store.transform(list(delta), resolve)
+    return promotions
+
+def apply_delta(delta, store, thresholds, write_alert, failed=None):
+    # Users whose delta could not be written are logged and, if a `failed`
+    # set is given, added to it.
+    if not store.native_updates:
+        try:
+            promotions = merge_into_items(store, delta, thresholds)
+        except Exception as e:
+            log.error("Failed to apply baseline delta for %d users: %s", len(delta), e)
+            if failed is not None:
+                failed.update(delta)
+            return 0
+        return sum(_alert_promotions(u, promoted, write_alert) for u, promoted in promotions.items())
+
+    promoted = 0
+    for username, fields in delta.items():
+        try:
+            promoted += apply_user_delta(username, fields, store, thresholds, write_alert)
+        except Exception as e:
+            log.error("Failed to apply baseline delta for %s: %s", username, e)
+            if failed is not None:
+                failed.add(username)
+    return promoted
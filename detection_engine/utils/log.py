@@ -0,0 +1,150 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+from utils.config_loader import load_config
+
+cfg = load_config()
+LOG_CFG = cfg.get("logging", {}) or {}
+LEVEL = str(LOG_CFG.get("level", "INFO")).upper()
+QUEUE_SIZE = LOG_CFG.get("queue_size", 10000)
+RATE_LIMIT = LOG_CFG.get("rate_limit_per_key", 20)
+RATE_WINDOW = LOG_CFG.get("rate_window_seconds", 60)
+SAMPLE_EVERY = LOG_CFG.get("sample_every", 0)
+
+ROOT_LOGGER = "trailblazer"
+SUMMARY_LOGGER = f"{ROOT_LOGGER}.summary"
+EMF_LOGGER = f"{ROOT_LOGGER}.emf"
+UNLIMITED = (SUMMARY_LOGGER, EMF_LOGGER)
+
+class RateLimitFilter(logging.Filter):
+    # Limits each message template (record.msg, before %-formatting) to
+    # `limit` lines per window. Past the limit every `sample_every`-th line
+    # still goes through (0 drops them all); the first line after a drop
+    # carries the number of lines suppressed for that template. ERROR and
+    # above are never limited.
+    def __init__(self, limit=RATE_LIMIT, window=RATE_WINDOW, sample_every=SAMPLE_EVERY):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.sample_every = sample_every
+        self._lock = threading.Lock()
+        self._keys = {}
+        self.dropped = 0
+
+    def filter(self, record):
+        if not self.limit or record.levelno >= logging.ERROR or record.name in UNLIMITED:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            state = self._keys.get(key)
+            if state is None or now - state[0] >= self.window:
+                if len(self._keys) > 10000:
+                    self._keys.clear()
+                suppressed = state[2] if state else 0
+                state = self._keys[key] = [now, 0, 0]
+            else:
+                suppressed = state[2]
+            state[1] += 1
+            seen = state[1]
+            allowed = seen <= self.limit or (self.sample_every and (seen - self.limit) % self.sample_every == 0)
+            if not allowed:
+                state[2] += 1
+                self.dropped += 1
+                return False
+            state[2] = 0
+
+        if suppressed:
+            record.msg = f"{record.msg} [{suppressed} similar suppressed]"
+        return True
+
+class TagFormatter(logging.Formatter):
+    # Keeps the "[LEVEL] message" shape the engines have always logged.
+    def format(self, record):
+        if record.name == EMF_LOGGER:
+            # CloudWatch only extracts metrics from lines that are pure JSON.
+            return record.getMessage()
+        tag = "SUMMARY" if record.name == SUMMARY_LOGGER else record.levelname
+        line = f"[{tag}] {record.getMessage()}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+class AsyncHandler(logging.handlers.QueueHandler):
+    # Callers only enqueue the record; a listener thread formats and writes
+    # it. Like the alert buffer, the listener is (re)started per process
+    # since threads do not survive fork(). A full queue drops the record
+    # instead of blocking the caller.
+    def __init__(self, target, maxsize=QUEUE_SIZE):
+        super().__init__(queue.Queue(maxsize))
+        self.target = target
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._pid = None
+        self._listener = None
+        self._atexit_pid = None
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self.queue = queue.Queue(self.maxsize)
+        self._listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=True)
+        self._listener.start()
+        if self._atexit_pid != self._pid:
+            atexit.register(self.stop)
+            self._atexit_pid = self._pid
+
+    def stop(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+            self._pid = None
+
+    def prepare(self, record):
+        # Formatting is left to the listener thread. Arguments are plain
+        # values (strings, numbers) that are not mutated after logging.
+        return record
+
+    def enqueue(self, record):
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def _build_handler():
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(TagFormatter())
+    handler = AsyncHandler(stream)
+    handler.addFilter(RateLimitFilter())
+    return handler
+
+root = logging.getLogger(ROOT_LOGGER)
+root.setLevel(getattr(logging, LEVEL, logging.INFO))
+root.propagate = False
+handler = _build_handler()
+root.addHandler(handler)
+
+# The per-file summary and metric lines are emitted whatever the configured level.
+logging.getLogger(SUMMARY_LOGGER).setLevel(logging.INFO)
+logging.getLogger(EMF_LOGGER).setLevel(logging.INFO)
+
+def get_logger(name):
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+def log_summary(kind, **fields):
+    logging.getLogger(SUMMARY_LOGGER).info("%s", json.dumps({"kind": kind, **fields}, default=str, sort_keys=True))
+
+def flush_logs():
+    handler.stop()
+
+def logging_stats():
+    return {"dropped_rate_limited": handler.filters[0].dropped, "dropped_queue_full": handler.dropped}
@@ -0,0 +1,54 @@
+from datetime import datetime
+
+from utils.suppression import is_suppressed, suppressed_field
+from utils.trusted_networks import IP_FIELD, ip_trusted
+from utils.log import get_logger
+
+log = get_logger("baseline")
+
+FIELD_MAP = {
+    "sourceIPAddress": "known_ips",
+    "awsRegion":       "regions",
+    "userAgent":       "user_agents",
+    "eventSource":     "services"
+}
+
+def _is_value_suppressed(username, raw_key, val):
+    # User-agent substrings only apply to the userAgent field; per-field
+    # rules apply to whichever field they name.
+    if is_suppressed(username, val if raw_key == "userAgent" else None):
+        return True
+    return suppressed_field(username, raw_key, val) is not None
+
+def extract_observations(record, username):
+    observations = []
+
+    for raw_key, base_key in FIELD_MAP.items():
+        val = record.get(raw_key)
+        if not val or _is_value_suppressed(username, raw_key, val):
+            continue
+        if base_key == IP_FIELD and ip_trusted(val):
+            # Inside a configured trusted network; never a candidate.
+            continue
+        observations.append((base_key, val))
+
+    timestamp = record.get("eventTime")
+    if timestamp:
+        try:
+            event_hour = datetime.fromisoformat(timestamp.replace("Z", "+00:00")).hour
+            observations.append(("work_hours_utc", str(event_hour).zfill(2)))
+        except Exception as e:
+            log.warning("Could not parse eventTime for work-hours: %s", e)
+
+    if record.get("eventName") == "AssumeRole":
+        role_arn = record.get("requestParameters", {}).get("roleArn")
+        if role_arn:
+            observations.append(("assumed_roles", role_arn))
+
+    service = record.get("eventSource", "unknown").replace(".amazonaws.com", "")
+    action = record.get("eventName", "unknown")
+    action_key = f"{service}:{action}"
+    if suppressed_field(username, "action", action_key) is None:
+        observations.append(("actions", action_key))
+
+    return observations
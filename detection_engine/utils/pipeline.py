@@ -0,0 +1,241 @@
+import queue
+import threading
+import time
+
+from utils.config_loader import load_config
+from utils.cloudtrail_reader import iter_records
+from utils.log import get_logger
+from utils import metrics
+
+cfg = load_config()
+PIPELINE_CFG = cfg.get("pipeline", {}) or {}
+ENABLED = PIPELINE_CFG.get("enabled", True)
+FETCH_WORKERS = PIPELINE_CFG.get("fetch_workers", 2)
+DECODE_WORKERS = PIPELINE_CFG.get("decode_workers", 1)
+FETCH_QUEUE = PIPELINE_CFG.get("fetch_queue", 4)
+BATCH_QUEUE = PIPELINE_CFG.get("batch_queue", 2)
+SINK_QUEUE = PIPELINE_CFG.get("sink_queue", 4)
+BATCH_RECORDS = PIPELINE_CFG.get("batch_records", 5000)
+
+log = get_logger("pipeline")
+
+_END = object()
+# Returned by finish() when the file's outcome is only known later; the
+# engine then reports it with complete(task, ok).
+DEFERRED = object()
+
+def _close(body):
+    close = getattr(body, "close", None)
+    if close is not None:
+        try:
+            close()
+        except Exception:
+            pass
+
+class FileTask:
+    __slots__ = ("bucket", "key", "etag", "callback", "started", "data", "request_s",
+                 "stats", "batches", "error", "drained")
+
+    def __init__(self, bucket, key, etag, callback):
+        self.bucket = bucket
+        self.key = key
+        self.etag = etag
+        self.callback = callback
+        self.started = None
+        self.data = None
+        self.request_s = 0.0
+        self.stats = {}
+        self.batches = None
+        self.error = None
+        self.drained = False
+
+class TaskGroup:
+    # Completes once every object of one SQS message has finished; `done`
+    # gets True only if all of them succeeded.
+    def __init__(self, count, done):
+        self.remaining = count
+        self.ok = True
+        self.done = done
+        self._lock = threading.Lock()
+        if count == 0:
+            done(True)
+
+    def task_done(self, ok):
+        with self._lock:
+            self.ok = self.ok and ok
+            self.remaining -= 1
+            finished = self.remaining == 0
+        if finished:
+            self.done(self.ok)
+
+class FilePipeline:
+    # fetch (threads) -> decode (threads) -> evaluate (one thread) -> sink
+    # (one thread), joined by bounded queues. Fetch threads claim the object
+    # and open its body; decode threads stream it (download, gunzip, parse)
+    # into record batches; the evaluator runs the engine's per-file logic,
+    # one file at a time, while the next files download and decode; the sink
+    # waits for the file's alerts and settles the ledger. A full queue blocks
+    # the stage before it, so at most fetch_queue + fetch_workers +
+    # decode_workers bodies are open (keep it below the S3 client's
+    # connection pool), only decode_workers * batch_queue record batches are
+    # held in memory, and submit() blocks the SQS loop when all are in use.
+    #
+    # Hooks, supplied by the engine:
+    #   fetch(bucket, key) -> readable body      on a fetch thread
+    #   claim(task) -> True | False | None        process / already done / busy
+    #   evaluate(task, batches) -> result         on the evaluator thread
+    #   finish(task, result) -> ok | DEFERRED     on the sink thread
+    def __init__(self, fetch, claim, evaluate, finish, fetch_workers=FETCH_WORKERS,
+                 decode_workers=DECODE_WORKERS, fetch_queue=FETCH_QUEUE, batch_queue=BATCH_QUEUE,
+                 sink_queue=SINK_QUEUE, batch_records=BATCH_RECORDS):
+        self.fetch = fetch
+        self.claim = claim
+        self.evaluate = evaluate
+        self.finish = finish
+        self.fetch_workers = max(fetch_workers, 1)
+        self.decode_workers = max(decode_workers, 1)
+        self.batch_queue = max(batch_queue, 1)
+        self.batch_records = batch_records
+
+        self._fetch_q = queue.Queue(max(fetch_queue, 1))
+        self._decode_q = queue.Queue(max(fetch_queue, 1))
+        self._eval_q = queue.Queue(self.decode_workers)
+        self._sink_q = queue.Queue(max(sink_queue, 1))
+
+        self._cond = threading.Condition()
+        self._outstanding = 0
+        self._active = {}
+        self._started = False
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        stages = (
+            [(f"pipeline-fetch-{i}", self._fetch_loop) for i in range(self.fetch_workers)]
+            + [(f"pipeline-decode-{i}", self._decode_loop) for i in range(self.decode_workers)]
+            + [("pipeline-evaluate", self._evaluate_loop), ("pipeline-sink", self._sink_loop)]
+        )
+        for name, target in stages:
+            threading.Thread(target=target, name=name, daemon=True).start()
+        log.info("Pipeline started: fetch=%d, decode=%d", self.fetch_workers, self.decode_workers)
+
+    def submit(self, bucket, key, etag, callback):
+        # The same object arriving twice while in flight (duplicate
+        # notifications) shares the first task's outcome.
+        self.start()
+        object_key = (bucket, key, etag)
+        with self._cond:
+            waiters = self._active.get(object_key)
+            if waiters is not None:
+                waiters.append(callback)
+                return
+            self._active[object_key] = [callback]
+            self._outstanding += 1
+        self._fetch_q.put(FileTask(bucket, key, etag, callback))
+
+    def wait_idle(self, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(lambda: self._outstanding == 0, timeout=timeout)
+
+    def complete(self, task, ok):
+        # Settles a task whose finish() returned DEFERRED; any thread.
+        self._done(task, ok)
+
+    def _done(self, task, ok):
+        with self._cond:
+            waiters = self._active.pop((task.bucket, task.key, task.etag), [task.callback])
+        for callback in waiters:
+            try:
+                callback(ok)
+            except Exception as e:
+                log.error("Completion callback failed for %s/%s: %s", task.bucket, task.key, e)
+        with self._cond:
+            self._outstanding -= 1
+            self._cond.notify_all()
+
+    def _fetch_loop(self):
+        while True:
+            task = self._fetch_q.get()
+            try:
+                claimed = self.claim(task)
+            except Exception as e:
+                log.error("Failed to claim %s/%s: %s", task.bucket, task.key, e)
+                claimed = None
+            if claimed is not True:
+                self._done(task, claimed is False)
+                continue
+
+            task.started = time.monotonic()
+            started = time.perf_counter()
+            try:
+                task.data = self.fetch(task.bucket, task.key)
+            except Exception as e:
+                task.error = e
+            task.request_s = time.perf_counter() - started
+            self._decode_q.put(task)
+
+    def _decode_loop(self):
+        while True:
+            task = self._decode_q.get()
+            task.batches = queue.Queue(self.batch_queue)
+            # Queued for evaluation first so files are evaluated in the order
+            # decoding started, while this thread keeps filling the batches.
+            self._eval_q.put(task)
+            if task.error is not None:
+                task.batches.put(task.error)
+                continue
+            try:
+                batch = []
+                records = iter_records(task.data, task.stats, request_s=task.request_s)
+                for record in records:
+                    batch.append(record)
+                    if len(batch) >= self.batch_records:
+                        task.batches.put(batch)
+                        batch = []
+                if batch:
+                    task.batches.put(batch)
+                task.batches.put(_END)
+            except Exception as e:
+                task.batches.put(e)
+            finally:
+                _close(task.data)
+                task.data = None
+
+    def _iter_batches(self, task):
+        while True:
+            item = task.batches.get()
+            if item is _END:
+                task.drained = True
+                return
+            if isinstance(item, Exception):
+                task.drained = True
+                raise item
+            yield item
+
+    def _evaluate_loop(self):
+        while True:
+            task = self._eval_q.get()
+            result = None
+            try:
+                result = self.evaluate(task, self._iter_batches(task))
+            except Exception as e:
+                log.error("Failed to evaluate %s/%s: %s", task.bucket, task.key, e)
+            # Unblock the decoder if evaluation stopped early.
+            while not task.drained:
+                item = task.batches.get()
+                task.drained = item is _END or isinstance(item, Exception)
+            metrics.set_gauge("pipeline_fetch_queue", self._fetch_q.qsize())
+            metrics.set_gauge("pipeline_decode_queue", self._decode_q.qsize())
+            self._sink_q.put((task, result))
+
+    def _sink_loop(self):
+        while True:
+            task, result = self._sink_q.get()
+            try:
+                ok = self.finish(task, result)
+            except Exception as e:
+                log.error("Failed to finish %s/%s: %s", task.bucket, task.key, e)
+                ok = False
+            if ok is not DEFERRED:
+                self._done(task, ok)
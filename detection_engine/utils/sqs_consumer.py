@@ -0,0 +1,233 @@
+import os
+import queue
+import threading
+import time
+
+from utils.config_loader import load_config
+from utils.log import get_logger
+from utils import metrics
+
+cfg = load_config()
+SQS_CFG = cfg.get("sqs", {}) or {}
+MAX_MESSAGES = SQS_CFG.get("max_messages", 10)
+WAIT_SECONDS = SQS_CFG.get("wait_time_seconds", 20)
+VISIBILITY_TIMEOUT = SQS_CFG.get("visibility_timeout_seconds", 300)
+HEARTBEAT_SECONDS = SQS_CFG.get("heartbeat_seconds", 60)
+MAX_IN_FLIGHT = SQS_CFG.get("max_in_flight", 20)
+DELETE_INTERVAL = SQS_CFG.get("delete_interval_seconds", 1)
+
+# SQS caps a message's total visibility at 12 hours from its receipt.
+MAX_VISIBILITY = 12 * 3600
+BATCH_LIMIT = 10
+
+log = get_logger("sqs")
+
+class _InFlight:
+    __slots__ = ("msg", "received", "deadline")
+
+    def __init__(self, msg, received, deadline):
+        self.msg = msg
+        self.received = received
+        self.deadline = deadline
+
+class SqsConsumer:
+    # Receives on a background thread so the next batch is already waiting
+    # when the engine finishes the current one. Every message handed out is
+    # in flight until ack() (deleted in batches) or release() (made visible
+    # again for redelivery). While in flight its visibility is extended, so a
+    # slow file is not redelivered to another consumer mid-processing.
+    # Receiving pauses while max_in_flight messages are outstanding.
+    def __init__(self, sqs, queue_url, max_messages=MAX_MESSAGES, wait_seconds=WAIT_SECONDS,
+                 visibility_timeout=VISIBILITY_TIMEOUT, heartbeat_seconds=HEARTBEAT_SECONDS,
+                 max_in_flight=MAX_IN_FLIGHT, delete_interval=DELETE_INTERVAL):
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.max_messages = min(max_messages, BATCH_LIMIT)
+        self.wait_seconds = wait_seconds
+        self.visibility_timeout = visibility_timeout
+        self.heartbeat_seconds = heartbeat_seconds
+        self.max_in_flight = max(max_in_flight, 1)
+        self.delete_interval = delete_interval
+
+        self._cond = threading.Condition()
+        self._ready = queue.Queue()
+        self._in_flight = {}
+        self._deletes = []
+        self._stopped = False
+        self._threads = []
+        self._pid = None
+
+        self.received = 0
+        self.deleted = 0
+        self.delete_failures = 0
+        self.extended = 0
+
+    def start(self):
+        # Threads do not survive fork(); start in the process that consumes.
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._threads = [
+            threading.Thread(target=self._receiver, name="sqs-receiver", daemon=True),
+            threading.Thread(target=self._maintainer, name="sqs-heartbeat", daemon=True)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def _receiver(self):
+        while not self._stopped:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped or len(self._in_flight) < self.max_in_flight)
+                if self._stopped:
+                    return
+                room = self.max_in_flight - len(self._in_flight)
+            try:
+                resp = self.sqs.receive_message(
+                    QueueUrl=self.queue_url,
+                    MaxNumberOfMessages=min(self.max_messages, room),
+                    WaitTimeSeconds=self.wait_seconds,
+                    VisibilityTimeout=self.visibility_timeout,
+                    AttributeNames=["SentTimestamp", "ApproximateReceiveCount"]
+                )
+            except Exception as e:
+                log.error("SQS polling failed: %s", e)
+                time.sleep(1)
+                continue
+
+            messages = resp.get("Messages", [])
+            log.debug("Received %d messages", len(messages))
+            now = time.monotonic()
+            with self._cond:
+                for msg in messages:
+                    self._in_flight[msg["MessageId"]] = _InFlight(msg, now, now + self.visibility_timeout)
+                self.received += len(messages)
+                metrics.set_gauge("sqs_in_flight", len(self._in_flight))
+            for msg in messages:
+                self._ready.put(msg)
+
+    def _maintainer(self):
+        interval = max(min(self.heartbeat_seconds, self.delete_interval or self.heartbeat_seconds), 0.05)
+        last_heartbeat = time.monotonic()
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped or len(self._deletes) >= BATCH_LIMIT, timeout=interval)
+                stopping = self._stopped
+            self._flush_deletes()
+            if stopping:
+                return
+            if time.monotonic() - last_heartbeat >= self.heartbeat_seconds:
+                last_heartbeat = time.monotonic()
+                self._heartbeat()
+
+    def _heartbeat(self):
+        # Extend anything that would become visible before the next beat.
+        now = time.monotonic()
+        horizon = now + 2 * self.heartbeat_seconds
+        with self._cond:
+            due = [
+                entry for entry in self._in_flight.values()
+                if entry.deadline <= horizon and now - entry.received + self.visibility_timeout < MAX_VISIBILITY
+            ]
+        for i in range(0, len(due), BATCH_LIMIT):
+            chunk = due[i:i + BATCH_LIMIT]
+            try:
+                resp = self.sqs.change_message_visibility_batch(
+                    QueueUrl=self.queue_url,
+                    Entries=[
+                        {"Id": str(n), "ReceiptHandle": e.msg["ReceiptHandle"], "VisibilityTimeout": self.visibility_timeout}
+                        for n, e in enumerate(chunk)
+                    ]
+                )
+            except Exception as e:
+                log.error("Failed to extend message visibility: %s", e)
+                continue
+            failed = {f["Id"]: f for f in resp.get("Failed", [])}
+            for n, entry in enumerate(chunk):
+                if str(n) in failed:
+                    log.warning("Could not extend visibility of %s: %s",
+                                entry.msg["MessageId"], failed[str(n)].get("Code"))
+                    continue
+                entry.deadline = now + self.visibility_timeout
+                self.extended += 1
+                metrics.inc("sqs_visibility_extensions")
+        if due:
+            log.debug("Extended visibility of %d in-flight messages", len(due))
+
+    def _flush_deletes(self):
+        with self._cond:
+            pending, self._deletes = self._deletes, []
+        for i in range(0, len(pending), BATCH_LIMIT):
+            chunk = pending[i:i + BATCH_LIMIT]
+            entries = [{"Id": str(n), "ReceiptHandle": msg["ReceiptHandle"]} for n, msg in enumerate(chunk)]
+            try:
+                resp = self.sqs.delete_message_batch(QueueUrl=self.queue_url, Entries=entries)
+                failed = resp.get("Failed", [])
+            except Exception as e:
+                failed = [{"Id": entry["Id"], "Code": str(e)} for entry in entries]
+            for f in failed:
+                # The message comes back after its visibility timeout; the
+                # processed-object ledger makes the second pass a no-op.
+                log.error("Failed to delete message %s: %s", chunk[int(f["Id"])]["MessageId"], f.get("Code"))
+            self.deleted += len(chunk) - len(failed)
+            self.delete_failures += len(failed)
+            metrics.inc("sqs_deleted", len(chunk) - len(failed))
+            if failed:
+                metrics.inc("sqs_delete_failures", len(failed))
+
+    def get_batch(self, max_messages=BATCH_LIMIT, timeout=None):
+        # Blocks for the first message, then takes whatever else is ready.
+        self.start()
+        try:
+            batch = [self._ready.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < max_messages:
+            try:
+                batch.append(self._ready.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _finish(self, msg):
+        with self._cond:
+            self._in_flight.pop(msg["MessageId"], None)
+            metrics.set_gauge("sqs_in_flight", len(self._in_flight))
+            self._cond.notify_all()
+
+    def ack(self, msg):
+        log.debug("Acknowledging message %s", msg["MessageId"])
+        with self._cond:
+            self._deletes.append(msg)
+        self._finish(msg)
+
+    def release(self, msg, delay=0):
+        # No more heartbeats, and the message becomes visible again after
+        # `delay` seconds rather than whatever is left of its visibility
+        # timeout, so a failed file is retried right away. If the change
+        # fails, SQS still redelivers once the visibility lapses.
+        self._finish(msg)
+        try:
+            self.sqs.change_message_visibility(
+                QueueUrl=self.queue_url, ReceiptHandle=msg["ReceiptHandle"], VisibilityTimeout=delay
+            )
+        except Exception as e:
+            log.warning("Could not release message %s: %s", msg["MessageId"], e)
+
+    def in_flight(self):
+        with self._cond:
+            return len(self._in_flight)
+
+    def stats(self):
+        return {
+            "received": self.received, "deleted": self.deleted, "delete_failures": self.delete_failures,
+            "visibility_extensions": self.extended, "in_flight": self.in_flight()
+        }
+
+    def close(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for t in self._threads:
+            if t.name == "sqs-heartbeat":
+                t.join(timeout=10)
+        self._flush_deletes()
@@ -1,12 +1,222 @@
-SUPPRESSION_CONFIG = {
+import fnmatch
+import re
+
+from utils.cidr_trie import CidrTrie
+from utils.config_loader import load_config
+
+DEFAULT_SUPPRESSION = {
+    "actor_types": ["service", "anonymous"],
+    "usernames": ["unknown"],
     "user_agents": ["Console", "Mozilla"],
-    "usernames": ["unknown"]
+    "blocked_actions": [
+        "ec2:Describe*", "ec2:Get*", "ec2:List*",
+        "s3:Get*", "s3:List*", "s3:Head*",
+        "iam:List*", "iam:Get*",
+        "cloudwatch:Get*", "cloudwatch:List*",
+        "logs:Get*", "logs:Describe*", "logs:List*",
+        "cloudtrail:Get*", "cloudtrail:List*",
+        "config:List*", "config:Get*",
+        "sts:GetCallerIdentity"
+    ],
+    "rules": []
 }
 
+_EXACT = 0
+_PREFIX = 1
+
+class ActionMatcher:
+    # Character trie for "svc:Prefix*" globs and exact action keys, so a
+    # match costs O(len(action)) however many patterns are loaded. Globs with
+    # a wildcard anywhere but the end go into one combined regex.
+    def __init__(self):
+        self.root = {}
+        self._globs = []
+        self._regex = None
+
+    def add(self, pattern, name):
+        if "*" in pattern[:-1] or "?" in pattern or "[" in pattern:
+            self._globs.append((pattern, name))
+            self._regex = None
+            return
+        node = self.root
+        wildcard = pattern.endswith("*")
+        for ch in (pattern[:-1] if wildcard else pattern):
+            node = node.setdefault(ch, {})
+        node.setdefault(_PREFIX if wildcard else _EXACT, name)
+
+    def match(self, value):
+        node = self.root
+        if _PREFIX in node:
+            return node[_PREFIX]
+        for ch in value:
+            node = node.get(ch)
+            if node is None:
+                break
+            if _PREFIX in node:
+                return node[_PREFIX]
+        else:
+            if _EXACT in node:
+                return node[_EXACT]
+
+        if self._globs:
+            if self._regex is None:
+                self._regex = re.compile("|".join(
+                    f"(?P<g{i}>{fnmatch.translate(p)})" for i, (p, _) in enumerate(self._globs)
+                ))
+            m = self._regex.match(value)
+            if m:
+                return self._globs[int(m.lastgroup[1:])][1]
+        return None
+
+class SubstringMatcher:
+    # All substrings compiled into a single alternation; lastgroup tells
+    # which entry matched so hits can be attributed.
+    def __init__(self):
+        self._entries = []
+        self._regex = None
+
+    def add(self, substring, name):
+        self._entries.append((substring, name))
+        self._regex = None
+
+    def match(self, value):
+        if not self._entries or not isinstance(value, str):
+            return None
+        if self._regex is None:
+            self._regex = re.compile("|".join(
+                f"(?P<s{i}>{re.escape(s)})" for i, (s, _) in enumerate(self._entries)
+            ))
+        m = self._regex.search(value)
+        return self._entries[int(m.lastgroup[1:])][1] if m else None
+
+class CidrMatcher:
+    def __init__(self):
+        self.trie = CidrTrie()
+
+    def add(self, cidr, name):
+        self.trie.add(cidr, name)
+
+    def match(self, value):
+        found = self.trie.lookup(value)
+        return found[1] if found else None
+
+class FieldMatchers:
+    __slots__ = ("exact", "actions", "substrings", "cidrs")
+
+    def __init__(self):
+        self.exact = {}
+        self.actions = None
+        self.substrings = None
+        self.cidrs = None
+
+    def match(self, value):
+        name = self.exact.get(value)
+        if name:
+            return name
+        for matcher in (self.actions, self.substrings, self.cidrs):
+            if matcher is not None:
+                name = matcher.match(value)
+                if name:
+                    return name
+        return None
+
+class SuppressionEngine:
+    def __init__(self, settings):
+        settings = {**DEFAULT_SUPPRESSION, **(settings or {})}
+        self.hits = {}
+        self.actor_types = frozenset(settings.get("actor_types") or [])
+        self.usernames = frozenset(settings.get("usernames") or [])
+
+        self.user_agents = SubstringMatcher()
+        for s in settings.get("user_agents") or []:
+            self.user_agents.add(s, f"user_agent:{s}")
+
+        self.blocked_actions = ActionMatcher()
+        for p in settings.get("blocked_actions") or []:
+            self.blocked_actions.add(p, f"blocked_action:{p}")
+
+        # scope ("*" or a username) -> field -> FieldMatchers
+        self.scopes = {}
+        for i, rule in enumerate(settings.get("rules") or []):
+            self._add_rule(rule, i)
+        self.rule_fields = tuple(sorted({f for fields in self.scopes.values() for f in fields}))
+
+    def _field(self, scope, field):
+        return self.scopes.setdefault(scope, {}).setdefault(field, FieldMatchers())
+
+    def _add_rule(self, rule, index):
+        name = rule.get("name") or f"rule{index}"
+        users = rule.get("users") or [rule.get("user", "*")]
+        field = rule.get("field")
+        if not field:
+            raise ValueError(f"Suppression rule {name} has no field")
+        for user in users:
+            matchers = self._field(user, field)
+            for value in rule.get("values") or []:
+                matchers.exact.setdefault(value, name)
+            for pattern in rule.get("actions") or []:
+                matchers.actions = matchers.actions or ActionMatcher()
+                matchers.actions.add(pattern, name)
+            for substring in rule.get("substrings") or []:
+                matchers.substrings = matchers.substrings or SubstringMatcher()
+                matchers.substrings.add(substring, name)
+            for cidr in rule.get("cidrs") or []:
+                matchers.cidrs = matchers.cidrs or CidrMatcher()
+                matchers.cidrs.add(cidr, name)
+
+    def _hit(self, name):
+        self.hits[name] = self.hits.get(name, 0) + 1
+        return name
+
+    def match_field(self, username, field, value):
+        if value is None:
+            return None
+        for scope in (username, "*"):
+            fields = self.scopes.get(scope)
+            if fields:
+                matchers = fields.get(field)
+                if matchers:
+                    name = matchers.match(value)
+                    if name:
+                        return self._hit(name)
+        return None
+
+    def match_identity(self, username, user_agent):
+        if username in self.usernames:
+            return self._hit(f"username:{username}")
+        name = self.user_agents.match(user_agent)
+        if name:
+            return self._hit(name)
+        return self.match_field(username, "userAgent", user_agent)
+
+    def match_blocked_action(self, username, action_key):
+        name = self.blocked_actions.match(action_key)
+        if name:
+            return self._hit(name)
+        return self.match_field(username, "blocked_action", action_key)
+
+cfg = load_config()
+_settings = cfg.get("suppression") or {}
+if "actor_types" not in _settings:
+    # Older configs kept this list under the engine section.
+    legacy = (cfg.get("detection") or {}).get("suppressed_actor_types") or (cfg.get("baseline") or {}).get("suppressed_actor_types")
+    if legacy:
+        _settings = {**_settings, "actor_types": legacy}
+
+engine = SuppressionEngine(_settings)
+SUPPRESSED_ACTOR_TYPES = engine.actor_types
+
 def is_suppressed(username, user_agent):
-    if username in SUPPRESSION_CONFIG["usernames"]:
-        return True
-    if any(pattern in user_agent for pattern in SUPPRESSION_CONFIG["user_agents"]):
-        return True
-    return False
+    return engine.match_identity(username, user_agent) is not None
+
+def suppressed_field(username, field, value):
+    return engine.match_field(username, field, value)
+
+def is_blocked_action_suppressed(action_key, username=None):
+    return engine.match_blocked_action(username, action_key) is not None
+
+def suppression_fields():
+    return engine.rule_fields
 
+def suppression_stats():
+    return dict(engine.hits)
@@ -0,0 +1,93 @@
+from collections import OrderedDict
+
+from utils.config_loader import load_config
+from utils import metrics
+
+config = load_config()
+STATE_CFG = config.get("detection", {}).get("windowed_state", {}) or {}
+MAX_KEYS = STATE_CFG.get("max_principals", 100000)
+BUCKETS = STATE_CFG.get("buckets_per_window", 12)
+BURSTS_CFG = config.get("detection", {}).get("bursts", {}) or {}
+
+def burst_config(name, **defaults):
+    return {**defaults, **(BURSTS_CFG.get(name) or {})}
+
+class _Window:
+    # One key's ring: counts[i] holds events of time bucket marks[i].
+    __slots__ = ("counts", "marks", "latest", "quiet_until")
+
+    def __init__(self, buckets):
+        self.counts = [0] * buckets
+        self.marks = [-1] * buckets
+        self.latest = -1
+        self.quiet_until = -1
+
+class SlidingWindowCounter:
+    # Per-key event counts over the last window_seconds of event time (not
+    # arrival time, so replays and late files count where they happened).
+    # Each key holds a fixed ring of time buckets whatever its event rate;
+    # at most max_keys keys are kept and the least recently updated one is
+    # evicted first. Not thread-safe: rules run on one thread per process,
+    # and worker processes each see a fixed subset of principals.
+    def __init__(self, window_seconds, buckets=BUCKETS, max_keys=MAX_KEYS, name="window"):
+        self.buckets = max(1, buckets)
+        self.bucket_seconds = window_seconds / self.buckets
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self.name = name
+        self._windows = OrderedDict()
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._windows)
+
+    def _window(self, key):
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = _Window(self.buckets)
+            while len(self._windows) > self.max_keys:
+                self._windows.popitem(last=False)
+                self.evictions += 1
+                metrics.inc("window_evictions")
+        else:
+            self._windows.move_to_end(key)
+        return window
+
+    def _total(self, window):
+        oldest = window.latest - self.buckets
+        return sum(c for c, m in zip(window.counts, window.marks) if m > oldest)
+
+    def add(self, key, ts, n=1):
+        # Counts n events at epoch ts; returns the key's count over the
+        # window ending at its latest event.
+        bucket = int(ts // self.bucket_seconds)
+        window = self._window(key)
+        slot = bucket % self.buckets
+        if window.marks[slot] != bucket:
+            if window.marks[slot] > bucket or bucket <= window.latest - self.buckets:
+                # Older than the window already kept for this key.
+                return self._total(window)
+            window.marks[slot] = bucket
+            window.counts[slot] = 0
+        window.counts[slot] += n
+        if bucket > window.latest:
+            window.latest = bucket
+        return self._total(window)
+
+    def count(self, key):
+        window = self._windows.get(key)
+        return self._total(window) if window is not None else 0
+
+    def hit(self, key, ts, threshold):
+        # add(), then the window count if it reached threshold and the key
+        # has not fired within the last window; 0 otherwise. One burst
+        # fires once, not once per event above the threshold.
+        total = self.add(key, ts)
+        window = self._windows.get(key)
+        if total < threshold or window is None or window.latest < window.quiet_until:
+            return 0
+        window.quiet_until = window.latest + self.buckets
+        return total
+
+    def stats(self):
+        return {"name": self.name, "keys": len(self._windows), "evictions": self.evictions}
@@ -0,0 +1,107 @@
+import multiprocessing
+import queue
+import zlib
+
+def shard_for(username, workers):
+    # crc32 rather than hash(): str hashes are salted per process.
+    return zlib.crc32(username.encode("utf-8")) % workers
+
+def _worker_main(shard, inbox, outbox, handler, init):
+    if init:
+        init(shard)
+    while True:
+        msg = inbox.get()
+        if msg is None:
+            break
+        job_id, items = msg
+        try:
+            outbox.put((job_id, shard, True, handler(items)))
+        except Exception as e:
+            outbox.put((job_id, shard, False, str(e)))
+
+class ShardedWorkerPool:
+    def __init__(self, workers, handler, init=None, part_size=500, queue_depth=16):
+        ctx = multiprocessing.get_context("fork")
+        self.workers = workers
+        self.part_size = part_size
+        self.inboxes = [ctx.Queue(queue_depth) for _ in range(workers)]
+        self.outbox = ctx.Queue()
+        self.procs = [
+            ctx.Process(
+                target=_worker_main,
+                args=(shard, self.inboxes[shard], self.outbox, handler, init),
+                name=f"detection-worker-{shard}",
+                daemon=True
+            )
+            for shard in range(workers)
+        ]
+        for proc in self.procs:
+            proc.start()
+
+        self._next_job = 0
+        self._jobs = {}
+
+    def start_job(self):
+        self._next_job += 1
+        job_id = self._next_job
+        self._jobs[job_id] = {"buffers": [[] for _ in range(self.workers)], "parts": 0, "done": 0,
+                              "errors": [], "results": []}
+        return job_id
+
+    def submit(self, job_id, username, item):
+        job = self._jobs[job_id]
+        shard = shard_for(username, self.workers)
+        buf = job["buffers"][shard]
+        buf.append(item)
+        if len(buf) >= self.part_size:
+            self._send(job_id, shard)
+
+    def _send(self, job_id, shard):
+        job = self._jobs[job_id]
+        items = job["buffers"][shard]
+        if not items:
+            return
+        job["buffers"][shard] = []
+        job["parts"] += 1
+        while True:
+            try:
+                self.inboxes[shard].put((job_id, items), timeout=1)
+                return
+            except queue.Full:
+                # Back off by draining results while the worker catches up.
+                self._drain(timeout=0)
+
+    def finish_job(self, job_id):
+        for shard in range(self.workers):
+            self._send(job_id, shard)
+
+    def _drain(self, timeout=None):
+        try:
+            job_id, shard, ok, result = self.outbox.get(timeout=timeout) if timeout else self.outbox.get_nowait()
+        except queue.Empty:
+            return False
+        job = self._jobs.get(job_id)
+        if job is None:
+            return True
+        job["done"] += 1
+        if ok:
+            job["results"].append(result)
+        else:
+            job["errors"].append(f"shard {shard}: {result}")
+        return True
+
+    def wait(self, job_id, timeout=None):
+        job = self._jobs[job_id]
+        while job["done"] < job["parts"]:
+            if not self._drain(timeout=timeout or 60):
+                if not all(proc.is_alive() for proc in self.procs):
+                    job["errors"].append("worker process exited")
+                    break
+        del self._jobs[job_id]
+        return job["results"], job["errors"]
+
+    def close(self):
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for proc in self.procs:
+            proc.join(timeout=10)
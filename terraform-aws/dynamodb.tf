@@ -2,12 +2,23 @@ resource "aws_dynamodb_table" "baseline_table" {
   name         = var.baseline_table_name
   billing_mode = "PAY_PER_REQUEST"
   hash_key     = "username"
+  # Sharded layout (baseline_store.layout: sharded) keys items by shard too.
+  # Changing this replaces the table.
+  range_key = var.baseline_table_sharded ? "shard" : null
 
   attribute {
     name = "username"
     type = "S"
   }
 
+  dynamic "attribute" {
+    for_each = var.baseline_table_sharded ? ["shard"] : []
+    content {
+      name = attribute.value
+      type = "S"
+    }
+  }
+
   server_side_encryption {
     enabled = true
   }
@@ -18,3 +29,28 @@ resource "aws_dynamodb_table" "baseline_table" {
   }
 }
 
+
+resource "aws_dynamodb_table" "processed_table" {
+  name         = var.processed_table_name
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "object_id"
+
+  attribute {
+    name = "object_id"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  server_side_encryption {
+    enabled = true
+  }
+
+  tags = {
+    Environment = "prod"
+    App         = "iam-anomaly-engine"
+  }
+}
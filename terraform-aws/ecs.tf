@@ -27,7 +27,7 @@ resource "aws_cloudwatch_log_group" "detection" {
 # Baseline Engine Task Definition
 # -----------------------------------
 resource "aws_ecs_task_definition" "baseline_engine" {
-  count                    = var.deploy_baseline ? 1 : 0
+  count                    = var.deploy_baseline && !var.combined_engine ? 1 : 0
   family                   = "baseline-engine"
   requires_compatibilities = ["FARGATE"]
   network_mode             = "awsvpc"
@@ -43,7 +43,8 @@ resource "aws_ecs_task_definition" "baseline_engine" {
       essential = true
       environment = [
         { name = "QUEUE_URL", value = aws_sqs_queue.baseline.id },
-        { name = "BASELINE_TABLE", value = aws_dynamodb_table.baseline_table.name }
+        { name = "BASELINE_TABLE", value = aws_dynamodb_table.baseline_table.name },
+        { name = "PROCESSED_TABLE", value = aws_dynamodb_table.processed_table.name }
       ]
       logConfiguration = {
         logDriver = "awslogs",
@@ -60,7 +61,7 @@ resource "aws_ecs_task_definition" "baseline_engine" {
 }
 
 resource "aws_ecs_service" "baseline" {
-  count           = var.deploy_baseline ? 1 : 0
+  count           = var.deploy_baseline && !var.combined_engine ? 1 : 0
   name            = var.baseline_service_name
   cluster         = aws_ecs_cluster.main.id
   task_definition = aws_ecs_task_definition.baseline_engine[0].arn
@@ -97,6 +98,7 @@ resource "aws_ecs_task_definition" "detection_engine" {
       environment = [
         { name = "QUEUE_URL", value = aws_sqs_queue.detection.id },
         { name = "BASELINE_TABLE", value = aws_dynamodb_table.baseline_table.name },
+        { name = "PROCESSED_TABLE", value = aws_dynamodb_table.processed_table.name },
         { name = "ALERT_BUCKET", value = var.alert_bucket_name }
       ]
       logConfiguration = {
@@ -94,6 +94,7 @@ resource "aws_iam_role_policy" "baseline_task_policy" {
         Action = [
           "sqs:ReceiveMessage",
           "sqs:DeleteMessage",
+          "sqs:ChangeMessageVisibility",
           "sqs:GetQueueAttributes"
         ],
         Resource = "arn:aws:sqs:${var.aws_region}:${var.account_id}:${var.baseline_queue_name}"
@@ -103,10 +104,22 @@ resource "aws_iam_role_policy" "baseline_task_policy" {
         Action = [
           "dynamodb:GetItem",
           "dynamodb:PutItem",
-          "dynamodb:UpdateItem"
+          "dynamodb:UpdateItem",
+          "dynamodb:Query",
+          "dynamodb:Scan",
+          "dynamodb:DeleteItem"
         ],
         Resource = "arn:aws:dynamodb:${var.aws_region}:${var.account_id}:table/${var.baseline_table_name}"
       },
+      {
+        Effect = "Allow",
+        Action = [
+          "dynamodb:GetItem",
+          "dynamodb:PutItem",
+          "dynamodb:DeleteItem"
+        ],
+        Resource = "arn:aws:dynamodb:${var.aws_region}:${var.account_id}:table/${var.processed_table_name}"
+      },
       {
         Effect   = "Allow",
         Action   = ["s3:GetObject"],
@@ -150,17 +163,33 @@ resource "aws_iam_role_policy" "detection_task_policy" {
         Action = [
           "sqs:ReceiveMessage",
           "sqs:DeleteMessage",
+          "sqs:ChangeMessageVisibility",
           "sqs:GetQueueAttributes"
         ],
         Resource = "arn:aws:sqs:${var.aws_region}:${var.account_id}:${var.detection_queue_name}"
       },
+      {
+        Effect = "Allow",
+        # Combined mode also applies baseline deltas.
+        Action = concat(
+          [
+            "dynamodb:GetItem",
+            "dynamodb:BatchGetItem",
+            "dynamodb:Query",
+            "dynamodb:Scan"
+          ],
+          var.combined_engine ? ["dynamodb:PutItem", "dynamodb:UpdateItem"] : []
+        ),
+        Resource = "arn:aws:dynamodb:${var.aws_region}:${var.account_id}:table/${var.baseline_table_name}"
+      },
       {
         Effect = "Allow",
         Action = [
           "dynamodb:GetItem",
-          "dynamodb:Scan"
+          "dynamodb:PutItem",
+          "dynamodb:DeleteItem"
         ],
-        Resource = "arn:aws:dynamodb:${var.aws_region}:${var.account_id}:table/${var.baseline_table_name}"
+        Resource = "arn:aws:dynamodb:${var.aws_region}:${var.account_id}:table/${var.processed_table_name}"
       },
       {
         Effect   = "Allow",
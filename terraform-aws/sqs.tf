@@ -15,6 +15,7 @@ resource "aws_sns_topic_subscription" "detection_sub" {
 }
 
 resource "aws_sns_topic_subscription" "baseline_sub" {
+  count     = var.combined_engine ? 0 : 1
   topic_arn = aws_sns_topic.cloudtrail_events.arn
   protocol  = "sqs"
   endpoint  = aws_sqs_queue.baseline.arn
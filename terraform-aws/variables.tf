@@ -25,6 +25,12 @@ variable "deploy_detection" {
   default     = true
 }
 
+variable "combined_engine" {
+  description = "Run the detection engine in combined mode (combined.enabled in its config): it also writes the baseline, and the baseline engine and its queue subscription are not deployed"
+  type        = bool
+  default     = false
+}
+
 variable "alert_bucket_name" {
   description = "Name of the S3 bucket to write alerts to (must be globally unique)"
   type        = string
@@ -77,3 +83,15 @@ variable "baseline_table_name" {
   default     = "BaselineData"
 }
 
+
+variable "baseline_table_sharded" {
+  description = "Give the baseline table a \"shard\" sort key for baseline_store.layout: sharded (replaces the table)"
+  type        = bool
+  default     = false
+}
+
+variable "processed_table_name" {
+  description = "Name of the DynamoDB table recording processed S3 objects"
+  type        = string
+  default     = "ProcessedS3Logs"
+}